@@ -40,6 +40,21 @@ const upload = multer({
   }
 });
 
+// Chat images are forwarded to the MCP server as multipart, without base64 re-encoding
+const imageUpload = multer({
+  storage: multer.memoryStorage(),
+  limits: {
+    fileSize: 10 * 1024 * 1024, // 10MB limit
+  },
+  fileFilter: (req, file, cb) => {
+    if (file.mimetype.startsWith('image/')) {
+      cb(null, true);
+    } else {
+      cb(new Error(`Unsupported file type: ${file.mimetype}. Only images are supported`), false);
+    }
+  }
+});
+
 router.post('/sessionLogin', async (req, res) => {
   const { idToken } = req.body;
 
@@ -99,19 +114,16 @@ router.get('/me', verifySession, async (req, res) => {
     res.json(userDoc.data());
 });
 
-router.post('/chat', verifySession, async (req, res) => {
-  const { message, metadata, image_base64, image_mime_type } = req.body;
-  const firebaseUid = req.user.uid;
-  
-  // Get user information from Firebase token
-  console.log('Firebase token user data:', JSON.stringify(req.user, null, 2));
-  let userName = req.user.displayName || req.user.name || null;
-  let userEmail = req.user.email || null;
+// Name and email from the Firebase token, falling back to the Firestore profile
+const getUserIdentity = async (user) => {
+  console.log('Firebase token user data:', JSON.stringify(user, null, 2));
+  let userName = user.displayName || user.name || null;
+  let userEmail = user.email || null;
   
   // If name/email not in token, try to get from Firestore
   if (!userName || !userEmail) {
     try {
-      const userRef = admin.firestore().collection('users').doc(firebaseUid);
+      const userRef = admin.firestore().collection('users').doc(user.uid);
       const userDoc = await userRef.get();
       
       if (userDoc.exists) {
@@ -126,6 +138,13 @@ router.post('/chat', verifySession, async (req, res) => {
   }
   
   console.log('Final extracted - Name:', userName, 'Email:', userEmail);
+  return { userName, userEmail };
+};
+
+router.post('/chat', verifySession, async (req, res) => {
+  const { message, metadata, image_base64, image_mime_type } = req.body;
+  const firebaseUid = req.user.uid;
+  const { userName, userEmail } = await getUserIdentity(req.user);
   console.log('Has image:', !!image_base64);
 
   try {
@@ -146,11 +165,69 @@ router.post('/chat', verifySession, async (req, res) => {
   }
 });
 
+router.post('/chat-image', verifySession, (req, res) => {
+  imageUpload.single('image')(req, res, async (uploadError) => {
+    if (uploadError) {
+      const tooLarge = uploadError.code === 'LIMIT_FILE_SIZE';
+      return res.status(tooLarge ? 413 : 400).json({
+        error: {
+          code: tooLarge ? 'FILE_TOO_LARGE' : 'UNSUPPORTED_FILE_TYPE',
+          message: tooLarge ? 'Image must be smaller than 10MB' : uploadError.message
+        }
+      });
+    }
+    if (!req.file) {
+      return res.status(400).json({ error: { code: 'BAD_REQUEST', message: 'No image uploaded' } });
+    }
+
+    const firebaseUid = req.user.uid;
+    const { userName, userEmail } = await getUserIdentity(req.user);
+
+    try {
+      const FormData = require('form-data');
+      const formData = new FormData();
+      formData.append('user_id', firebaseUid);
+      formData.append('message', req.body.message || '');
+      if (userName) formData.append('user_name', userName);
+      if (userEmail) formData.append('user_email', userEmail);
+      formData.append('image', req.file.buffer, {
+        filename: req.file.originalname,
+        contentType: req.file.mimetype
+      });
+
+      const mcpResponse = await axios.post(process.env.MCP_SERVER_URL + '/mcp/query-image', formData, {
+        headers: {
+          ...formData.getHeaders(),
+        },
+        maxContentLength: Infinity,
+        maxBodyLength: Infinity
+      });
+      res.json(mcpResponse.data);
+    } catch (error) {
+      console.error('Error forwarding image chat to MCP server:', error);
+      // The MCP server rejects unreadable or oversized images with 400/413
+      const status = error.response && error.response.status;
+      if (status === 400 || status === 413) {
+        return res.status(status).json({
+          error: { code: 'INVALID_IMAGE', message: (error.response.data && error.response.data.detail) || 'Invalid image' }
+        });
+      }
+      res.status(500).json({ error: { code: 'MCP_SERVER_ERROR', message: 'Error forwarding chat to MCP server' } });
+    }
+  });
+});
+
 router.get('/history', verifySession, async (req, res) => {
   const firebaseUid = req.user.uid;
 
   try {
-    const mcpResponse = await axios.get(process.env.MCP_SERVER_URL + '/mcp/history?user_id=' + firebaseUid);
+    const { limit, before } = req.query;
+    const mcpResponse = await axios.get(process.env.MCP_SERVER_URL + '/mcp/history', {
+      params: { user_id: firebaseUid, limit, before }
+    });
+    if (mcpResponse.headers['x-next-before']) {
+      res.set('X-Next-Before', mcpResponse.headers['x-next-before']);
+    }
     res.json(mcpResponse.data);
   } catch (error) {
     console.error('Error fetching chat history from MCP server:', error);
@@ -302,7 +379,8 @@ router.get('/admin/files', async (req, res) => {
     const mcpResponse = await axios.get(process.env.MCP_SERVER_URL + '/admin/files', {
       headers: {
         'Authorization': authorization
-      }
+      },
+      params: req.query
     });
     res.json(mcpResponse.data);
   } catch (error) {
@@ -319,7 +397,8 @@ router.get('/admin/files/:fileId', async (req, res) => {
     const mcpResponse = await axios.get(process.env.MCP_SERVER_URL + `/admin/files/${fileId}`, {
       headers: {
         'Authorization': authorization
-      }
+      },
+      params: req.query
     });
     res.json(mcpResponse.data);
   } catch (error) {
@@ -328,6 +407,24 @@ router.get('/admin/files/:fileId', async (req, res) => {
   }
 });
 
+router.get('/admin/files/:fileId/chunks/:chunkIndex', async (req, res) => {
+  const { fileId, chunkIndex } = req.params;
+  const { authorization } = req.headers;
+
+  try {
+    const mcpResponse = await axios.get(process.env.MCP_SERVER_URL + `/admin/files/${fileId}/chunks/${chunkIndex}`, {
+      headers: {
+        'Authorization': authorization
+      },
+      params: req.query
+    });
+    res.json(mcpResponse.data);
+  } catch (error) {
+    console.error('Error fetching admin file chunk:', error);
+    res.status(500).json({ error: { code: 'ADMIN_CHUNK_ERROR', message: 'Error fetching admin file chunk' } });
+  }
+});
+
 router.delete('/admin/files/:fileId', async (req, res) => {
   const { fileId } = req.params;
   const { authorization } = req.headers;
@@ -26,32 +26,24 @@ export const getMe = () => {
   return api.get('/api/me');
 };
 
-export const getHistory = () => {
-  return api.get('/api/history');
+// Latest page of the conversation; pass the X-Next-Before header value as `before` for older messages
+export const getHistory = (limit = 50, before?: string) => {
+  return api.get('/api/history', { params: { limit, before } });
 };
 
 export const sendMessage = (message: string, metadata?: Record<string, unknown>) => {
   return api.post('/api/chat', { message, metadata });
 };
 
-export const sendMessageWithImage = async (message: string, imageFile: File) => {
-  // Convert image to base64
-  const base64Image = await new Promise<string>((resolve, reject) => {
-    const reader = new FileReader();
-    reader.onloadend = () => {
-      const result = reader.result as string;
-      // Remove data URL prefix (e.g., "data:image/jpeg;base64,")
-      const base64 = result.split(',')[1];
-      resolve(base64);
-    };
-    reader.onerror = reject;
-    reader.readAsDataURL(imageFile);
-  });
-
-  return api.post('/api/chat', {
-    message,
-    image_base64: base64Image,
-    image_mime_type: imageFile.type
+// Sent as multipart form data: no base64 encoding in the browser and no 33% size overhead
+export const sendMessageWithImage = (message: string, imageFile: File) => {
+  const formData = new FormData();
+  formData.append('message', message);
+  formData.append('image', imageFile);
+  return api.post('/api/chat-image', formData, {
+    headers: {
+      'Content-Type': 'multipart/form-data',
+    },
   });
 };
 
@@ -1,16 +1,185 @@
 import os
 import re
-import base64
 import google.generativeai as genai
-from PIL import Image
-import io
+
+import time
+import asyncio
+import logging
+from datetime import timedelta
+
+from llm_client import generate_content, LLMUnavailableError
+from output_sanitizer import sanitize
+from image_pipeline import decode_base64_image, prepare_image
+from prompt_builder import VISION_SYSTEM_PROMPT, build_chat_prompt
+from ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
 
 genai.configure(api_key=os.environ["GEMINI_API_KEY"])
 
-model = genai.GenerativeModel('gemini-2.5-pro')
+FAST_MODEL_NAME = os.getenv("GEMINI_FAST_MODEL", "gemini-2.5-flash")
+PRO_MODEL_NAME = os.getenv("GEMINI_PRO_MODEL", "gemini-2.5-pro")
+# "fast" or "pro" forces a tier for every text turn; empty lets the router decide
+MODEL_TIER_OVERRIDE = os.getenv("GEMINI_MODEL_TIER", "").lower()
+FAST_MAX_PROMPT_TOKENS = int(os.getenv("GEMINI_FAST_MAX_PROMPT_TOKENS", "8000"))
+
+# Explicit context caching of the static prompt prefix (needs an SDK with genai.caching)
+CONTEXT_CACHE_ENABLED = os.getenv("GEMINI_CONTEXT_CACHE", "false").lower() == "true"
+CONTEXT_CACHE_MIN_TOKENS = int(os.getenv("GEMINI_CONTEXT_CACHE_MIN_TOKENS", "4096"))
+CONTEXT_CACHE_TTL_SECONDS = 3600
+
+fast_model = genai.GenerativeModel(FAST_MODEL_NAME)
+pro_model = genai.GenerativeModel(PRO_MODEL_NAME)
 vision_model = genai.GenerativeModel('gemini-2.0-flash-exp')  # Vision-capable model
 
-def expand_query(query: str, conversation_context: list[dict] = None) -> list[str]:
+COMPLEX_QUERY_PATTERN = re.compile(
+    r"\b(explain|why|how (does|do|did|would|could|can)|compare|comparison|difference|differ|analy[sz]e|"
+    r"summari[sz]e|step[- ]by[- ]step|pros and cons|trade-?offs?|evaluate|design|write|draft|code|plan|"
+    r"calculate|derive|prove|recommend)\b",
+    re.IGNORECASE
+)
+
+# (model name, prefix hash) -> cached-content model, or False when the API refused the prefix
+_prefix_models = TTLCache(maxsize=32, ttl=CONTEXT_CACHE_TTL_SECONDS - 300, name="gemini_prefix_caches")
+
+# Per-tier call statistics
+_route_stats = {
+    tier: {"calls": 0, "latency_ms_total": 0.0, "prompt_tokens": 0, "output_tokens": 0, "cached_tokens": 0}
+    for tier in ("fast", "pro")
+}
+
+
+def _relevance(passage: dict):
+    """Search or re-rank score of a passage; query fusion keeps it in first_stage_score"""
+    if 'first_stage_score' in passage:
+        return passage['first_stage_score']  # similarity_score holds a rank-based fused score
+    return passage.get('similarity_score')
+
+
+def _retrieval_margin(file_context: list[dict] = None) -> float:
+    """How clearly the best retrieved passage beats the runner-up (1.0 = no ambiguity)"""
+    scores = sorted(
+        (score for score in map(_relevance, file_context or []) if score is not None),
+        reverse=True
+    )
+    if len(scores) < 2 or scores[0] <= 0:
+        return 1.0
+    return max(0.0, 1.0 - scores[1] / scores[0])
+
+
+def choose_model_tier(prompt: str, prompt_tokens: int, file_context: list[dict] = None) -> tuple:
+    """
+    Pick the fast or pro model for a text turn
+
+    Args:
+        prompt: The user's message
+        prompt_tokens: Estimated tokens of the full assembled prompt
+        file_context: Retrieved passages (with similarity scores)
+
+    Returns:
+        (tier, reason)
+    """
+    if MODEL_TIER_OVERRIDE in ("fast", "pro"):
+        return MODEL_TIER_OVERRIDE, "override"
+    if prompt_tokens > FAST_MAX_PROMPT_TOKENS:
+        return "pro", "large_prompt"
+
+    complexity = 0
+    if len(prompt.split()) > 40:
+        complexity += 1
+    # Distinct reasoning cues ("explain ... and compare ...") count up to twice
+    cues = {m.group(1).lower() for m in COMPLEX_QUERY_PATTERN.finditer(prompt)}
+    complexity += min(len(cues), 2)
+    if prompt.count('?') > 1:
+        complexity += 1
+    if len(file_context or []) >= 4 and _retrieval_margin(file_context) < 0.1:
+        complexity += 1  # Many similarly relevant passages: the answer needs synthesis
+
+    if complexity >= 2:
+        return "pro", f"complexity={complexity}"
+    return "fast", f"complexity={complexity}"
+
+
+async def _prefix_cached_model(model_name: str, prompt_parts: dict):
+    """
+    Model bound to an explicit Gemini context cache holding the static prompt prefix
+
+    Only used when GEMINI_CONTEXT_CACHE is enabled, the installed SDK supports
+    context caching and the prefix is large enough to qualify. Otherwise the
+    stable prefix ordering still lets Gemini's implicit caching apply.
+    """
+    if not CONTEXT_CACHE_ENABLED or not hasattr(genai, 'caching'):
+        return None
+    if prompt_parts["tokens"]["prefix"] < CONTEXT_CACHE_MIN_TOKENS:
+        return None
+
+    key = (model_name, prompt_parts["prefix_hash"])
+    cached_model = _prefix_models.get(key)
+    if cached_model is not None:
+        return cached_model or None  # False marks a prefix the API refused
+
+    try:
+        cached_content = await asyncio.to_thread(
+            genai.caching.CachedContent.create,
+            model=f"models/{model_name}",
+            contents=[prompt_parts["prefix"]],
+            ttl=timedelta(seconds=CONTEXT_CACHE_TTL_SECONDS)
+        )
+        cached_model = genai.GenerativeModel.from_cached_content(cached_content=cached_content)
+        logger.info(f"Created Gemini context cache for prompt prefix {prompt_parts['prefix_hash'][:8]} ({model_name})")
+    except Exception as e:
+        logger.warning(f"Gemini context caching unavailable for {model_name}: {e}")
+        cached_model = False
+    _prefix_models.set(key, cached_model)
+    return cached_model or None
+
+
+async def _generate_with_tier(tier: str, reason: str, prompt_parts: dict):
+    """Generate with the model for a tier and record latency and token usage"""
+    model_name = PRO_MODEL_NAME if tier == "pro" else FAST_MODEL_NAME
+    model = pro_model if tier == "pro" else fast_model
+    contents = prompt_parts["text"]
+
+    cached_model = await _prefix_cached_model(model_name, prompt_parts)
+    if cached_model is not None:
+        model, contents = cached_model, prompt_parts["dynamic"]
+
+    started = time.perf_counter()
+    response = await generate_content(model, contents)
+    latency_ms = (time.perf_counter() - started) * 1000
+
+    usage = getattr(response, 'usage_metadata', None)
+    prompt_tokens = getattr(usage, 'prompt_token_count', 0) or 0
+    output_tokens = getattr(usage, 'candidates_token_count', 0) or 0
+    cached_tokens = getattr(usage, 'cached_content_token_count', 0) or 0
+
+    stats = _route_stats[tier]
+    stats["calls"] += 1
+    stats["latency_ms_total"] += latency_ms
+    stats["prompt_tokens"] += prompt_tokens
+    stats["output_tokens"] += output_tokens
+    stats["cached_tokens"] += cached_tokens
+
+    logger.info(
+        "LLM route=%s (%s) latency_ms=%.0f prompt_tokens=%d cached_tokens=%d output_tokens=%d",
+        tier, reason, latency_ms, prompt_tokens, cached_tokens, output_tokens,
+        extra={"estimated_sections": prompt_parts['tokens']}
+    )
+    return response
+
+
+def get_route_stats() -> dict:
+    """Per-tier call counts, average latency and token totals"""
+    return {
+        tier: {
+            **stats,
+            "avg_latency_ms": round(stats["latency_ms_total"] / stats["calls"], 1) if stats["calls"] else 0.0,
+            "model": PRO_MODEL_NAME if tier == "pro" else FAST_MODEL_NAME
+        }
+        for tier, stats in _route_stats.items()
+    }
+
+async def expand_query(query: str, conversation_context: list[dict] = None) -> list[str]:
     """
     Expand user query with synonyms and alternative phrasings for better retrieval
     
@@ -39,7 +208,7 @@ User Query: {query}
 
 Generate 2 alternative queries (one per line, no numbering):"""
         
-        response = model.generate_content(expansion_prompt)
+        response = await generate_content(fast_model, expansion_prompt, timeout=10)
         expanded = response.text.strip().split('\n')
         
         # Clean and filter expansions
@@ -54,85 +223,28 @@ Generate 2 alternative queries (one per line, no numbering):"""
         return expansions[:3]  # Max 3 total (original + 2 expansions)
         
     except Exception as e:
-        print(f"Query expansion failed: {e}")
+        logger.warning("Query expansion failed: %s", e)
         return [query]  # Fallback to original query
 
-def generate_from_prompt(prompt: str, context: list[dict], user_name: str = None, file_context: list[dict] = None):
+async def generate_from_prompt(prompt: str, context: list[dict], user_name: str = None, file_context: list[dict] = None, ui_context: str = None):
     """
     Generates a response from the Gemini model with optional file context.
+    Site UI context goes into the static, cacheable prompt prefix.
     """
-    # System prompt to define AI behavior (silent RAG)
-    system_prompt = """You are a helpful AI assistant. Be polite, professional, and helpful.
-Only use any provided context internally to craft the most accurate and natural answer.
-Do not mention, imply, or speculate about where information came from (e.g., documents, files, databases, storage, Supabase, or pages).
-Do not say things like "based on the document", "from the database", or cite filenames/pages.
-If the answer is unknown, say so briefly and suggest what would be needed.
-Keep responses concise and natural.
-"""
-    
-    # Build user context
-    user_context = ""
-    if user_name:
-        user_context = f"The user's name is {user_name}. "
-    
-    # Build conversation context string
-    context_str = ""
-    if context:
-        for message in context:
-            role = "Assistant" if message['role'] == 'assistant' else "User"
-            context_str += f"{role}: {message['content']}\n"
-    
-    # Build file context string (internal only, no citations)
-    file_context_str = ""
-    if file_context:
-        file_context_str = "\n\nContext for internal use only (do not mention its existence in the answer):\n"
-        for chunk in file_context:
-            content = chunk.get('content', '')
-            # Do not include filename/page or similarity hints to avoid leakage
-            file_context_str += f"---\n{content}\n"
-    
-    # Combine all context with system prompt
-    if context_str and file_context_str:
-        full_prompt = f"{system_prompt}\n\n{user_context}Previous conversation:\n{context_str}{file_context_str}\nCurrent message: {prompt}"
-    elif context_str:
-        full_prompt = f"{system_prompt}\n\n{user_context}Previous conversation:\n{context_str}\nCurrent message: {prompt}"
-    elif file_context_str:
-        full_prompt = f"{system_prompt}\n\n{user_context}{file_context_str}\nCurrent message: {prompt}"
-    else:
-        full_prompt = f"{system_prompt}\n\n{user_context}Current message: {prompt}"
-
-    # Generate
-    response = model.generate_content(full_prompt)
+    prompt_parts = build_chat_prompt(prompt, context, user_name, file_context, ui_context)
+
+    # Generate with the model tier the prompt needs
+    tier, reason = choose_model_tier(prompt, prompt_parts["tokens"]["total"], file_context)
+    response = await _generate_with_tier(tier, reason, prompt_parts)
     text = (response.text or "").strip()
 
     # Last-resort sanitization to remove meta-source phrases and salutations
-    banned_keyword_fragments = [
-        "based on the document", "from the document", "from the database",
-        "according to the document", "uploaded file", "the document titled",
-        "from supabase", "from your files", "as per the document",
-        "according to the timetable", "based on the timetable", "from the timetable",
-        "according to your upload", "you uploaded"
-    ]
-
-    # Remove lines/sentences that contain banned phrases (case-insensitive)
-    sentences = re.split(r"(?<=[.!?])\s+", text)
-    cleaned_sentences = []
-    for s in sentences:
-        sl = s.lower()
-        if not any(k in sl for k in banned_keyword_fragments):
-            cleaned_sentences.append(s)
-    text = " ".join(cleaned_sentences).strip() or text
-
-    # Remove greeting lines like "Hello, <name>" or "Hello Naruto Uzumaki"
-    text = re.sub(r"^\s*hello[\s,]+[\w .'-]+[:,-]?\s*", "", text, flags=re.IGNORECASE)
-
-    # Collapse excessive whitespace
-    text = re.sub(r"\n{3,}", "\n\n", text).strip()
+    text = sanitize(text)
 
     return text
 
 
-def generate_with_image(prompt: str, context: list[dict], user_name: str = None, image_base64: str = None, image_mime_type: str = None):
+async def generate_with_image(prompt: str, context: list[dict], user_name: str = None, image_base64: str = None, image_mime_type: str = None, image_bytes: bytes = None):
     """
     Generates a response from the Gemini vision model with an image.
     
@@ -142,44 +254,33 @@ def generate_with_image(prompt: str, context: list[dict], user_name: str = None,
         user_name: User's name
         image_base64: Base64 encoded image data
         image_mime_type: MIME type of the image (e.g., "image/jpeg")
+        image_bytes: Raw image data (multipart uploads); used instead of image_base64
     
     Returns:
         AI response based on the image and question
+
+    Raises:
+        ImageRejectedError: The upload is not an acceptable image
     """
-    # System prompt for vision tasks
-    system_prompt = """You are a helpful AI assistant with vision capabilities. 
-Analyze the provided image carefully and answer the user's question accurately.
-Be descriptive and specific about what you see in the image.
-If you cannot determine something from the image, say so clearly.
-Keep responses natural and conversational."""
-    
-    # Build user context
-    user_context = ""
-    if user_name:
-        user_context = f"The user's name is {user_name}. "
-    
-    # Build conversation context string
-    context_str = ""
-    if context:
-        for message in context[-5:]:  # Last 5 messages for context
-            role = "Assistant" if message['role'] == 'assistant' else "User"
-            context_str += f"{role}: {message['content']}\n"
-    
-    # Combine context
-    if context_str:
-        full_prompt = f"{system_prompt}\n\n{user_context}Previous conversation:\n{context_str}\nCurrent question about the image: {prompt}"
-    else:
-        full_prompt = f"{system_prompt}\n\n{user_context}Question about the image: {prompt}"
+    # Same layout as text turns, with the vision instructions and the last 5 messages
+    history = (context or [])[-5:]
+    full_prompt = build_chat_prompt(
+        prompt,
+        history,
+        user_name,
+        system_prompt=VISION_SYSTEM_PROMPT,
+        message_label="Current question about the image" if history else "Question about the image"
+    )["text"]
     
+    # Header-checked, downscaled, EXIF-free re-encode (cached by content hash)
+    if image_bytes is None:
+        image_bytes = decode_base64_image(image_base64)
+    prepared = await asyncio.to_thread(prepare_image, image_bytes, image_mime_type)
+
     try:
-        # Decode base64 image
-        image_data = base64.b64decode(image_base64)
-        
-        # Create PIL Image
-        image = Image.open(io.BytesIO(image_data))
-        
-        # Generate response with image
-        response = vision_model.generate_content([full_prompt, image])
+        # Send the re-encoded bytes as-is instead of a PIL image the SDK would encode again
+        image_part = {"mime_type": prepared["mime_type"], "data": prepared["data"]}
+        response = await generate_content(vision_model, [full_prompt, image_part])
         text = (response.text or "").strip()
         
         # Clean up response
@@ -187,6 +288,8 @@ Keep responses natural and conversational."""
         
         return text
         
+    except LLMUnavailableError:
+        raise
     except Exception as e:
-        print(f"Error processing image: {e}")
+        logger.error("Error processing image: %s", e)
         return f"I apologize, but I encountered an error processing the image. Please try again with a different image or format. Error: {str(e)}"
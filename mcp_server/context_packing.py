@@ -0,0 +1,139 @@
+"""
+Retrieval context packing
+Sits between retrieval and prompt assembly: drops near-duplicate chunks,
+merges adjacent chunks of the same file and fits the best of them into a
+token budget so prompts stay short
+"""
+
+import os
+import logging
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "6000"))
+DEDUP_SIMILARITY = float(os.getenv("CONTEXT_DEDUP_SIMILARITY", "0.92"))  # Cosine above which chunks are duplicates
+MAX_OVERLAP_CHARS = 400  # Longest overlap trimmed when joining adjacent chunks
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate token count (~4 characters per token for English text)"""
+    return (len(text or "") + 3) // 4
+
+
+def _score(chunk: Dict[str, Any]) -> float:
+    return chunk.get('similarity_score') or 0.0
+
+
+def _dedupe(chunks: List[Dict[str, Any]], threshold: float) -> List[Dict[str, Any]]:
+    """Keep the best-scoring chunk of every group of near-identical chunks"""
+    kept: List[Dict[str, Any]] = []
+    kept_vectors: List[np.ndarray] = []
+    seen_texts = set()
+
+    for chunk in sorted(chunks, key=_score, reverse=True):
+        text = (chunk.get('content') or '').strip()
+        if not text or text in seen_texts:
+            continue
+
+        embedding = chunk.get('embedding')
+        if embedding:
+            vec = np.asarray(embedding, dtype=np.float32)
+            norm = np.linalg.norm(vec)
+            vec = vec / norm if norm else vec
+            if kept_vectors and float(np.max(np.stack(kept_vectors) @ vec)) >= threshold:
+                continue
+            kept_vectors.append(vec)
+
+        seen_texts.add(text)
+        kept.append(chunk)
+
+    return kept
+
+
+def _join_overlapping(first: str, second: str) -> str:
+    """
+    Concatenate two consecutive chunks, trimming text repeated across the boundary
+    Chunks are cut back to back (often mid-word), so without an overlap they are
+    joined as is.
+    """
+    max_overlap = min(len(first), len(second), MAX_OVERLAP_CHARS)
+    for size in range(max_overlap, 20, -1):
+        if first.endswith(second[:size]):
+            return first + second[size:]
+    return first + second
+
+
+def _merge_adjacent(chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Merge runs of consecutive chunk_index hits from the same file into one passage"""
+    by_file: Dict[Any, List[Dict[str, Any]]] = {}
+    passages: List[Dict[str, Any]] = []
+
+    for chunk in chunks:
+        if chunk.get('file_id') is None or chunk.get('chunk_index') is None:
+            passages.append(chunk)
+        else:
+            by_file.setdefault(chunk['file_id'], []).append(chunk)
+
+    for file_chunks in by_file.values():
+        file_chunks.sort(key=lambda c: c['chunk_index'])
+        current = dict(file_chunks[0])
+        for chunk in file_chunks[1:]:
+            if chunk['chunk_index'] == current['chunk_index'] + 1:
+                current['content'] = _join_overlapping(current.get('content') or '', chunk.get('content') or '')
+                current['chunk_index'] = chunk['chunk_index']
+                current['similarity_score'] = max(_score(current), _score(chunk))
+            else:
+                passages.append(current)
+                current = dict(chunk)
+        passages.append(current)
+
+    return passages
+
+
+def pack_context(
+    chunks: List[Dict[str, Any]],
+    token_budget: Optional[int] = None,
+    dedup_similarity: float = DEDUP_SIMILARITY
+) -> List[Dict[str, Any]]:
+    """
+    Turn raw retrieval hits into a compact, budgeted context
+
+    Args:
+        chunks: Retrieved chunks (optionally carrying 'embedding' for near-duplicate detection)
+        token_budget: Max estimated tokens of packed content (defaults to CONTEXT_TOKEN_BUDGET)
+        dedup_similarity: Cosine similarity at or above which chunks count as duplicates
+
+    Returns:
+        Passages ordered best first, without embeddings
+    """
+    if not chunks:
+        return []
+
+    budget = token_budget or CONTEXT_TOKEN_BUDGET
+    passages = _merge_adjacent(_dedupe(chunks, dedup_similarity))
+    passages.sort(key=_score, reverse=True)
+
+    packed: List[Dict[str, Any]] = []
+    used = 0
+    for passage in passages:
+        tokens = estimate_tokens(passage.get('content', ''))
+        if used + tokens > budget:
+            # Still allow smaller passages further down to fill the remaining space
+            continue
+        passage.pop('embedding', None)
+        packed.append(passage)
+        used += tokens
+
+    if not packed and passages:
+        # Best passage alone exceeds the budget: truncate it rather than send nothing
+        best = passages[0]
+        best.pop('embedding', None)
+        best['content'] = best.get('content', '')[:budget * 4]
+        packed.append(best)
+        used = budget
+
+    logger.debug("Packed %d chunks into %d passages (~%d tokens)", len(chunks), len(packed), used)
+    return packed
@@ -0,0 +1,94 @@
+"""
+Per-user corpus size index
+Keeps an in-process count of indexed chunks per user so searches for users
+without documents return immediately, with no embedding or Elasticsearch call
+"""
+
+import threading
+import logging
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# user UUID -> chunk count, or None when the count is unknown until the next refresh
+_chunk_counts: Dict[str, Optional[int]] = {}
+_warmed = False
+_lock = threading.Lock()
+
+
+def warm_up() -> int:
+    """
+    Populate counts for every user from an Elasticsearch terms aggregation
+    Call once at startup after Elasticsearch is initialized
+
+    Returns:
+        Number of users with indexed chunks
+    """
+    global _warmed
+    from elasticsearch_client import iter_term_counts
+
+    counts = dict(iter_term_counts("user_id"))
+    with _lock:
+        _chunk_counts.clear()
+        _chunk_counts.update(counts)
+        _warmed = True
+
+    logger.info(f"Corpus index warmed: {len(counts)} users with indexed chunks")
+    return len(counts)
+
+
+def get_chunk_count(user_id: str) -> Optional[int]:
+    """
+    Indexed chunk count for a user
+
+    Returns:
+        Count (0 for users never seen since warm-up), or None if unknown
+    """
+    if user_id in _chunk_counts:
+        return _chunk_counts[user_id]
+    return 0 if _warmed else None
+
+
+def is_empty(user_id: str) -> bool:
+    """
+    True only when the user is known to have no indexed chunks
+    Users marked unknown are refreshed from Elasticsearch with a single count
+    """
+    count = get_chunk_count(user_id)
+    if count is None and _warmed:
+        count = refresh_user(user_id)
+    return count == 0
+
+
+def add_chunks(user_id: str, count: int):
+    """Record chunks indexed for a user"""
+    with _lock:
+        current = get_chunk_count(user_id)
+        _chunk_counts[user_id] = None if current is None else current + count
+
+
+def remove_chunks(user_id: str, count: int):
+    """Record chunks deleted for a user"""
+    with _lock:
+        current = get_chunk_count(user_id)
+        _chunk_counts[user_id] = None if current is None else max(current - count, 0)
+
+
+def mark_unknown(user_id: str):
+    """Forget a user's count after a change of unknown size; searches hit Elasticsearch until refreshed"""
+    with _lock:
+        _chunk_counts[user_id] = None
+
+
+def refresh_user(user_id: str) -> Optional[int]:
+    """Re-read a user's count from Elasticsearch (e.g. after an unknown-size delete)"""
+    from elasticsearch_client import count_user_chunks
+
+    try:
+        count = count_user_chunks(user_id)
+    except Exception as e:
+        logger.warning(f"Could not refresh chunk count for user {user_id}: {e}")
+        return None
+    with _lock:
+        _chunk_counts[user_id] = count
+    return count
@@ -93,7 +93,9 @@ create table if not exists file_permissions (
 -- Create indexes for better performance
 create index if not exists idx_files_user_id on files(user_id);
 create index if not exists idx_files_upload_status on files(upload_status);
+create index if not exists idx_files_created_at_id on files(created_at desc, id desc); -- admin keyset pagination
 create index if not exists idx_file_chunks_file_id on file_chunks(file_id);
+create index if not exists idx_file_chunks_file_id_chunk_index on file_chunks(file_id, chunk_index); -- paged chunk listing
 create index if not exists idx_file_chunks_content_fts on file_chunks using gin(to_tsvector('english', content));
 
 -- Optional: Keep embeddings indexes if you want to maintain the table
@@ -4,9 +4,18 @@ Replaces Supabase pgvector for RAG functionality
 """
 
 import os
+import time
 import logging
-from typing import List, Dict, Any, Optional
-from elasticsearch import Elasticsearch
+from typing import List, Dict, Any, Iterator, Optional
+from elasticsearch import Elasticsearch, helpers
+
+from metrics import client_call
+from embedding_models import (
+    DOCUMENTS_ALIAS,
+    EMBEDDING_MODEL_NAME,
+    get_embedding_dim,
+    index_name_for,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -14,8 +23,18 @@ logger = logging.getLogger(__name__)
 es_client: Optional[Elasticsearch] = None
 
 # Index configuration
-DOCUMENTS_INDEX = "documents"
-EMBEDDING_DIM = 384  # Sentence Transformers all-MiniLM-L6-v2
+# All reads and writes go through the alias; the concrete index behind it is
+# versioned by embedding model so a re-embed can be swapped in atomically.
+DOCUMENTS_INDEX = DOCUMENTS_ALIAS
+
+# Background delete_by_query tuning
+DELETE_REQUESTS_PER_SECOND = float(os.getenv("ES_DELETE_REQUESTS_PER_SECOND", "500"))
+DELETE_SLICES = os.getenv("ES_DELETE_SLICES", "auto")
+BULK_DELETE_MAX_IDS = 5000  # Above this, a background delete_by_query is cheaper
+MAX_TRACKED_DELETE_TASKS = 1000
+
+# Background delete tasks started by this process, keyed by ES task id
+_delete_tasks: Dict[str, Dict[str, Any]] = {}
 
 
 def init_elasticsearch(cloud_id: str = None, api_key: str = None, hosts: List[str] = None, endpoint: str = None) -> Elasticsearch:
@@ -79,67 +98,179 @@ def get_elasticsearch_client() -> Elasticsearch:
     return es_client
 
 
-def create_documents_index():
+def _documents_mappings(model_name: str) -> Dict[str, Any]:
+    """Index mappings for document chunks embedded with the given model"""
+    return {
+        "_meta": {
+            "embedding_model": model_name,
+            "embedding_dim": get_embedding_dim(model_name)
+        },
+        "properties": {
+            "content": {
+                "type": "text",
+                "analyzer": "english"
+            },
+            "embedding": {
+                "type": "dense_vector",
+                "dims": get_embedding_dim(model_name),
+                "index": True,
+                "similarity": "cosine"
+            },
+            "file_id": {"type": "keyword"},
+            "chunk_id": {"type": "keyword"},
+            "chunk_index": {"type": "integer"},
+            "page_number": {"type": "integer"},
+            "user_id": {"type": "keyword"},
+            "filename": {"type": "keyword"},
+            "created_at": {"type": "date"}
+        }
+    }
+
+
+def create_documents_index(model_name: Optional[str] = None, attach_alias: bool = True) -> str:
     """
-    Create the documents index with proper mappings for vector search
+    Create the versioned documents index with proper mappings for vector search
     Compatible with both serverless and hosted deployments
+    
+    Args:
+        model_name: Embedding model the index is built for (defaults to EMBEDDING_MODEL_NAME)
+        attach_alias: Point the documents alias at the new index if no live index exists yet
+        
+    Returns:
+        Name of the concrete index
     """
     try:
         es = get_elasticsearch_client()
+        model_name = model_name or EMBEDDING_MODEL_NAME
+        index_name = index_name_for(model_name)
         
-        # Check if index already exists
-        if es.indices.exists(index=DOCUMENTS_INDEX):
-            logger.info(f"Index '{DOCUMENTS_INDEX}' already exists")
-            return
-        
-        # Create index with mappings (no settings for serverless compatibility)
-        index_config = {
-            "mappings": {
-                "properties": {
-                    "content": {
-                        "type": "text",
-                        "analyzer": "english"
-                    },
-                    "embedding": {
-                        "type": "dense_vector",
-                        "dims": EMBEDDING_DIM,
-                        "index": True,
-                        "similarity": "cosine"
-                    },
-                    "file_id": {"type": "keyword"},
-                    "chunk_id": {"type": "keyword"},
-                    "chunk_index": {"type": "integer"},
-                    "page_number": {"type": "integer"},
-                    "user_id": {"type": "keyword"},
-                    "filename": {"type": "keyword"},
-                    "created_at": {"type": "date"}
+        # Existing deployments may still have a plain "documents" index from
+        # before versioning; keep serving it until a reindex replaces it.
+        if attach_alias and es.indices.exists(index=DOCUMENTS_ALIAS) and not es.indices.exists_alias(name=DOCUMENTS_ALIAS):
+            logger.info(f"Legacy index '{DOCUMENTS_ALIAS}' in use; run reindex_embeddings.py to move it behind an alias")
+            return DOCUMENTS_ALIAS
+        
+        if es.indices.exists(index=index_name):
+            logger.info(f"Index '{index_name}' already exists")
+        else:
+            index_config = {"mappings": _documents_mappings(model_name)}
+            
+            # Try to create with settings first (for hosted deployments)
+            try:
+                index_config["settings"] = {
+                    "number_of_shards": 1,
+                    "number_of_replicas": 1
                 }
-            }
-        }
+                es.indices.create(index=index_name, body=index_config)
+                logger.info(f"✅ Created index '{index_name}' with vector search support (hosted)")
+            except Exception as settings_error:
+                # If settings fail (serverless), try without settings
+                if "serverless" in str(settings_error).lower() or "illegal_argument" in str(settings_error).lower():
+                    logger.info("Detected serverless deployment, creating index without shard/replica settings...")
+                    index_config.pop("settings", None)
+                    es.indices.create(index=index_name, body=index_config)
+                    logger.info(f"✅ Created index '{index_name}' with vector search support (serverless)")
+                else:
+                    raise settings_error
         
-        # Try to create with settings first (for hosted deployments)
-        try:
-            index_config["settings"] = {
-                "number_of_shards": 1,
-                "number_of_replicas": 1
-            }
-            es.indices.create(index=DOCUMENTS_INDEX, body=index_config)
-            logger.info(f"✅ Created index '{DOCUMENTS_INDEX}' with vector search support (hosted)")
-        except Exception as settings_error:
-            # If settings fail (serverless), try without settings
-            if "serverless" in str(settings_error).lower() or "illegal_argument" in str(settings_error).lower():
-                logger.info("Detected serverless deployment, creating index without shard/replica settings...")
-                index_config.pop("settings", None)
-                es.indices.create(index=DOCUMENTS_INDEX, body=index_config)
-                logger.info(f"✅ Created index '{DOCUMENTS_INDEX}' with vector search support (serverless)")
-            else:
-                raise settings_error
+        if attach_alias and not es.indices.exists_alias(name=DOCUMENTS_ALIAS):
+            es.indices.put_alias(index=index_name, name=DOCUMENTS_ALIAS)
+            logger.info(f"✅ Alias '{DOCUMENTS_ALIAS}' -> '{index_name}'")
+        
+        return index_name
         
     except Exception as e:
         logger.error(f"Error creating documents index: {e}")
         raise
 
 
+def get_active_index() -> Optional[str]:
+    """
+    Resolve the concrete index currently behind the documents alias
+    
+    Returns:
+        Index name, the legacy index name if unversioned, or None if nothing exists
+    """
+    es = get_elasticsearch_client()
+    
+    if es.indices.exists_alias(name=DOCUMENTS_ALIAS):
+        aliases = es.indices.get_alias(name=DOCUMENTS_ALIAS)
+        return next(iter(aliases.keys()))
+    if es.indices.exists(index=DOCUMENTS_ALIAS):
+        return DOCUMENTS_ALIAS
+    return None
+
+
+def get_index_embedding_model(index_name: Optional[str] = None) -> Optional[str]:
+    """
+    Get the embedding model recorded in an index's mapping metadata
+    
+    Returns:
+        Model name, or None for legacy indexes created without metadata
+    """
+    try:
+        es = get_elasticsearch_client()
+        index_name = index_name or get_active_index()
+        if not index_name:
+            return None
+        mapping = es.indices.get_mapping(index=index_name)
+        return mapping[index_name]["mappings"].get("_meta", {}).get("embedding_model")
+    except Exception as e:
+        logger.warning(f"Could not read embedding model for index {index_name}: {e}")
+        return None
+
+
+def swap_documents_alias(new_index: str) -> Optional[str]:
+    """
+    Atomically point the documents alias at a new index
+    
+    A legacy concrete "documents" index is removed in the same request since
+    an alias cannot share a name with an index.
+    
+    Args:
+        new_index: Fully built index to serve reads and writes from
+        
+    Returns:
+        Name of the index previously behind the alias (None if there was none)
+    """
+    es = get_elasticsearch_client()
+    old_index = get_active_index()
+    
+    actions: List[Dict[str, Any]] = []
+    if old_index == DOCUMENTS_ALIAS:
+        actions.append({"remove_index": {"index": DOCUMENTS_ALIAS}})
+    elif old_index:
+        actions.append({"remove": {"index": old_index, "alias": DOCUMENTS_ALIAS}})
+    actions.append({"add": {"index": new_index, "alias": DOCUMENTS_ALIAS}})
+    
+    es.indices.update_aliases(actions=actions)
+    logger.info(f"✅ Alias '{DOCUMENTS_ALIAS}' swapped: {old_index} -> {new_index}")
+    return None if old_index == DOCUMENTS_ALIAS else old_index
+
+
+def bulk_index_chunks(documents: List[Dict[str, Any]], index_name: Optional[str] = None) -> int:
+    """
+    Index many chunk documents in a single _bulk request
+    
+    Args:
+        documents: Chunk documents including "chunk_id" and "embedding"
+        index_name: Target index (defaults to the documents alias)
+        
+    Returns:
+        Number of documents indexed
+    """
+    es = get_elasticsearch_client()
+    actions = (
+        {"_index": index_name or DOCUMENTS_INDEX, "_id": doc["chunk_id"], "_source": doc}
+        for doc in documents
+    )
+    with client_call("elasticsearch", "bulk_index"):
+        success, errors = helpers.bulk(es, actions, raise_on_error=False)
+    if errors:
+        logger.warning(f"Bulk indexing reported {len(errors)} errors")
+    return success
+
+
 def index_document_chunk(
     chunk_id: str,
     file_id: str,
@@ -182,13 +313,14 @@ def index_document_chunk(
             "created_at": datetime.utcnow().isoformat() + "Z"  # ISO 8601 format
         }
         
-        response = es.index(
-            index=DOCUMENTS_INDEX,
-            id=chunk_id,
-            document=document
-        )
+        with client_call("elasticsearch", "index_chunk"):
+            response = es.index(
+                index=DOCUMENTS_INDEX,
+                id=chunk_id,
+                document=document
+            )
         
-        logger.info(f"Indexed chunk {chunk_id} for file {file_id}")
+        logger.debug("Indexed chunk %s for file %s", chunk_id, file_id)
         return response
         
     except Exception as e:
@@ -202,7 +334,8 @@ def search_similar_chunks(
     k: int = 5,
     num_candidates: int = 50,
     use_hybrid: bool = True,
-    query_text: Optional[str] = None
+    query_text: Optional[str] = None,
+    include_embeddings: bool = False
 ) -> List[Dict[str, Any]]:
     """
     Search for similar document chunks using vector similarity
@@ -214,6 +347,7 @@ def search_similar_chunks(
         num_candidates: Number of candidates to consider
         use_hybrid: Whether to use hybrid search (vector + keyword)
         query_text: Query text for keyword search (required if use_hybrid=True)
+        include_embeddings: Also return each chunk's stored embedding
         
     Returns:
         List of matching chunks with scores
@@ -221,6 +355,10 @@ def search_similar_chunks(
     try:
         es = get_elasticsearch_client()
         
+        source_fields = ["content", "file_id", "chunk_id", "page_number", "filename", "chunk_index"]
+        if include_embeddings:
+            source_fields.append("embedding")
+        
         if use_hybrid and query_text:
             # Hybrid search: vector + keyword
             search_query = {
@@ -241,33 +379,35 @@ def search_similar_chunks(
                 }
             }
             
-            response = es.search(
-                index=DOCUMENTS_INDEX,
-                query=search_query,
-                knn={
-                    "field": "embedding",
-                    "query_vector": query_embedding,
-                    "k": k,
-                    "num_candidates": num_candidates,
-                    "boost": 0.7  # Higher weight for vector similarity
-                },
-                size=k,
-                _source=["content", "file_id", "chunk_id", "page_number", "filename", "chunk_index"]
-            )
+            with client_call("elasticsearch", "search"):
+                response = es.search(
+                    index=DOCUMENTS_INDEX,
+                    query=search_query,
+                    knn={
+                        "field": "embedding",
+                        "query_vector": query_embedding,
+                        "k": k,
+                        "num_candidates": num_candidates,
+                        "boost": 0.7  # Higher weight for vector similarity
+                    },
+                    size=k,
+                    _source=source_fields
+                )
         else:
             # Pure vector search
-            response = es.search(
-                index=DOCUMENTS_INDEX,
-                query={"term": {"user_id": user_id}},
-                knn={
-                    "field": "embedding",
-                    "query_vector": query_embedding,
-                    "k": k,
-                    "num_candidates": num_candidates
-                },
-                size=k,
-                _source=["content", "file_id", "chunk_id", "page_number", "filename", "chunk_index"]
-            )
+            with client_call("elasticsearch", "search"):
+                response = es.search(
+                    index=DOCUMENTS_INDEX,
+                    query={"term": {"user_id": user_id}},
+                    knn={
+                        "field": "embedding",
+                        "query_vector": query_embedding,
+                        "k": k,
+                        "num_candidates": num_candidates
+                    },
+                    size=k,
+                    _source=source_fields
+                )
         
         # Format results
         results = []
@@ -281,9 +421,11 @@ def search_similar_chunks(
                 "chunk_index": hit["_source"].get("chunk_index"),
                 "similarity_score": hit["_score"]
             }
+            if include_embeddings:
+                result["embedding"] = hit["_source"].get("embedding")
             results.append(result)
         
-        logger.info(f"Found {len(results)} similar chunks for user {user_id}")
+        logger.debug("Found %d similar chunks for user %s", len(results), user_id)
         return results
         
     except Exception as e:
@@ -291,56 +433,256 @@ def search_similar_chunks(
         return []
 
 
-def delete_file_chunks(file_id: str) -> Dict[str, Any]:
+def _delete_by_query_async(query: Dict[str, Any], description: str) -> str:
+    """
+    Start a throttled, sliced delete_by_query as a background ES task
+    
+    Returns:
+        Elasticsearch task id (tracked for polling via get_delete_task)
+    """
+    es = get_elasticsearch_client()
+    
+    with client_call("elasticsearch", "delete_by_query"):
+        response = es.delete_by_query(
+            index=DOCUMENTS_INDEX,
+            query=query,
+            wait_for_completion=False,
+            requests_per_second=DELETE_REQUESTS_PER_SECOND,
+            slices=DELETE_SLICES,
+            conflicts="proceed"
+        )
+    task_id = response["task"]
+    
+    _delete_tasks[task_id] = {
+        "task_id": task_id,
+        "description": description,
+        "completed": False,
+        "started_at": time.time()
+    }
+    # Bound the registry: forget the oldest finished tasks first
+    if len(_delete_tasks) > MAX_TRACKED_DELETE_TASKS:
+        finished = [tid for tid, t in _delete_tasks.items() if t["completed"]]
+        for tid in (finished or list(_delete_tasks))[:len(_delete_tasks) - MAX_TRACKED_DELETE_TASKS]:
+            _delete_tasks.pop(tid, None)
+    
+    logger.info(f"Started delete task {task_id} for {description}")
+    return task_id
+
+
+def delete_chunks_by_ids(chunk_ids: List[str], index_name: Optional[str] = None) -> int:
+    """
+    Delete known chunk ids with a single _bulk request
+    Much cheaper than delete_by_query since no search is needed
+    
+    Args:
+        chunk_ids: Chunk identifiers (the ES document ids)
+        index_name: Target index (defaults to the documents alias)
+        
+    Returns:
+        Number of documents deleted
+        
+    Raises:
+        helpers.BulkIndexError: Some deletes failed for a reason other than the
+            document being missing; the ids that were deleted stay deleted
+    """
+    es = get_elasticsearch_client()
+    actions = (
+        {"_op_type": "delete", "_index": index_name or DOCUMENTS_INDEX, "_id": chunk_id}
+        for chunk_id in chunk_ids
+    )
+    with client_call("elasticsearch", "bulk_delete"):
+        deleted, errors = helpers.bulk(es, actions, raise_on_error=False)
+        # Missing ids (already deleted / never indexed) come back as 404 not_found; only those are expected
+        failed = [e for e in errors if e.get("delete", {}).get("status") != 404]
+        if failed:
+            logger.error(f"Bulk delete failed for {len(failed)} of {len(chunk_ids)} chunks, first: {failed[0]}")
+            raise helpers.BulkIndexError(f"{len(failed)} chunk(s) failed to delete", failed)
+    return deleted
+
+
+def delete_file_chunks(file_id: str, chunk_ids: Optional[List[str]] = None) -> Dict[str, Any]:
     """
     Delete all chunks associated with a file
     
+    When the chunk ids are known (the common per-file case) they are deleted
+    directly via _bulk. Otherwise a throttled delete_by_query is started in the
+    background and its task id returned.
+    
     Args:
         file_id: File identifier
+        chunk_ids: Chunk ids of the file, if known
         
     Returns:
-        Elasticsearch response
+        {"deleted": n} for the fast path, {"task": task_id} for the background path
     """
     try:
-        es = get_elasticsearch_client()
+        if chunk_ids and len(chunk_ids) <= BULK_DELETE_MAX_IDS:
+            deleted = delete_chunks_by_ids(chunk_ids)
+            logger.info(f"Deleted {deleted} chunks for file {file_id}")
+            return {"deleted": deleted}
         
-        response = es.delete_by_query(
-            index=DOCUMENTS_INDEX,
-            query={"term": {"file_id": file_id}}
-        )
-        
-        logger.info(f"Deleted {response['deleted']} chunks for file {file_id}")
-        return response
+        task_id = _delete_by_query_async({"term": {"file_id": file_id}}, f"file {file_id}")
+        return {"task": task_id}
         
     except Exception as e:
         logger.error(f"Error deleting file chunks: {e}")
         raise
 
 
+def delete_chunks_for_files(file_ids: List[str]) -> str:
+    """
+    Delete the chunks of many files with one throttled background delete_by_query
+    
+    Args:
+        file_ids: File identifiers (at most a few thousand per call)
+        
+    Returns:
+        Elasticsearch task id
+    """
+    return _delete_by_query_async({"terms": {"file_id": file_ids}}, f"{len(file_ids)} orphaned files")
+
+
 def delete_user_chunks(user_id: str) -> Dict[str, Any]:
     """
-    Delete all chunks for a user
+    Delete all chunks for a user as a throttled background task
     
     Args:
         user_id: User identifier
         
     Returns:
-        Elasticsearch response
+        {"task": task_id}
     """
     try:
-        es = get_elasticsearch_client()
+        task_id = _delete_by_query_async({"term": {"user_id": user_id}}, f"user {user_id}")
+        return {"task": task_id}
         
-        response = es.delete_by_query(
+    except Exception as e:
+        logger.error(f"Error deleting user chunks: {e}")
+        raise
+
+
+def get_delete_task(task_id: str) -> Dict[str, Any]:
+    """
+    Poll a background delete task
+    
+    Args:
+        task_id: Task id returned by delete_file_chunks / delete_user_chunks
+        
+    Returns:
+        Tracked task info with completion flag and ES status counters
+    """
+    es = get_elasticsearch_client()
+    info = _delete_tasks.get(task_id, {"task_id": task_id, "description": None})
+    
+    response = es.tasks.get(task_id=task_id)
+    status = response.get("task", {}).get("status", {})
+    info.update({
+        "completed": response.get("completed", False),
+        "deleted": status.get("deleted", 0),
+        "total": status.get("total", 0),
+        "failures": len(response.get("response", {}).get("failures", []))
+    })
+    if task_id in _delete_tasks:
+        _delete_tasks[task_id] = info
+    return info
+
+
+def list_delete_tasks() -> List[Dict[str, Any]]:
+    """Refresh and return all tracked background delete tasks"""
+    tasks = []
+    for task_id in list(_delete_tasks):
+        if _delete_tasks[task_id]["completed"]:
+            tasks.append(_delete_tasks[task_id])
+            continue
+        try:
+            tasks.append(get_delete_task(task_id))
+        except Exception as e:
+            logger.warning(f"Could not poll delete task {task_id}: {e}")
+            tasks.append(_delete_tasks[task_id])
+    return tasks
+
+
+def iter_term_counts(field: str, page_size: int = 1000) -> Iterator[tuple]:
+    """
+    Stream (term, doc_count) pairs for a keyword field using a paginated
+    composite aggregation, so memory stays flat however many terms exist
+    
+    Args:
+        field: Keyword field, e.g. "user_id" or "file_id"
+        page_size: Buckets fetched per request
+        
+    Yields:
+        (term, doc_count) tuples
+    """
+    es = get_elasticsearch_client()
+    after_key = None
+    
+    while True:
+        composite: Dict[str, Any] = {
+            "size": page_size,
+            "sources": [{"term": {"terms": {"field": field}}}]
+        }
+        if after_key:
+            composite["after"] = after_key
+        
+        response = es.search(
             index=DOCUMENTS_INDEX,
-            query={"term": {"user_id": user_id}}
+            size=0,
+            aggs={"terms_page": {"composite": composite}}
         )
+        agg = response["aggregations"]["terms_page"]
+        for bucket in agg["buckets"]:
+            yield bucket["key"]["term"], bucket["doc_count"]
         
-        logger.info(f"Deleted {response['deleted']} chunks for user {user_id}")
-        return response
+        after_key = agg.get("after_key")
+        if not agg["buckets"] or not after_key:
+            break
+
+
+def count_user_chunks(user_id: str) -> int:
+    """Number of indexed chunks for a user"""
+    es = get_elasticsearch_client()
+    with client_call("elasticsearch", "count"):
+        return es.count(index=DOCUMENTS_INDEX, query={"term": {"user_id": user_id}})["count"]
+
+
+def get_file_chunks_page(
+    file_id: str,
+    after_index: int = -1,
+    size: int = 50,
+    include_content: bool = True
+) -> List[Dict[str, Any]]:
+    """
+    Chunks of a file in chunk_index order, read from _source (embeddings excluded)
+    
+    Args:
+        file_id: File ID
+        after_index: Return chunks with chunk_index greater than this
+        size: Page size
+        include_content: Whether to return the chunk text
         
-    except Exception as e:
-        logger.error(f"Error deleting user chunks: {e}")
-        raise
+    Returns:
+        Chunk dicts with id, chunk_index, page_number, created_at (and content)
+    """
+    es = get_elasticsearch_client()
+    fields = ["chunk_id", "chunk_index", "page_number", "created_at"]
+    if include_content:
+        fields.append("content")
+    
+    response = es.search(
+        index=DOCUMENTS_INDEX,
+        query={"bool": {"filter": [
+            {"term": {"file_id": file_id}},
+            {"range": {"chunk_index": {"gt": after_index}}}
+        ]}},
+        sort=[{"chunk_index": "asc"}],
+        size=size,
+        source=fields
+    )
+    return [
+        {**{k: v for k, v in hit["_source"].items() if k != "chunk_id"}, "id": hit["_source"].get("chunk_id", hit["_id"])}
+        for hit in response["hits"]["hits"]
+    ]
 
 
 def get_index_stats() -> Dict[str, Any]:
@@ -362,10 +704,12 @@ def get_index_stats() -> Dict[str, Any]:
             "index_name": DOCUMENTS_INDEX
         }
         
+        result["active_index"] = get_active_index()
+        
         # Try to get detailed stats (only works in hosted mode)
         try:
             stats = es.indices.stats(index=DOCUMENTS_INDEX)
-            result["index_size"] = stats["indices"][DOCUMENTS_INDEX]["total"]["store"]["size_in_bytes"]
+            result["index_size"] = stats["_all"]["total"]["store"]["size_in_bytes"]
         except Exception as stats_error:
             # Serverless mode doesn't support stats API
             if "serverless" in str(stats_error).lower() or "api_not_available" in str(stats_error).lower():
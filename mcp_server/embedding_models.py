@@ -0,0 +1,69 @@
+"""
+Embedding model registry
+Single source of truth for embedding model names, vector dimensions and
+the versioned Elasticsearch index each model's vectors are stored in
+"""
+
+import os
+import re
+from typing import Optional
+
+# Known Sentence Transformers models and their output dimensions
+EMBEDDING_MODELS = {
+    'paraphrase-MiniLM-L3-v2': 384,
+    'all-MiniLM-L6-v2': 384,
+    'all-MiniLM-L12-v2': 384,
+    'multi-qa-MiniLM-L6-cos-v1': 384,
+    'BAAI/bge-small-en-v1.5': 384,
+    'all-mpnet-base-v2': 768,
+}
+
+DEFAULT_EMBEDDING_MODEL = 'paraphrase-MiniLM-L3-v2'  # 384 dimensions, lighter and faster
+
+# Model used for new indexes; an existing index keeps the model it was built with
+EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", DEFAULT_EMBEDDING_MODEL)
+
+# Read/write alias that always points at the live versioned index
+DOCUMENTS_ALIAS = "documents"
+
+
+def get_embedding_dim(model_name: Optional[str] = None) -> int:
+    """
+    Get the vector dimension produced by an embedding model
+
+    Unknown models can be used by setting EMBEDDING_DIM in the environment.
+    """
+    name = model_name or EMBEDDING_MODEL_NAME
+    if name in EMBEDDING_MODELS:
+        return EMBEDDING_MODELS[name]
+    if os.getenv("EMBEDDING_DIM"):
+        return int(os.environ["EMBEDDING_DIM"])
+    raise ValueError(f"Unknown embedding model '{name}'. Add it to EMBEDDING_MODELS or set EMBEDDING_DIM.")
+
+
+def model_version(model_name: Optional[str] = None) -> str:
+    """Index-safe version slug for a model name, e.g. 'paraphrase-minilm-l3-v2'"""
+    name = model_name or EMBEDDING_MODEL_NAME
+    return re.sub(r'[^a-z0-9]+', '-', name.lower()).strip('-')
+
+
+def index_name_for(model_name: Optional[str] = None) -> str:
+    """Concrete Elasticsearch index name holding vectors for a model"""
+    return f"{DOCUMENTS_ALIAS}-{model_version(model_name)}"
+
+
+def check_embedding_config():
+    """
+    Fail fast on an embedding model whose dimension is unknown
+
+    Raises:
+        RuntimeError: EMBEDDING_MODEL_NAME is not in EMBEDDING_MODELS and EMBEDDING_DIM is not set
+    """
+    try:
+        get_embedding_dim()
+    except ValueError as e:
+        raise RuntimeError(f"Invalid embedding configuration: {e}") from None
+
+
+# None (rather than an import-time error) for an unknown model; check_embedding_config() reports it at startup
+EMBEDDING_DIM = EMBEDDING_MODELS.get(EMBEDDING_MODEL_NAME) or int(os.getenv("EMBEDDING_DIM", "0")) or None
@@ -3,11 +3,17 @@ Enhanced embedding generation using Sentence Transformers
 Provides semantic understanding for better RAG retrieval
 """
 
+import os
+import time
+import hashlib
 from typing import List, Optional
 import numpy as np
 from sentence_transformers import SentenceTransformer, CrossEncoder
 import logging
 
+from embedding_models import EMBEDDING_MODEL_NAME, EMBEDDING_DIM, get_embedding_dim
+from ttl_cache import TTLCache
+
 logger = logging.getLogger(__name__)
 
 # Global model instances (loaded once)
@@ -15,9 +21,28 @@ _embedding_model: Optional[SentenceTransformer] = None
 _reranker_model: Optional[CrossEncoder] = None
 
 # Model configuration
-EMBEDDING_MODEL_NAME = 'paraphrase-MiniLM-L3-v2'  # 384 dimensions, lighter and faster
 RERANKER_MODEL_NAME = 'cross-encoder/ms-marco-MiniLM-L-6-v2'
-EMBEDDING_DIM = 384
+
+# Re-ranking stage configuration (sized for CPU inference)
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "20"))  # First-stage hits scored by the cross-encoder
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "8"))  # Pairs per predict() call
+RERANK_MAX_LENGTH = int(os.getenv("RERANK_MAX_LENGTH", "256"))  # Max tokens per (query, doc) pair
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", "300"))  # Stop scoring after this much time
+
+# Scores keyed by (re-ranker model, query hash, chunk id)
+_rerank_score_cache = TTLCache(maxsize=50000, ttl=3600, name="rerank_scores")
+
+# Model queries and new chunks are embedded with; must match the live index
+_active_model_name: str = EMBEDDING_MODEL_NAME
+
+
+def load_embedding_model(model_name: str) -> SentenceTransformer:
+    """
+    Load an embedding model without touching the active singleton
+    Used by the re-embed job to build a new index alongside the live one
+    """
+    logger.info(f"Loading embedding model: {model_name}")
+    return SentenceTransformer(model_name)
 
 
 def get_embedding_model() -> SentenceTransformer:
@@ -28,8 +53,7 @@ def get_embedding_model() -> SentenceTransformer:
     
     if _embedding_model is None:
         try:
-            logger.info(f"Loading embedding model: {EMBEDDING_MODEL_NAME}")
-            _embedding_model = SentenceTransformer(EMBEDDING_MODEL_NAME)
+            _embedding_model = load_embedding_model(_active_model_name)
             logger.info("Embedding model loaded successfully")
         except Exception as e:
             logger.error(f"Failed to load embedding model: {e}")
@@ -38,6 +62,39 @@ def get_embedding_model() -> SentenceTransformer:
     return _embedding_model
 
 
+def get_active_model_name() -> str:
+    """Name of the model currently used for query and chunk embeddings"""
+    return _active_model_name
+
+
+def set_embedding_model(model_name: str, model: Optional[SentenceTransformer] = None):
+    """
+    Switch the active embedding model
+    
+    Called at startup to match the model recorded on the live index, and by the
+    re-embed job right after the alias swap so queries match the new vectors.
+    
+    Args:
+        model_name: Model name
+        model: Already loaded instance to reuse (loaded lazily if omitted)
+    """
+    global _embedding_model, _active_model_name
+    
+    if model_name == _active_model_name and model is None:
+        return
+    logger.info(f"Switching embedding model: {_active_model_name} -> {model_name}")
+    changed = model_name != _active_model_name
+    _active_model_name = model_name
+    _embedding_model = model
+    
+    if changed:
+        # Vectors cached under the old model cannot be compared with new queries
+        import response_cache
+        import retrieval_router
+        retrieval_router.reset_prototype_vectors()
+        response_cache.invalidate_all()
+
+
 def get_reranker_model() -> CrossEncoder:
     """
     Get or initialize the re-ranker model (singleton pattern)
@@ -47,7 +104,7 @@ def get_reranker_model() -> CrossEncoder:
     if _reranker_model is None:
         try:
             logger.info(f"Loading re-ranker model: {RERANKER_MODEL_NAME}")
-            _reranker_model = CrossEncoder(RERANKER_MODEL_NAME)
+            _reranker_model = CrossEncoder(RERANKER_MODEL_NAME, max_length=RERANK_MAX_LENGTH)
             logger.info("Re-ranker model loaded successfully")
         except Exception as e:
             logger.error(f"Failed to load re-ranker model: {e}")
@@ -68,7 +125,7 @@ def generate_embedding(text: str) -> List[float]:
     """
     if not text or not text.strip():
         logger.warning("Empty text provided for embedding")
-        return [0.0] * EMBEDDING_DIM
+        return [0.0] * get_embedding_dim(_active_model_name)
     
     try:
         model = get_embedding_model()
@@ -85,7 +142,7 @@ def generate_embedding(text: str) -> List[float]:
     except Exception as e:
         logger.error(f"Error generating embedding: {e}")
         # Return zero vector as fallback
-        return [0.0] * EMBEDDING_DIM
+        return [0.0] * get_embedding_dim(_active_model_name)
 
 
 def generate_embeddings_batch(texts: List[str], batch_size: int = 32) -> List[List[float]]:
@@ -119,17 +176,31 @@ def generate_embeddings_batch(texts: List[str], batch_size: int = 32) -> List[Li
     except Exception as e:
         logger.error(f"Error generating batch embeddings: {e}")
         # Return zero vectors as fallback
-        return [[0.0] * EMBEDDING_DIM for _ in texts]
+        return [[0.0] * get_embedding_dim(_active_model_name) for _ in texts]
 
 
-def rerank_results(query: str, documents: List[str], top_k: Optional[int] = None) -> List[tuple]:
+def rerank_results(
+    query: str,
+    documents: List[str],
+    top_k: Optional[int] = None,
+    doc_ids: Optional[List[str]] = None,
+    batch_size: int = RERANK_BATCH_SIZE,
+    budget_ms: Optional[float] = RERANK_BUDGET_MS
+) -> List[tuple]:
     """
     Re-rank documents based on relevance to query using cross-encoder
     
+    Documents are expected in first-stage order. They are scored in batches
+    until the time budget runs out; scored documents are re-ordered and any
+    unscored remainder keeps its first-stage order (with a score of None).
+    
     Args:
         query: Search query
-        documents: List of document texts to rank
+        documents: List of document texts to rank, best first-stage hit first
         top_k: Number of top results to return (None = all)
+        doc_ids: Stable ids for the documents, enables the score cache
+        batch_size: Pairs scored per predict() call
+        budget_ms: Latency budget for scoring (None = unlimited)
         
     Returns:
         List of (index, score) tuples sorted by relevance
@@ -139,16 +210,36 @@ def rerank_results(query: str, documents: List[str], top_k: Optional[int] = None
     
     try:
         reranker = get_reranker_model()
+        started = time.perf_counter()
+        
+        query_hash = hashlib.sha1(query.strip().lower().encode('utf-8')).hexdigest()
+        # Cheap character cap so tokenization never sees very long chunks
+        max_chars = RERANK_MAX_LENGTH * 4
         
-        # Create query-document pairs
-        pairs = [(query, doc) for doc in documents]
+        scores: List[Optional[float]] = [None] * len(documents)
+        pending: List[int] = []
+        for idx in range(len(documents)):
+            cached = _rerank_score_cache.get((RERANKER_MODEL_NAME, query_hash, doc_ids[idx])) if doc_ids else None
+            if cached is not None:
+                scores[idx] = cached
+            else:
+                pending.append(idx)
         
-        # Get relevance scores
-        scores = reranker.predict(pairs)
+        for offset in range(0, len(pending), batch_size):
+            if budget_ms is not None and (time.perf_counter() - started) * 1000 > budget_ms:
+                logger.warning(f"Re-rank budget of {budget_ms}ms exhausted after {offset}/{len(pending)} documents")
+                break
+            batch = pending[offset:offset + batch_size]
+            pairs = [(query, documents[idx][:max_chars]) for idx in batch]
+            for idx, score in zip(batch, reranker.predict(pairs, batch_size=batch_size)):
+                scores[idx] = float(score)
+                if doc_ids:
+                    _rerank_score_cache.set((RERANKER_MODEL_NAME, query_hash, doc_ids[idx]), scores[idx])
         
-        # Create (index, score) tuples and sort by score
-        ranked = [(idx, float(score)) for idx, score in enumerate(scores)]
-        ranked.sort(key=lambda x: x[1], reverse=True)
+        # Scored documents in score order, unscored tail in first-stage order
+        scored = [(idx, score) for idx, score in enumerate(scores) if score is not None]
+        scored.sort(key=lambda x: x[1], reverse=True)
+        ranked = scored + [(idx, None) for idx, score in enumerate(scores) if score is None]
         
         # Return top_k if specified
         if top_k is not None:
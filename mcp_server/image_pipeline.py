@@ -0,0 +1,151 @@
+"""
+Image preprocessing for vision calls
+Uploads are checked from their header before any pixel decode, downscaled to
+the resolution the vision model actually uses, re-encoded compactly without
+EXIF/metadata, and cached by content hash so repeat questions about the same
+image skip decoding entirely.
+"""
+
+import os
+import io
+import base64
+import hashlib
+import logging
+from typing import Any, Dict, Optional
+
+from PIL import Image, ImageOps
+
+from ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+IMAGE_MAX_BYTES = int(os.getenv("IMAGE_MAX_BYTES", str(10 * 1024 * 1024)))  # Matches the 10MB upload limit
+IMAGE_MAX_PIXELS = int(os.getenv("IMAGE_MAX_PIXELS", "40000000"))  # Refuse decompression bombs
+IMAGE_MAX_SIDE = int(os.getenv("IMAGE_MAX_SIDE", "1536"))  # Gemini tiles larger images down anyway
+IMAGE_JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", "85"))
+HEADER_PROBE_BYTES = 64 * 1024  # Enough for the header of any common format
+
+ALLOWED_FORMATS = {"JPEG", "PNG", "GIF", "WEBP", "BMP"}
+
+Image.MAX_IMAGE_PIXELS = IMAGE_MAX_PIXELS
+
+# sha256 of the upload -> prepared image; short-lived, images are never persisted
+_prepared_cache = TTLCache(maxsize=64, ttl=600, name="prepared_images")
+
+
+class ImageRejectedError(ValueError):
+    """The upload is not an acceptable image (format, byte size or dimensions)"""
+
+
+def _check_header(image: Image.Image):
+    if image.format not in ALLOWED_FORMATS:
+        raise ImageRejectedError(f"Unsupported image format: {image.format or 'unknown'}")
+    width, height = image.size
+    if width * height > IMAGE_MAX_PIXELS:
+        raise ImageRejectedError(f"Image is too large ({width}x{height})")
+
+
+def decode_base64_image(image_base64: str) -> bytes:
+    """
+    Decode a base64 upload, rejecting oversized images before the full decode
+
+    Only the first HEADER_PROBE_BYTES are decoded to read format and
+    dimensions; the full payload is decoded once the header checks pass.
+
+    Raises:
+        ImageRejectedError: Invalid base64, too many bytes, or bad header
+    """
+    if image_base64.startswith("data:") and "," in image_base64[:100]:
+        image_base64 = image_base64.split(",", 1)[1]  # Strip a data: URL prefix
+
+    if len(image_base64) * 3 // 4 > IMAGE_MAX_BYTES:
+        raise ImageRejectedError(f"Image exceeds {IMAGE_MAX_BYTES // (1024 * 1024)}MB")
+
+    probe_chars = (HEADER_PROBE_BYTES * 4 // 3) // 4 * 4
+    try:
+        head = base64.b64decode(image_base64[:probe_chars])
+        _check_header(Image.open(io.BytesIO(head)))
+    except ImageRejectedError:
+        raise
+    except Exception:
+        pass  # Header not within the probe (or odd padding); prepare_image checks again
+
+    try:
+        return base64.b64decode(image_base64, validate=False)
+    except Exception as e:
+        raise ImageRejectedError(f"Invalid base64 image data: {e}")
+
+
+def _encode(image: Image.Image) -> tuple:
+    """Re-encode as JPEG, or WebP when transparency must be kept; no metadata is written"""
+    buffer = io.BytesIO()
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        image.convert("RGBA").save(buffer, format="WEBP", quality=IMAGE_JPEG_QUALITY, method=4)
+        return buffer.getvalue(), "image/webp"
+    image.convert("RGB").save(buffer, format="JPEG", quality=IMAGE_JPEG_QUALITY, optimize=True)
+    return buffer.getvalue(), "image/jpeg"
+
+
+def prepare_image(image_bytes: bytes, mime_type: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Downscale and re-encode an image for the vision model
+
+    Args:
+        image_bytes: Raw upload
+        mime_type: MIME type declared by the client (informational only)
+
+    Returns:
+        {"data": bytes, "mime_type": str, "width": int, "height": int,
+         "original_bytes": int, "hash": sha256 hex}
+
+    Raises:
+        ImageRejectedError: Not an acceptable image
+    """
+    if len(image_bytes) > IMAGE_MAX_BYTES:
+        raise ImageRejectedError(f"Image exceeds {IMAGE_MAX_BYTES // (1024 * 1024)}MB")
+
+    digest = hashlib.sha256(image_bytes).hexdigest()
+    cached = _prepared_cache.get(digest)
+    if cached is not None:
+        return cached
+
+    try:
+        # Image.open only parses the header; pixels are decoded on load()
+        image = Image.open(io.BytesIO(image_bytes))
+        _check_header(image)
+        original_size = image.size
+
+        # JPEG can decode directly at a reduced scale (1/2, 1/4, 1/8)
+        if image.format == "JPEG":
+            image.draft("RGB", (IMAGE_MAX_SIDE, IMAGE_MAX_SIDE))
+        image.load()
+
+        # Apply the EXIF orientation before the metadata is dropped
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((IMAGE_MAX_SIDE, IMAGE_MAX_SIDE), Image.LANCZOS)
+        data, out_mime = _encode(image)
+    except ImageRejectedError:
+        raise
+    except Image.DecompressionBombError as e:
+        raise ImageRejectedError(str(e))
+    except Exception as e:
+        raise ImageRejectedError(f"Could not read image ({mime_type or 'unknown type'}): {e}")
+
+    prepared = {
+        "data": data,
+        "mime_type": out_mime,
+        "width": image.width,
+        "height": image.height,
+        "original_bytes": len(image_bytes),
+        "hash": digest
+    }
+    _prepared_cache.set(digest, prepared)
+    logger.info(
+        f"Prepared image {digest[:8]}: {original_size[0]}x{original_size[1]} {len(image_bytes)}B -> "
+        f"{image.width}x{image.height} {len(data)}B {out_mime}"
+    )
+    return prepared
+
+
+def get_cache_stats() -> Dict[str, Any]:
+    return _prepared_cache.stats()
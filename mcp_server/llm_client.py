@@ -0,0 +1,178 @@
+"""
+Async Gemini call layer
+Every model call goes through here so bursts are smoothed by a global
+concurrency limit and a token bucket sized to our quota, calls respect a
+request deadline, and retryable errors are retried with jittered backoff
+"""
+
+import os
+import time
+import random
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Dict, Optional
+
+from google.api_core import exceptions as google_exceptions
+
+from metrics import client_call
+
+logger = logging.getLogger(__name__)
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_REQUESTS_PER_MINUTE = float(os.getenv("LLM_REQUESTS_PER_MINUTE", "60"))
+LLM_BURST = int(os.getenv("LLM_BURST", "10"))
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+RETRY_BASE_SECONDS = 0.5
+RETRY_MAX_SECONDS = 8.0
+
+RETRYABLE_ERRORS = (
+    google_exceptions.ResourceExhausted,   # 429 quota
+    google_exceptions.ServiceUnavailable,  # 503
+    google_exceptions.InternalServerError,  # 500
+    google_exceptions.DeadlineExceeded,
+    asyncio.TimeoutError,
+)
+
+
+class LLMUnavailableError(Exception):
+    """The model could not answer within the deadline (quota, overload or timeout)"""
+
+
+class TokenBucket:
+    """Async token bucket: `rate` tokens per second, holding at most `capacity`"""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, timeout: float):
+        deadline = time.monotonic() + timeout
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+                if now + wait > deadline:
+                    raise LLMUnavailableError("Rate limit wait exceeds request deadline")
+                await asyncio.sleep(wait)
+
+
+# Created lazily so they bind to the running event loop
+_semaphore: Optional[asyncio.Semaphore] = None
+_bucket: Optional[TokenBucket] = None
+
+_stats: Dict[str, Any] = {
+    "calls": 0,
+    "errors": 0,
+    "retries": 0,
+    "timeouts": 0,
+    "in_flight": 0,
+    "waiting": 0,
+}
+_latencies_ms: deque = deque(maxlen=1000)
+
+
+def _get_limiters():
+    global _semaphore, _bucket
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+        _bucket = TokenBucket(LLM_REQUESTS_PER_MINUTE / 60.0, LLM_BURST)
+    return _semaphore, _bucket
+
+
+async def generate_content(model, contents, timeout: Optional[float] = None, **kwargs):
+    """
+    Call model.generate_content_async under the concurrency, rate and deadline limits
+
+    Args:
+        model: genai.GenerativeModel
+        contents: Prompt text or list of parts
+        timeout: Total seconds allowed including queueing and retries (defaults to LLM_TIMEOUT_SECONDS)
+        **kwargs: Passed through to generate_content_async
+
+    Returns:
+        Gemini response
+
+    Raises:
+        LLMUnavailableError: Deadline exceeded or retries exhausted on retryable errors
+    """
+    semaphore, bucket = _get_limiters()
+    deadline = time.monotonic() + (timeout or LLM_TIMEOUT_SECONDS)
+
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        remaining = deadline - time.monotonic()
+        try:
+            if remaining <= 0:
+                raise asyncio.TimeoutError()
+            await bucket.acquire(remaining)
+
+            _stats["waiting"] += 1
+            try:
+                await asyncio.wait_for(semaphore.acquire(), timeout=deadline - time.monotonic())
+            finally:
+                _stats["waiting"] -= 1
+
+            _stats["in_flight"] += 1
+            started = time.perf_counter()
+            try:
+                remaining = deadline - time.monotonic()
+                with client_call("gemini", "generate_content"):
+                    response = await asyncio.wait_for(
+                        model.generate_content_async(contents, request_options={"timeout": remaining}, **kwargs),
+                        timeout=remaining
+                    )
+            finally:
+                _stats["in_flight"] -= 1
+                semaphore.release()
+
+            _stats["calls"] += 1
+            _latencies_ms.append((time.perf_counter() - started) * 1000)
+            return response
+
+        except RETRYABLE_ERRORS as e:
+            _stats["errors"] += 1
+            if isinstance(e, (asyncio.TimeoutError, google_exceptions.DeadlineExceeded)):
+                _stats["timeouts"] += 1
+            backoff = min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** attempt) * random.uniform(0.5, 1.5)
+            if attempt >= LLM_MAX_RETRIES or time.monotonic() + backoff >= deadline:
+                logger.error(f"Gemini call failed after {attempt + 1} attempts: {type(e).__name__}: {e}")
+                raise LLMUnavailableError(str(e) or type(e).__name__) from e
+            _stats["retries"] += 1
+            logger.warning(f"Retryable Gemini error ({type(e).__name__}), retrying in {backoff:.2f}s")
+            await asyncio.sleep(backoff)
+
+        except LLMUnavailableError:
+            _stats["errors"] += 1
+            raise
+
+        except Exception:
+            _stats["errors"] += 1
+            raise
+
+
+def get_llm_stats() -> Dict[str, Any]:
+    """Concurrency and latency figures for the Gemini call layer"""
+    latencies = sorted(_latencies_ms)
+
+    def _percentile(p: float) -> float:
+        if not latencies:
+            return 0.0
+        return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))], 1)
+
+    return {
+        **_stats,
+        "max_concurrency": LLM_MAX_CONCURRENCY,
+        "requests_per_minute": LLM_REQUESTS_PER_MINUTE,
+        "latency_ms_p50": _percentile(0.50),
+        "latency_ms_p95": _percentile(0.95),
+        "latency_ms_p99": _percentile(0.99),
+    }
@@ -1,9 +1,12 @@
 import os
 import sys
+import json
+import asyncio
 import logging
 from typing import Optional
-from fastapi import FastAPI, HTTPException, UploadFile, File, Depends, Header
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Depends, Header, BackgroundTasks
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.responses import JSONResponse, StreamingResponse, Response
 from pydantic import BaseModel
 from pydantic_settings import BaseSettings
 
@@ -13,8 +16,23 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '.'))
 from tools import user_tools, chat_tools, file_tools, admin_tools
 from tools import site_tools
 from ai_client import generate_from_prompt
+from llm_client import LLMUnavailableError, get_llm_stats
 from supabase_client import init_supabase
-from elasticsearch_client import init_elasticsearch
+from elasticsearch_client import init_elasticsearch, get_index_embedding_model, get_delete_task, list_delete_tasks
+from embedding_models import check_embedding_config
+import reindex_embeddings
+import response_cache
+import context_packing
+import retrieval_router
+import corpus_index
+import query_expansion
+import image_pipeline
+import system_stats
+import orphan_sweeper
+import message_log
+from structured_logging import configure_logging, log_payload
+import metrics
+from metrics import chat_stage
 
 class Settings(BaseSettings):
     GEMINI_API_KEY: str
@@ -34,7 +52,11 @@ class Settings(BaseSettings):
 
 settings = Settings()
 
-logging.basicConfig(level=logging.INFO)
+ORPHAN_SWEEP_INTERVAL_HOURS = float(os.getenv("ORPHAN_SWEEP_INTERVAL_HOURS", "0"))  # 0 = only on demand
+# How often the model recorded on the live index is re-read (a CLI reindex swaps it from another process)
+EMBEDDING_MODEL_SYNC_SECONDS = float(os.getenv("EMBEDDING_MODEL_SYNC_SECONDS", "15"))  # 0 = only at startup
+
+configure_logging()
 logger = logging.getLogger(__name__)
 
 app = FastAPI()
@@ -44,6 +66,9 @@ security = HTTPBearer()
 
 @app.on_event("startup")
 async def startup_event():
+    # Refuse to start with an embedding model of unknown dimension
+    check_embedding_config()
+    
     # Initialize Supabase
     init_supabase(settings.SUPABASE_URL, settings.SUPABASE_SERVICE_ROLE_KEY)
     
@@ -74,15 +99,72 @@ async def startup_event():
         logger.error(f"Failed to initialize Elasticsearch: {e}")
         raise
     
+    # Per-user chunk counts so searches for empty corpora skip ES entirely
+    try:
+        corpus_index.warm_up()
+    except Exception as e:
+        logger.warning(f"Could not warm corpus index: {e}")
+    
+    # Write-behind message persistence (replays messages a crash left in the spool)
+    message_log.start()
+    
+    # Materialized admin stats (counted once in the background, then kept incrementally)
+    system_stats.refresh_in_background()
+    
+    # Embed queries with the model the live index was built with
+    try:
+        _sync_embedding_model(preload=False)
+    except Exception as e:
+        logger.warning(f"Could not sync embedding model with live index: {e}")
+    if EMBEDDING_MODEL_SYNC_SECONDS > 0:
+        asyncio.create_task(_watch_embedding_model())
+    
     # Load UI awareness from frontend
     try:
-        site_tools.load_site_facts()
-        site_tools.load_structural_awareness()
-        site_tools.load_functional_awareness()
-        logger.info("UI awareness loaded successfully")
+        ui_context = site_tools.load_ui_awareness()
+        logger.info(f"UI awareness loaded successfully ({ui_context['tokens']} tokens)")
     except Exception as e:
         logger.warning(f"Could not load UI awareness: {e}")
 
+    # Periodic reconciliation of orphaned ES chunks and storage objects
+    if ORPHAN_SWEEP_INTERVAL_HOURS > 0:
+        asyncio.create_task(_run_orphan_sweeps())
+    
+    # Pick up frontend changes without a restart
+    try:
+        site_tools.start_watching()
+    except Exception as e:
+        logger.warning(f"Could not watch frontend for changes: {e}")
+
+def _sync_embedding_model(preload: bool = True):
+    """Switch to the embedding model recorded on the live index, if it changed"""
+    index_model = get_index_embedding_model()
+    from embeddings import get_active_model_name, load_embedding_model, set_embedding_model
+    if index_model and index_model != get_active_model_name():
+        # Load before switching so queries keep using the old model until the new one is ready
+        set_embedding_model(index_model, load_embedding_model(index_model) if preload else None)
+
+async def _watch_embedding_model():
+    while True:
+        await asyncio.sleep(EMBEDDING_MODEL_SYNC_SECONDS)
+        try:
+            await asyncio.to_thread(_sync_embedding_model)
+        except Exception as e:
+            logger.warning(f"Could not sync embedding model with live index: {e}")
+
+async def _run_orphan_sweeps():
+    while True:
+        await asyncio.sleep(ORPHAN_SWEEP_INTERVAL_HOURS * 3600)
+        try:
+            await asyncio.to_thread(orphan_sweeper.sweep_orphans)
+        except Exception as e:
+            logger.warning(f"Scheduled orphan sweep failed: {e}")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    site_tools.stop_watching()
+    await asyncio.to_thread(message_log.stop)
+
 class ChatRequest(BaseModel):
     user_id: str
     message: str
@@ -101,6 +183,15 @@ class AdminCreateRequest(BaseModel):
     password: str
     name: str
 
+class SweepRequest(BaseModel):
+    dry_run: bool = False
+    include_storage: bool = True
+
+class ReindexRequest(BaseModel):
+    model_name: str | None = None
+    batch_size: int = 64
+    delete_old: bool = False
+
 # Dependency to verify admin token
 async def verify_admin_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
     token = credentials.credentials
@@ -113,8 +204,37 @@ async def verify_admin_token(credentials: HTTPAuthorizationCredentials = Depends
 def health_check():
     return {"status": "ok"}
 
+@app.get("/metrics")
+def prometheus_metrics():
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
+
 @app.post("/mcp/query")
 async def mcp_query(request: ChatRequest):
+    return await _answer_chat(request)
+
+@app.post("/mcp/query-image")
+async def mcp_query_image(
+    user_id: str = Form(...),
+    message: str = Form(""),
+    user_name: Optional[str] = Form(None),
+    user_email: Optional[str] = Form(None),
+    image: UploadFile = File(...)
+):
+    """Chat about an image sent as multipart form data (no base64 overhead)"""
+    image_bytes = await image.read(image_pipeline.IMAGE_MAX_BYTES + 1)
+    if len(image_bytes) > image_pipeline.IMAGE_MAX_BYTES:
+        raise HTTPException(status_code=413, detail="Image is too large")
+    request = ChatRequest(
+        user_id=user_id,
+        message=message,
+        user_name=user_name,
+        user_email=user_email,
+        image_mime_type=image.content_type or "application/octet-stream"
+    )
+    return await _answer_chat(request, image_bytes)
+
+async def _answer_chat(request: ChatRequest, image_bytes: bytes = None):
     user_id = request.user_id
     user_message = request.message
     user_name = request.user_name
@@ -122,64 +242,81 @@ async def mcp_query(request: ChatRequest):
     image_base64 = request.image_base64
     image_mime_type = request.image_mime_type
     
-    has_image = image_base64 and image_mime_type
-    logger.info(f"Received chat request from user {user_id} (name: {user_name}, email: {user_email}, has_image: {has_image})")
+    has_image = bool((image_base64 or image_bytes) and image_mime_type)
+    logger.info("Chat request from user %s (has_image: %s)", user_id, has_image)
 
     try:
         # 1. Get or create user profile with name/email
-        logger.info("Getting/creating user profile...")
-        logger.info(f"Calling get_user_profile with: firebase_uid={user_id}, email={user_email}, name={user_name}")
-        user = user_tools.get_user_profile(user_id, user_email, user_name)
-        logger.info(f"User profile result: {user}")
+        with chat_stage("user_resolve"):
+            user = user_tools.get_user_profile(user_id, user_email, user_name)
+        logger.debug("Resolved user %s -> %s", user_id, user['id'])
 
         # 2. Get chat history
-        logger.info("Getting chat history...")
-        chat_history = chat_tools.get_chat_history(user_id)
-        logger.info(f"Chat history: {chat_history}")
-        print(f"DEBUG: MCP server returning chat history: {chat_history}")
-
-        # 3. Search for relevant file content (only if no image)
+        with chat_stage("history"):
+            chat_history = chat_tools.get_chat_history(user_id)
+        logger.debug("Loaded %d history messages", len(chat_history))
+        log_payload(logger, "Chat history", chat_history)
+
+        # 2.5 Answer repeated questions from the semantic response cache
+        query_vector = None
+        corpus_version = response_cache.get_corpus_version(user['id'])
+        if not has_image and response_cache.is_cacheable(user_message):
+            with chat_stage("embed"):
+                query_vector = file_tools.generate_embedding(user_message)
+            cached_reply = response_cache.lookup(user['id'], query_vector, chat_history)
+            if cached_reply:
+                with chat_stage("store"):
+                    chat_tools.store_turn(user['id'], user_message, cached_reply)
+                return {"reply": cached_reply}
+
+        # 3. Search for relevant file content (only if no image and the router says it can help)
         file_context = []
         if not has_image:
-            logger.info("Searching for relevant file content...")
-            file_context = file_tools.search_similar_chunks(user_message, user_id, limit=50)
-            logger.info(f"Found {len(file_context)} relevant file chunks")
+            route = retrieval_router.route_query(user_message, user['id'], query_vector)
+            query_vector = route['query_vector']
+            if route['retrieve']:
+                with chat_stage("search"):
+                    file_context = await query_expansion.retrieve(
+                        user_message, user_id, limit=50, query_vector=query_vector, chat_history=chat_history
+                    )
+                logger.debug("Found %d relevant file chunks", len(file_context))
+                file_context = context_packing.pack_context(file_context)
 
         # 3.5 Add UI awareness as context (structural + functional + contact)
         ui_context = site_tools.get_ui_context()
-        site_context = []
-        if ui_context:
-            site_context = [{ 'content': ui_context }]
 
         # 4. Generate response with user context, file context, and site facts
-        logger.info("Generating AI response...")
-        merged_context = (file_context or []) + site_context
-        
         # If image is provided, use vision model
-        if has_image:
-            from ai_client import generate_with_image
-            assistant_response = generate_with_image(
-                user_message, 
-                chat_history, 
-                user_name, 
-                image_base64, 
-                image_mime_type
-            )
-        else:
-            assistant_response = generate_from_prompt(user_message, chat_history, user_name, merged_context)
+        with chat_stage("llm"):
+            if has_image:
+                from ai_client import generate_with_image
+                assistant_response = await generate_with_image(
+                    user_message, 
+                    chat_history, 
+                    user_name, 
+                    image_base64, 
+                    image_mime_type,
+                    image_bytes
+                )
+            else:
+                assistant_response = await generate_from_prompt(user_message, chat_history, user_name, file_context, ui_context)
         
-        logger.info(f"Assistant response generated successfully")
+        if query_vector is not None and response_cache.is_cacheable(user_message):
+            response_cache.store(user['id'], query_vector, assistant_response, corpus_version, chat_history)
 
-        # 5. Store messages (store text only, not image data)
-        logger.info("Storing user message...")
+        # 5. Queue messages for write-behind persistence (store text only, not image data)
         message_to_store = f"{user_message} [image attached]" if has_image else user_message
-        chat_tools.store_message(user_id, "user", message_to_store)
-        logger.info("Storing assistant message...")
-        chat_tools.store_message(user_id, "assistant", assistant_response)
-        logger.info("Messages stored successfully")
+        with chat_stage("store"):
+            chat_tools.store_turn(user['id'], message_to_store, assistant_response)
 
         # 6. Return response
         return {"reply": assistant_response}
+    except LLMUnavailableError as e:
+        logger.error(f"AI model unavailable for user {user_id}: {e}")
+        raise HTTPException(status_code=503, detail="The AI service is busy. Please try again in a moment.")
+    except image_pipeline.ImageRejectedError as e:
+        logger.warning(f"Rejected image from user {user_id}: {e}")
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error processing chat request for user {user_id}: {str(e)}")
         logger.error(f"Error type: {type(e).__name__}")
@@ -188,15 +325,41 @@ async def mcp_query(request: ChatRequest):
         raise HTTPException(status_code=500, detail="Internal server error")
 
 @app.get("/mcp/history")
-async def mcp_history(user_id: str):
-    logger.info(f"Fetching chat history for user {user_id}")
+async def mcp_history(user_id: str, limit: Optional[int] = None, before: Optional[str] = None, format: str = "json"):
+    """
+    Chat history, oldest first. With `limit`, returns the latest page before the
+    `before` cursor; the cursor for the next (older) page is in X-Next-Before.
+    format=ndjson streams the full history, one message per line.
+    """
+    logger.debug("Fetching chat history for user %s", user_id)
     try:
-        chat_history = chat_tools.get_chat_history(user_id)
-        return chat_history
+        if format == "ndjson":
+            lines = _ndjson_lines(user_id, chat_tools.iter_chat_history(user_id))
+            return StreamingResponse(lines, media_type="application/x-ndjson")
+        
+        page_size = min(max(limit, 1), 500) if limit else None
+        chat_history = chat_tools.get_chat_history(user_id, page_size, before)
+        headers = {}
+        if page_size and len(chat_history) == page_size:
+            headers["X-Next-Before"] = chat_history[0]['created_at']
+        return JSONResponse(content=chat_history, headers=headers)
     except Exception as e:
         logger.error(f"Error fetching chat history for user {user_id}: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
+def _ndjson_lines(user_id: str, messages):
+    """
+    Encodes messages one per line. The 200 is already sent when a later read fails,
+    so the error is logged and the stream ends with an {"error": ...} line instead of
+    looking like a complete (truncated) export.
+    """
+    try:
+        for message in messages:
+            yield json.dumps(message) + "\n"
+    except Exception as e:
+        logger.error(f"Error streaming chat history for user {user_id}: {e}", exc_info=True)
+        yield json.dumps({"error": "Chat history export failed before the end"}) + "\n"
+
 @app.delete("/mcp/clear-chat")
 async def mcp_clear_chat(user_id: str):
     logger.info(f"Clearing chat history for user {user_id}")
@@ -267,7 +430,7 @@ async def upload_pdf(user_id: str, file: UploadFile = File(...)):
 
 @app.get("/mcp/files")
 async def get_user_files(user_id: str):
-    logger.info(f"Fetching files for user {user_id}")
+    logger.debug("Fetching files for user %s", user_id)
     try:
         files = file_tools.get_user_files(user_id)
         return {"files": files}
@@ -290,7 +453,7 @@ async def delete_file(user_id: str, file_id: str):
 
 @app.post("/mcp/search-files")
 async def search_files(user_id: str, query: str):
-    logger.info(f"Searching files for user {user_id} with query: {query}")
+    logger.debug("Searching files for user %s", user_id)
     try:
         similar_chunks = file_tools.search_similar_chunks(query, user_id)
         return {"chunks": similar_chunks}
@@ -303,12 +466,17 @@ async def search_files(user_id: str, query: str):
 async def admin_login(request: AdminLoginRequest):
     logger.info(f"Admin login attempt for {request.email}")
     try:
-        result = admin_tools.authenticate_admin(request.email, request.password)
+        result = await admin_tools.authenticate_admin_async(request.email, request.password)
         if result['success']:
             logger.info(f"Admin login successful for {request.email}")
             return result
+        elif result.get('throttled'):
+            logger.warning(f"Admin login throttled for {request.email}")
+            raise HTTPException(status_code=429, detail=result['error'])
         else:
             raise HTTPException(status_code=401, detail=result['error'])
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error in admin login: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
@@ -317,42 +485,93 @@ async def admin_login(request: AdminLoginRequest):
 async def create_admin(request: AdminCreateRequest):
     logger.info(f"Creating admin user: {request.email}")
     try:
-        result = admin_tools.create_admin_user(request.email, request.password, request.name)
+        result = await admin_tools.create_admin_user_async(request.email, request.password, request.name)
         if result['success']:
             logger.info(f"Admin user created successfully: {request.email}")
             return result
+        elif result.get('throttled'):
+            raise HTTPException(status_code=429, detail=result['error'])
         else:
             raise HTTPException(status_code=400, detail=result['error'])
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error creating admin user: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
+@app.post("/admin/admins/{admin_id}/deactivate")
+async def deactivate_admin(admin_id: str, admin: dict = Depends(verify_admin_token)):
+    logger.info(f"Admin {admin['email']} deactivating admin: {admin_id}")
+    result = admin_tools.deactivate_admin(admin_id)
+    if not result['success']:
+        raise HTTPException(status_code=404 if result['error'] == 'Admin user not found' else 500, detail=result['error'])
+    return result
+
 @app.get("/admin/files")
-async def get_all_files(limit: int = 100, offset: int = 0, admin: dict = Depends(verify_admin_token)):
+async def get_all_files(
+    limit: int = 100,
+    offset: int = 0,
+    cursor: Optional[str] = None,
+    status: Optional[str] = None,
+    user_id: Optional[str] = None,
+    filename_prefix: Optional[str] = None,
+    admin: dict = Depends(verify_admin_token)
+):
     logger.info(f"Admin {admin['email']} fetching all files")
     try:
-        result = admin_tools.get_all_files(limit, offset)
+        result = admin_tools.get_all_files(min(max(limit, 1), 500), offset, cursor, status, user_id, filename_prefix)
         if result['success']:
             return result
+        elif result['error'] == 'Invalid cursor':
+            raise HTTPException(status_code=400, detail=result['error'])
         else:
             raise HTTPException(status_code=500, detail=result['error'])
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error fetching files for admin: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
 @app.get("/admin/files/{file_id}")
-async def get_file_details(file_id: str, admin: dict = Depends(verify_admin_token)):
+async def get_file_details(
+    file_id: str,
+    chunk_limit: Optional[int] = None,
+    after_index: int = -1,
+    content: str = "full",
+    preview_chars: int = 300,
+    source: str = "db",
+    admin: dict = Depends(verify_admin_token)
+):
     logger.info(f"Admin {admin['email']} fetching file details: {file_id}")
+    if content not in ("none", "preview", "full") or source not in ("db", "es"):
+        raise HTTPException(status_code=400, detail="content must be none|preview|full and source db|es")
     try:
-        result = admin_tools.get_file_details(file_id)
+        result = admin_tools.get_file_details(
+            file_id,
+            min(max(chunk_limit, 1), 500) if chunk_limit is not None else None,
+            after_index, content, max(preview_chars, 0), source
+        )
         if result['success']:
             return result
-        else:
+        elif result['error'] == 'File not found':
             raise HTTPException(status_code=404, detail=result['error'])
+        else:
+            raise HTTPException(status_code=500, detail=result['error'])
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error fetching file details for admin: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
+@app.get("/admin/files/{file_id}/chunks/{chunk_index}")
+async def get_file_chunk(file_id: str, chunk_index: int, source: str = "db", admin: dict = Depends(verify_admin_token)):
+    if source not in ("db", "es"):
+        raise HTTPException(status_code=400, detail="source must be db or es")
+    result = admin_tools.get_file_chunk(file_id, chunk_index, source)
+    if not result['success']:
+        raise HTTPException(status_code=404 if result['error'] == 'Chunk not found' else 500, detail=result['error'])
+    return result
+
 @app.delete("/admin/files/{file_id}")
 async def delete_file_admin(file_id: str, admin: dict = Depends(verify_admin_token)):
     logger.info(f"Admin {admin['email']} deleting file: {file_id}")
@@ -367,10 +586,10 @@ async def delete_file_admin(file_id: str, admin: dict = Depends(verify_admin_tok
         raise HTTPException(status_code=500, detail="Internal server error")
 
 @app.get("/admin/stats")
-async def get_system_stats(admin: dict = Depends(verify_admin_token)):
+async def get_system_stats(max_staleness: Optional[int] = None, admin: dict = Depends(verify_admin_token)):
     logger.info(f"Admin {admin['email']} fetching system stats")
     try:
-        result = admin_tools.get_system_stats()
+        result = admin_tools.get_system_stats(max_staleness)
         if result['success']:
             return result
         else:
@@ -379,6 +598,68 @@ async def get_system_stats(admin: dict = Depends(verify_admin_token)):
         logger.error(f"Error fetching system stats for admin: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
+@app.post("/admin/site/reload")
+async def reload_site_awareness(admin: dict = Depends(verify_admin_token)):
+    try:
+        ui_context = site_tools.load_ui_awareness()
+        response_cache.invalidate_all()
+        return {"success": True, "tokens": ui_context['tokens']}
+    except Exception as e:
+        logger.error(f"Error reloading UI awareness: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+@app.get("/admin/llm/stats")
+async def get_llm_call_stats(admin: dict = Depends(verify_admin_token)):
+    from ai_client import get_route_stats
+    return {
+        **get_llm_stats(),
+        "routes": get_route_stats(),
+        "image_cache": image_pipeline.get_cache_stats(),
+        "admin_token_cache": admin_tools.get_token_cache_stats(),
+        "message_log": message_log.get_stats()
+    }
+
+@app.post("/admin/index/reindex")
+async def start_reindex(request: ReindexRequest, background_tasks: BackgroundTasks, admin: dict = Depends(verify_admin_token)):
+    logger.info(f"Admin {admin['email']} starting re-embed (model: {request.model_name})")
+    if reindex_embeddings.get_reindex_status().get('state') == 'running':
+        raise HTTPException(status_code=409, detail="A reindex job is already running")
+    background_tasks.add_task(
+        reindex_embeddings.reindex_embeddings,
+        request.model_name,
+        request.batch_size,
+        request.delete_old
+    )
+    return {"message": "Reindex started"}
+
+@app.get("/admin/index/reindex")
+async def get_reindex_status(admin: dict = Depends(verify_admin_token)):
+    return reindex_embeddings.get_reindex_status()
+
+@app.post("/admin/maintenance/sweep-orphans")
+async def start_orphan_sweep(request: SweepRequest, background_tasks: BackgroundTasks, admin: dict = Depends(verify_admin_token)):
+    logger.info(f"Admin {admin['email']} starting orphan sweep (dry_run: {request.dry_run})")
+    if orphan_sweeper.get_sweep_status().get('state') == 'running':
+        raise HTTPException(status_code=409, detail="An orphan sweep is already running")
+    background_tasks.add_task(orphan_sweeper.sweep_orphans, request.dry_run, request.include_storage)
+    return {"message": "Orphan sweep started"}
+
+@app.get("/admin/maintenance/sweep-orphans")
+async def get_orphan_sweep_status(admin: dict = Depends(verify_admin_token)):
+    return orphan_sweeper.get_sweep_status()
+
+@app.get("/admin/index/delete-tasks")
+async def get_delete_tasks(admin: dict = Depends(verify_admin_token)):
+    return {"tasks": list_delete_tasks()}
+
+@app.get("/admin/index/delete-tasks/{task_id}")
+async def get_delete_task_status(task_id: str, admin: dict = Depends(verify_admin_token)):
+    try:
+        return get_delete_task(task_id)
+    except Exception as e:
+        logger.error(f"Error polling delete task {task_id}: {e}")
+        raise HTTPException(status_code=404, detail="Task not found")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=int(os.getenv("PORT", 8000)))
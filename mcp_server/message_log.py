@@ -0,0 +1,206 @@
+"""
+Write-behind log for chat messages
+Messages are queued in memory and appended to a local spool file, then a
+background thread writes them to Supabase in multi-row inserts every
+MESSAGE_FLUSH_INTERVAL seconds (sooner once MESSAGE_FLUSH_BATCH rows are
+waiting). Rows carry their own id and created_at, so replaying the spool after
+a crash is idempotent and ordering does not depend on when the flush runs.
+"""
+
+import os
+import json
+import uuid
+import threading
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import system_stats
+from metrics import client_call
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SPOOL_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.message_spool.jsonl')
+MESSAGE_SPOOL_FILE = os.getenv("MESSAGE_SPOOL_FILE", DEFAULT_SPOOL_FILE)
+MESSAGE_SPOOL_FSYNC = os.getenv("MESSAGE_SPOOL_FSYNC", "false").lower() == "true"  # Survive power loss, not just crashes
+MESSAGE_FLUSH_INTERVAL = float(os.getenv("MESSAGE_FLUSH_INTERVAL", "0.5"))
+MESSAGE_FLUSH_BATCH = int(os.getenv("MESSAGE_FLUSH_BATCH", "200"))
+MESSAGE_RETRY_SECONDS = 5.0
+
+_pending: List[Dict[str, Any]] = []
+_lock = threading.Lock()
+_flush_lock = threading.Lock()
+_wake = threading.Event()
+_stop = threading.Event()
+_thread: Optional[threading.Thread] = None
+_spool = None
+_stats = {"queued": 0, "flushed": 0, "batches": 0, "failures": 0}
+
+
+def _open_spool():
+    global _spool
+    if MESSAGE_SPOOL_FILE and _spool is None:
+        _spool = open(MESSAGE_SPOOL_FILE, 'a', encoding='utf-8')
+
+
+def _rewrite_spool():
+    """Replace the spool with the rows still pending (caller holds _lock)"""
+    global _spool
+    if not MESSAGE_SPOOL_FILE:
+        return
+    if _spool:
+        _spool.close()
+        _spool = None
+    tmp_path = f"{MESSAGE_SPOOL_FILE}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        for row in _pending:
+            f.write(json.dumps(row) + "\n")
+    os.replace(tmp_path, MESSAGE_SPOOL_FILE)
+    _open_spool()
+
+
+def _load_spool() -> List[Dict[str, Any]]:
+    if not MESSAGE_SPOOL_FILE or not os.path.exists(MESSAGE_SPOOL_FILE):
+        return []
+    rows = []
+    with open(MESSAGE_SPOOL_FILE, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                rows.append(json.loads(line))
+            except json.JSONDecodeError:
+                logger.warning("Skipping truncated line in message spool")  # Torn write at crash time
+    return rows
+
+
+def enqueue(user_id: str, role: str, content: str, metadata: dict = None) -> Dict[str, Any]:
+    """
+    Queue a message for persistence
+
+    Args:
+        user_id: Supabase user UUID
+        role: 'user' | 'assistant' | 'system'
+        content: Message text
+        metadata: Optional JSON metadata
+
+    Returns:
+        The message row as it will be stored
+    """
+    row = {
+        'id': str(uuid.uuid4()),
+        'user_id': user_id,
+        'role': role,
+        'content': content,
+        'metadata': metadata or {},
+        'created_at': datetime.now(timezone.utc).isoformat()
+    }
+    with _lock:
+        _pending.append(row)
+        _stats["queued"] += 1
+        if _spool:
+            _spool.write(json.dumps(row) + "\n")
+            _spool.flush()
+            if MESSAGE_SPOOL_FSYNC:
+                os.fsync(_spool.fileno())
+        if len(_pending) >= MESSAGE_FLUSH_BATCH:
+            _wake.set()
+    return row
+
+
+def pending_for(user_id: str) -> List[Dict[str, Any]]:
+    """Messages of a user not yet written to the database, oldest first"""
+    with _lock:
+        return [dict(row) for row in _pending if row['user_id'] == user_id]
+
+
+def discard(user_id: str) -> int:
+    """Drop a user's pending messages (chat cleared); returns how many were dropped"""
+    with _flush_lock, _lock:
+        kept = [row for row in _pending if row['user_id'] != user_id]
+        dropped = len(_pending) - len(kept)
+        if dropped:
+            _pending[:] = kept
+            _rewrite_spool()
+        return dropped
+
+
+def flush() -> int:
+    """
+    Write all pending messages in batches of MESSAGE_FLUSH_BATCH rows
+
+    Returns:
+        Number of rows written
+
+    Raises:
+        Exception: The insert failed; the rows stay queued and spooled
+    """
+    from supabase_client import supabase
+
+    written = 0
+    with _flush_lock:
+        while True:
+            with _lock:
+                batch = _pending[:MESSAGE_FLUSH_BATCH]
+            if not batch:
+                return written
+            # Upsert on id: rows replayed from the spool may already have been inserted
+            with client_call("supabase", "insert_messages"):
+                supabase.table('messages').upsert(batch, on_conflict='id', ignore_duplicates=True).execute()
+            with _lock:
+                del _pending[:len(batch)]
+                _rewrite_spool()
+                _stats["flushed"] += len(batch)
+                _stats["batches"] += 1
+            system_stats.increment("total_messages", len(batch))
+            written += len(batch)
+
+
+def _flush_loop():
+    while not _stop.is_set():
+        _wake.wait(MESSAGE_FLUSH_INTERVAL)
+        _wake.clear()
+        try:
+            flush()
+        except Exception as e:
+            _stats["failures"] += 1
+            logger.warning(f"⚠️  Message flush failed ({len(_pending)} pending), retrying: {e}")
+            _stop.wait(MESSAGE_RETRY_SECONDS)
+
+
+def start():
+    """Replay the spool from a previous run and start the flush thread"""
+    global _thread
+    if _thread and _thread.is_alive():
+        return
+    with _lock:
+        recovered = _load_spool()
+        if recovered:
+            known = {row['id'] for row in _pending}
+            _pending[:0] = [row for row in recovered if row['id'] not in known]
+            logger.info(f"Recovered {len(recovered)} unsaved messages from {MESSAGE_SPOOL_FILE}")
+        _open_spool()
+    _stop.clear()
+    _thread = threading.Thread(target=_flush_loop, name="message-log-flush", daemon=True)
+    _thread.start()
+
+
+def stop():
+    """Stop the flush thread and drain the queue; whatever cannot be written stays in the spool"""
+    global _thread, _spool
+    _stop.set()
+    _wake.set()
+    if _thread:
+        _thread.join(timeout=MESSAGE_RETRY_SECONDS + 1)
+        _thread = None
+    try:
+        flush()
+    except Exception as e:
+        logger.error(f"Could not drain message log ({len(_pending)} messages left in spool): {e}")
+    with _lock:
+        if _spool:
+            _spool.close()
+            _spool = None
+
+
+def get_stats() -> Dict[str, Any]:
+    with _lock:
+        return {**_stats, "pending": len(_pending)}
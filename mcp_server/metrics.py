@@ -0,0 +1,153 @@
+"""
+Prometheus metrics for the MCP server
+Latency histograms for every stage of a chat turn and of file ingestion, and
+for calls to Elasticsearch, Supabase and Gemini (with error counts). Cache hit
+ratios and queue depths are read from the existing in-process stats at scrape
+time, so the request path only pays for histogram observations.
+"""
+
+import time
+import functools
+import logging
+from contextlib import contextmanager
+from typing import Iterator
+
+from prometheus_client import Counter, Histogram, REGISTRY, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+logger = logging.getLogger(__name__)
+
+# Up to a minute: LLM calls and whole-file ingestion stages run long
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+CHAT_STAGE_SECONDS = Histogram(
+    "mcp_chat_stage_seconds",
+    "Duration of each stage of a chat turn",
+    ["stage"],  # user_resolve | history | embed | search | rerank | llm | store
+    buckets=LATENCY_BUCKETS
+)
+INGEST_STAGE_SECONDS = Histogram(
+    "mcp_ingest_stage_seconds",
+    "Duration of each stage of file ingestion, per file",
+    ["stage"],  # extract | chunk | embed | index
+    buckets=LATENCY_BUCKETS
+)
+CLIENT_CALL_SECONDS = Histogram(
+    "mcp_client_call_seconds",
+    "Latency of calls to external services",
+    ["service", "operation"],  # service: elasticsearch | supabase | gemini
+    buckets=LATENCY_BUCKETS
+)
+CLIENT_CALL_ERRORS = Counter(
+    "mcp_client_call_errors_total",
+    "Failed calls to external services",
+    ["service", "operation"]
+)
+ROUTE_DECISIONS = Counter(
+    "mcp_retrieval_route_total",
+    "Retrieval router decisions",
+    ["reason", "intent"]  # reason: <intent>_intent, smalltalk_pattern, document_query, no_files or router_disabled
+)
+ROUTE_INTENT_SCORE = Histogram(
+    "mcp_retrieval_route_intent_score",
+    "Cosine similarity of a message to its closest intent prototype (for tuning RETRIEVAL_ROUTER_THRESHOLD)",
+    ["intent"],
+    buckets=(0.3, 0.4, 0.5, 0.6, 0.65, 0.7, 0.75, 0.8, 0.85, 0.9, 0.95, 1.0)
+)
+
+
+@contextmanager
+def chat_stage(stage: str) -> Iterator[None]:
+    """Time a stage of a chat turn"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        CHAT_STAGE_SECONDS.labels(stage).observe(time.perf_counter() - started)
+
+
+@contextmanager
+def ingest_stage(stage: str) -> Iterator[None]:
+    """Time a stage of file ingestion"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        INGEST_STAGE_SECONDS.labels(stage).observe(time.perf_counter() - started)
+
+
+@contextmanager
+def client_call(service: str, operation: str) -> Iterator[None]:
+    """Time a call to an external service and count it as an error if it raises"""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        CLIENT_CALL_ERRORS.labels(service, operation).inc()
+        raise
+    finally:
+        CLIENT_CALL_SECONDS.labels(service, operation).observe(time.perf_counter() - started)
+
+
+def timed_call(service: str, operation: str):
+    """Decorator form of client_call for synchronous functions"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with client_call(service, operation):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class _RuntimeCollector:
+    """Cache and queue figures collected from module stats on each scrape"""
+
+    def describe(self):
+        return []  # Keeps registration from collecting while modules are still importing
+
+    def collect(self):
+        try:
+            yield from self._collect()
+        except Exception as e:
+            logger.warning(f"Could not collect runtime metrics: {e}")
+
+    def _collect(self):
+        from ttl_cache import all_caches
+        import response_cache
+        import message_log
+        import llm_client
+        from tools import admin_tools
+
+        hits = CounterMetricFamily("mcp_cache_hits", "In-process cache hits", labels=["cache"])
+        misses = CounterMetricFamily("mcp_cache_misses", "In-process cache misses", labels=["cache"])
+        ratio = GaugeMetricFamily("mcp_cache_hit_ratio", "In-process cache hit ratio since start", labels=["cache"])
+        entries = GaugeMetricFamily("mcp_cache_entries", "Entries held by an in-process cache", labels=["cache"])
+
+        cache_stats = [cache.stats() for cache in all_caches()]
+        cache_stats.append({"name": "responses", "size": None, **response_cache.get_stats()})
+        for stats in cache_stats:
+            hits.add_metric([stats["name"]], stats["hits"])
+            misses.add_metric([stats["name"]], stats["misses"])
+            ratio.add_metric([stats["name"]], stats["hit_ratio"])
+            if stats.get("size") is not None:
+                entries.add_metric([stats["name"]], stats["size"])
+
+        llm_stats = llm_client.get_llm_stats()
+        queues = GaugeMetricFamily("mcp_queue_depth", "Work waiting in an in-process queue", labels=["queue"])
+        queues.add_metric(["message_log"], message_log.get_stats()["pending"])
+        queues.add_metric(["llm_waiting"], llm_stats["waiting"])
+        queues.add_metric(["password_hashing"], admin_tools.get_password_pool_stats()["pending"])
+
+        in_flight = GaugeMetricFamily("mcp_llm_in_flight", "Gemini calls currently in flight")
+        in_flight.add_metric([], llm_stats["in_flight"])
+
+        yield from (hits, misses, ratio, entries, queues, in_flight)
+
+
+REGISTRY.register(_RuntimeCollector())
+
+
+def render() -> tuple:
+    """(body, content type) for the /metrics endpoint"""
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -0,0 +1,273 @@
+"""
+Reconciliation of Elasticsearch chunks and storage objects against Supabase
+Chunks whose file row no longer exists (and storage objects no file row points
+to) are found by streaming both sides in sorted order and deleted in throttled
+batches, so index size and search latency stay proportional to live data.
+"""
+
+import os
+import sys
+import time
+import logging
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+from elasticsearch_client import (
+    iter_term_counts,
+    delete_chunks_for_files,
+    get_delete_task,
+    get_index_stats,
+)
+
+logger = logging.getLogger(__name__)
+
+SWEEP_PAGE_SIZE = 1000
+SWEEP_DELETE_BATCH = int(os.getenv("ORPHAN_SWEEP_DELETE_BATCH", "500"))  # File ids per delete_by_query
+SWEEP_BATCH_PAUSE_SECONDS = float(os.getenv("ORPHAN_SWEEP_BATCH_PAUSE", "1.0"))
+SWEEP_GRACE_SECONDS = int(os.getenv("ORPHAN_SWEEP_GRACE_SECONDS", "3600"))  # Skip storage objects younger than this
+SWEEP_TASK_POLL_SECONDS = 2.0
+STORAGE_BUCKET = "files"
+STORAGE_PREFIX = "uploads"
+
+_sweep_lock = threading.Lock()
+_sweep_status: Dict[str, Any] = {"state": "idle"}
+
+
+def get_sweep_status() -> Dict[str, Any]:
+    """Progress of the current or most recent sweep"""
+    return dict(_sweep_status)
+
+
+def _iter_supabase_file_ids(page_size: int = SWEEP_PAGE_SIZE) -> Iterator[str]:
+    """All file ids in ascending order, paged by keyset on id"""
+    from supabase_client import supabase
+
+    last_id = None
+    while True:
+        query = supabase.table('files').select('id').order('id').limit(page_size)
+        if last_id:
+            query = query.gt('id', last_id)
+        rows = query.execute().data or []
+        for row in rows:
+            yield row['id']
+        if len(rows) < page_size:
+            return
+        last_id = rows[-1]['id']
+
+
+def _diff_sorted(es_terms: Iterable[Tuple[str, int]], live_ids: Iterable[str]) -> Iterator[Tuple[str, int]]:
+    """
+    (file_id, chunk_count) for ES file ids missing from Supabase
+
+    Both streams are ascending (canonical lowercase UUIDs sort the same as
+    Postgres uuid ordering), so one merge pass needs no set of all ids.
+    """
+    live = iter(live_ids)
+    current = next(live, None)
+    for term, count in es_terms:
+        while current is not None and current < term:
+            current = next(live, None)
+        if current != term:
+            yield term, count
+
+
+def _existing_file_ids(file_ids: List[str]) -> set:
+    """Re-check candidates: files created while the streams were read are not orphans"""
+    from supabase_client import supabase
+
+    existing = set()
+    for i in range(0, len(file_ids), 100):  # Keep the id list within URL length limits
+        rows = supabase.table('files').select('id').in_('id', file_ids[i:i + 100]).execute().data or []
+        existing.update(row['id'] for row in rows)
+    return existing
+
+
+def _wait_for_task(task_id: str):
+    while True:
+        task = get_delete_task(task_id)
+        if task.get("completed"):
+            return task
+        time.sleep(SWEEP_TASK_POLL_SECONDS)
+
+
+def _sweep_chunks(dry_run: bool) -> Dict[str, int]:
+    """Delete Elasticsearch chunks of files that no longer exist"""
+    orphan_files = 0
+    orphan_chunks = 0
+    batch: List[Tuple[str, int]] = []
+
+    def _flush(batch: List[Tuple[str, int]]):
+        nonlocal orphan_files, orphan_chunks
+        existing = _existing_file_ids([file_id for file_id, _ in batch])
+        orphans = [(file_id, count) for file_id, count in batch if file_id not in existing]
+        if not orphans:
+            return
+        orphan_files += len(orphans)
+        orphan_chunks += sum(count for _, count in orphans)
+        _sweep_status.update({"orphan_files": orphan_files, "orphan_chunks": orphan_chunks})
+        if dry_run:
+            return
+        task = _wait_for_task(delete_chunks_for_files([file_id for file_id, _ in orphans]))
+        _sweep_status["deleted_chunks"] = _sweep_status.get("deleted_chunks", 0) + task.get("deleted", 0)
+        time.sleep(SWEEP_BATCH_PAUSE_SECONDS)
+
+    for orphan in _diff_sorted(iter_term_counts("file_id", SWEEP_PAGE_SIZE), _iter_supabase_file_ids()):
+        batch.append(orphan)
+        if len(batch) >= SWEEP_DELETE_BATCH:
+            _flush(batch)
+            batch = []
+    if batch:
+        _flush(batch)
+
+    return {"orphan_files": orphan_files, "orphan_chunks": orphan_chunks}
+
+
+def _list_storage(path: str) -> Iterator[Dict[str, Any]]:
+    """Entries of a storage folder, paged"""
+    from supabase_client import supabase
+
+    offset = 0
+    while True:
+        entries = supabase.storage.from_(STORAGE_BUCKET).list(
+            path, {"limit": SWEEP_PAGE_SIZE, "offset": offset, "sortBy": {"column": "name", "order": "asc"}}
+        ) or []
+        yield from entries
+        if len(entries) < SWEEP_PAGE_SIZE:
+            return
+        offset += len(entries)
+
+
+def _object_age_seconds(entry: Dict[str, Any]) -> float:
+    created_at = entry.get('created_at')
+    if not created_at:
+        return 0.0
+    created = datetime.fromisoformat(created_at.replace('Z', '+00:00'))
+    return (datetime.now(timezone.utc) - created).total_seconds()
+
+
+def _sweep_storage(dry_run: bool) -> Dict[str, int]:
+    """Delete storage objects (uploads/<user>/<object>) no file row points to"""
+    from supabase_client import supabase
+
+    orphan_objects = 0
+    orphan_bytes = 0
+
+    for folder in _list_storage(STORAGE_PREFIX):
+        if folder.get('id') is not None:
+            continue  # Not a user folder
+        user_id = folder['name']
+        prefix = f"{STORAGE_PREFIX}/{user_id}"
+        rows = supabase.table('files').select('file_path').eq('user_id', user_id).execute().data or []
+        live_paths = {row['file_path'] for row in rows}
+
+        orphans = []
+        for entry in _list_storage(prefix):
+            path = f"{prefix}/{entry['name']}"
+            if entry.get('id') is None or path in live_paths:
+                continue
+            # Uploads reach storage before their file row is inserted
+            if _object_age_seconds(entry) < SWEEP_GRACE_SECONDS:
+                continue
+            orphans.append(path)
+            orphan_bytes += (entry.get('metadata') or {}).get('size', 0) or 0
+
+        if not orphans:
+            continue
+        orphan_objects += len(orphans)
+        _sweep_status.update({"orphan_objects": orphan_objects, "orphan_bytes": orphan_bytes})
+        if not dry_run:
+            for i in range(0, len(orphans), 100):
+                supabase.storage.from_(STORAGE_BUCKET).remove(orphans[i:i + 100])
+            time.sleep(SWEEP_BATCH_PAUSE_SECONDS)
+
+    return {"orphan_objects": orphan_objects, "orphan_bytes": orphan_bytes}
+
+
+def sweep_orphans(dry_run: bool = False, include_storage: bool = True) -> Dict[str, Any]:
+    """
+    Find and delete orphaned Elasticsearch chunks and storage objects
+
+    Args:
+        dry_run: Only report what would be deleted
+        include_storage: Also reconcile the storage bucket
+
+    Returns:
+        Summary of what was found and reclaimed
+    """
+    if not _sweep_lock.acquire(blocking=False):
+        raise RuntimeError("An orphan sweep is already running")
+
+    try:
+        started = time.time()
+        _sweep_status.clear()
+        _sweep_status.update({
+            "state": "running",
+            "dry_run": dry_run,
+            "started_at": datetime.utcnow().isoformat() + "Z"
+        })
+        size_before = get_index_stats().get("index_size")
+
+        chunk_summary = _sweep_chunks(dry_run)
+        storage_summary = _sweep_storage(dry_run) if include_storage else {}
+
+        if chunk_summary["orphan_chunks"] and not dry_run:
+            # Per-user counts and cached answers may reflect the deleted chunks
+            import corpus_index
+            import response_cache
+            corpus_index.warm_up()
+            response_cache.invalidate_all()
+
+        _sweep_status.update({
+            **chunk_summary,
+            **storage_summary,
+            "state": "completed",
+            "index_size_before": size_before,
+            "index_size_after": get_index_stats().get("index_size"),
+            "duration_seconds": round(time.time() - started, 1)
+        })
+        logger.info(f"✅ Orphan sweep complete: {get_sweep_status()}")
+        return get_sweep_status()
+
+    except Exception as e:
+        logger.error(f"Orphan sweep failed: {e}")
+        _sweep_status.update({"state": "failed", "error": str(e)})
+        raise
+    finally:
+        _sweep_lock.release()
+
+
+if __name__ == "__main__":
+    import argparse
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Delete Elasticsearch chunks and storage objects of deleted files")
+    parser.add_argument('--dry-run', action='store_true', help='Only report orphans')
+    parser.add_argument('--skip-storage', action='store_true', help='Do not reconcile the storage bucket')
+    args = parser.parse_args()
+
+    from supabase_client import init_supabase
+    from elasticsearch_client import init_elasticsearch
+
+    init_supabase(os.environ["SUPABASE_URL"], os.environ["SUPABASE_SERVICE_ROLE_KEY"])
+
+    es_endpoint = os.getenv("ELASTICSEARCH_ENDPOINT")
+    es_cloud_id = os.getenv("ELASTICSEARCH_CLOUD_ID")
+    es_api_key = os.getenv("ELASTICSEARCH_API_KEY")
+    es_hosts = os.getenv("ELASTICSEARCH_HOSTS")
+
+    if es_endpoint and es_api_key:
+        init_elasticsearch(endpoint=es_endpoint, api_key=es_api_key)
+    elif es_cloud_id and es_api_key:
+        init_elasticsearch(cloud_id=es_cloud_id, api_key=es_api_key)
+    elif es_hosts:
+        init_elasticsearch(hosts=[h.strip() for h in es_hosts.split(',')])
+    else:
+        print("Elasticsearch is not configured")
+        sys.exit(1)
+
+    print(sweep_orphans(dry_run=args.dry_run, include_storage=not args.skip_storage))
@@ -0,0 +1,250 @@
+"""
+Output sanitizer for model replies
+Drops sentences that reveal where an answer came from, strips a leading
+"Hello <name>" salutation and collapses blank lines. Banned phrases are
+compiled into one prefix-factored alternation and matched in a single pass
+over the lowercased text; sentence boundaries are only computed when
+something matched.
+"""
+
+import os
+import re
+import bisect
+import logging
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PHRASES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'banned_phrases.txt')
+PHRASES_FILE = os.getenv("SANITIZER_PHRASES_FILE", DEFAULT_PHRASES_FILE)
+
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+")
+GREETING_PATTERN = re.compile(r"^\s*hello[\s,]+[\w .'-]+[:,-]?\s*", re.IGNORECASE)
+BLANK_LINES_PATTERN = re.compile(r"\n{3,}")
+
+
+def load_phrases(path: str = PHRASES_FILE) -> List[str]:
+    """Read banned phrases, one per line ('#' comments and blank lines ignored)"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return [line.strip() for line in f if line.strip() and not line.lstrip().startswith('#')]
+    except OSError as e:
+        logger.warning(f"Could not read banned phrases from {path}: {e}")
+        return []
+
+
+def _trie_pattern(phrases: List[str]) -> str:
+    """
+    Build a prefix-factored alternation, e.g. "from (?:supabase|the (?:database|document))"
+    Shared prefixes are matched once, so the regex engine behaves like a
+    keyword automaton instead of retrying every phrase at every position.
+    """
+    trie: dict = {}
+    for phrase in phrases:
+        node = trie
+        for ch in phrase:
+            node = node.setdefault(ch, {})
+        node[''] = {}
+
+    def build(node: dict) -> str:
+        alternatives = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not alternatives:
+            return ''
+        body = alternatives[0] if len(alternatives) == 1 else '(?:' + '|'.join(alternatives) + ')'
+        return f'(?:{body})?' if '' in node else body
+
+    return build(trie)
+
+
+def compile_phrases(phrases: List[str]) -> Optional[re.Pattern]:
+    """Compile lowercase phrases into a single trie-shaped alternation"""
+    phrases = sorted({p.lower() for p in phrases if p})
+    if not phrases:
+        return None
+    return re.compile(_trie_pattern(phrases))
+
+
+class OutputSanitizer:
+    """
+    Reusable sanitizer built once from a phrase list
+
+    Args:
+        phrases: Banned phrases (defaults to the phrases file)
+    """
+
+    def __init__(self, phrases: Optional[List[str]] = None):
+        self.phrases = load_phrases() if phrases is None else phrases
+        self.pattern = compile_phrases(self.phrases)
+        # Matching runs on lowercased text; this variant covers the rare case
+        # where lowercasing changes the text length and offsets would shift
+        self.pattern_ignorecase = re.compile(self.pattern.pattern, re.IGNORECASE) if self.pattern else None
+
+    def split_banned(self, text: str) -> Optional[List[Tuple[str, bool]]]:
+        """
+        Split text into (sentence with its trailing whitespace, is banned) pairs
+
+        Returns:
+            The pairs, or None when no banned phrase occurs (no split is done)
+        """
+        if self.pattern is None:
+            return None
+        haystack = text.lower()
+        pattern = self.pattern
+        if len(haystack) != len(text):
+            haystack, pattern = text, self.pattern_ignorecase
+        first = pattern.search(haystack)
+        if first is None:
+            return None
+
+        # Sentence spans as (start, end) where end includes the trailing whitespace
+        boundaries = [m.end() for m in SENTENCE_BOUNDARY.finditer(text)]
+        starts = [0] + boundaries
+        ends = boundaries + [len(text)]
+
+        dropped = set()
+        match = first
+        while match is not None:
+            sentence = bisect.bisect_right(starts, match.start()) - 1
+            dropped.add(sentence)
+            # Continue scanning after this sentence; it is already dropped
+            match = pattern.search(haystack, ends[sentence])
+
+        return [(text[starts[i]:ends[i]], i in dropped) for i in range(len(starts)) if starts[i] < ends[i]]
+
+    def drop_banned_sentences(self, text: str) -> str:
+        """Remove every sentence that contains a banned phrase"""
+        sentences = self.split_banned(text)
+        if sentences is None:
+            return text
+        return "".join(sentence for sentence, banned in sentences if not banned).strip()
+
+    def sanitize(self, text: str) -> str:
+        """Full sanitization of a complete reply"""
+        text = (text or "").strip()
+        text = self.drop_banned_sentences(text) or text
+        text = GREETING_PATTERN.sub("", text, count=1)
+        return BLANK_LINES_PATTERN.sub("\n\n", text).strip()
+
+    def stream(self) -> "StreamSanitizer":
+        """Incremental sanitizer for a streamed reply"""
+        return StreamSanitizer(self)
+
+
+class StreamSanitizer:
+    """
+    Sanitizes a reply chunk by chunk
+
+    Complete sentences are released as soon as their boundary arrives; the
+    trailing partial sentence is held back until more text or flush().
+    Whitespace after a kept sentence is only emitted in front of the next kept
+    text, so the concatenated output equals sanitize() of the whole reply.
+    """
+
+    def __init__(self, sanitizer: OutputSanitizer):
+        self.sanitizer = sanitizer
+        self._buffer = ""
+        self._whitespace = ""  # Held after the last emitted sentence
+        self._last_kept = False  # Whether the last released sentence was kept
+        self._unsent = ""  # Raw text released before anything was emitted
+        self._started = False
+
+    def feed(self, chunk: str) -> str:
+        """Add streamed text and return the part that is safe to emit"""
+        self._buffer += chunk
+        last_boundary = None
+        for last_boundary in SENTENCE_BOUNDARY.finditer(self._buffer):
+            pass
+        if last_boundary is None:
+            return ""
+
+        ready, self._buffer = self._buffer[:last_boundary.end()], self._buffer[last_boundary.end():]
+        return self._emit(ready)
+
+    def flush(self) -> str:
+        """Emit whatever is left at the end of the stream"""
+        ready, self._buffer = self._buffer, ""
+        emitted = self._emit(ready)
+        if not self._started and self._unsent.strip():
+            # Every sentence was dropped: fall back to the whole reply, as sanitize() does
+            return self.sanitizer.sanitize(self._unsent)
+        return emitted
+
+    def _emit(self, text: str) -> str:
+        if not self._started:
+            self._unsent += text
+        body = text.lstrip()
+        if not body:
+            return ""
+        # Leading whitespace (a chunk split inside a blank-line run) ends the previous sentence
+        if self._last_kept:
+            self._whitespace += text[:len(text) - len(body)]
+
+        sentences = self.sanitizer.split_banned(body) or [(body, False)]
+        self._last_kept = not sentences[-1][1]
+        kept = "".join(sentence for sentence, banned in sentences if not banned)
+        content = kept.rstrip()
+        trailing = kept[len(content):]
+        if not self._started:
+            content = GREETING_PATTERN.sub("", content, count=1)
+            if not content:
+                return ""
+            self._started, self._unsent, self._whitespace = True, "", ""
+        elif not content:
+            return ""
+
+        released = BLANK_LINES_PATTERN.sub("\n\n", self._whitespace + content)
+        self._whitespace = trailing
+        return released
+
+
+_default_sanitizer: Optional[OutputSanitizer] = None
+
+
+def get_sanitizer() -> OutputSanitizer:
+    """Shared sanitizer built from the phrases file (singleton pattern)"""
+    global _default_sanitizer
+    if _default_sanitizer is None:
+        _default_sanitizer = OutputSanitizer()
+    return _default_sanitizer
+
+
+def reload_phrases():
+    """Rebuild the shared sanitizer after editing the phrases file"""
+    global _default_sanitizer
+    _default_sanitizer = OutputSanitizer()
+    logger.info(f"Reloaded {len(_default_sanitizer.phrases)} banned phrases")
+
+
+def sanitize(text: str) -> str:
+    return get_sanitizer().sanitize(text)
+
+
+if __name__ == "__main__":
+    # Micro-benchmark against the previous per-sentence implementation
+    import timeit
+
+    phrases = load_phrases()
+
+    def legacy_sanitize(text: str) -> str:
+        sentences = re.split(r"(?<=[.!?])\s+", text)
+        cleaned = [s for s in sentences if not any(k in s.lower() for k in phrases)]
+        text = " ".join(cleaned).strip() or text
+        text = re.sub(r"^\s*hello[\s,]+[\w .'-]+[:,-]?\s*", "", text, flags=re.IGNORECASE)
+        return re.sub(r"\n{3,}", "\n\n", text).strip()
+
+    clean_reply = ("The project deadline is March 14. Submissions go through the portal. "
+                   "Late work loses ten percent per day.\n\n") * 20
+    dirty_reply = clean_reply + "Based on the document you uploaded, the deadline is firm. Good luck!"
+
+    sanitizer = OutputSanitizer(phrases)
+    for label, reply in (("clean", clean_reply), ("with banned phrase", dirty_reply)):
+        legacy = timeit.timeit(lambda: legacy_sanitize(reply), number=2000)
+        current = timeit.timeit(lambda: sanitizer.sanitize(reply), number=2000)
+        print(f"{label:>20}: legacy {legacy * 500:.1f}us  compiled {current * 500:.1f}us  "
+              f"({legacy / current:.1f}x)")
+
+    stream = sanitizer.stream()
+    pieces = [stream.feed(dirty_reply[i:i + 37]) for i in range(0, len(dirty_reply), 37)]
+    pieces.append(stream.flush())
+    assert "document" not in "".join(pieces).lower()
+    print("streamed output matches:", "".join(pieces).strip() == sanitizer.sanitize(dirty_reply))
@@ -0,0 +1,126 @@
+"""
+Prompt assembly for chat turns
+One layout with optional sections. The static prefix (system prompt + site
+UI context) always comes first and is rendered once per distinct UI context,
+so consecutive requests share a byte-identical prefix that Gemini can cache.
+"""
+
+import hashlib
+import logging
+from typing import Any, Dict, List, Optional
+
+from context_packing import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# System prompt to define AI behavior (silent RAG)
+SYSTEM_PROMPT = """You are a helpful AI assistant. Be polite, professional, and helpful.
+Only use any provided context internally to craft the most accurate and natural answer.
+Do not mention, imply, or speculate about where information came from (e.g., documents, files, databases, storage, Supabase, or pages).
+Do not say things like "based on the document", "from the database", or cite filenames/pages.
+If the answer is unknown, say so briefly and suggest what would be needed.
+Keep responses concise and natural.
+"""
+
+# System prompt for questions about an uploaded image
+VISION_SYSTEM_PROMPT = """You are a helpful AI assistant with vision capabilities.
+Analyze the provided image carefully and answer the user's question accurately.
+Be descriptive and specific about what you see in the image.
+If you cannot determine something from the image, say so clearly.
+Keep responses natural and conversational.
+"""
+
+SITE_CONTEXT_HEADER = "Website information for internal use only (do not mention its existence in the answer):\n"
+FILE_CONTEXT_HEADER = "Context for internal use only (do not mention its existence in the answer):\n"
+
+# Rendered prefixes keyed by (system prompt, ui context); tiny, bounded by distinct UI contexts
+_prefix_cache: Dict[tuple, Dict[str, Any]] = {}
+
+
+def get_static_prefix(ui_context: Optional[str] = None, system_prompt: str = SYSTEM_PROMPT) -> Dict[str, Any]:
+    """
+    Render (once) the request-independent start of every prompt
+
+    Returns:
+        {"text": prefix, "hash": sha1 of the prefix, "tokens": estimated tokens}
+    """
+    key = (system_prompt, ui_context or "")
+    prefix = _prefix_cache.get(key)
+    if prefix is None:
+        text = system_prompt
+        if ui_context:
+            text += f"\n{SITE_CONTEXT_HEADER}{ui_context}\n"
+        prefix = {
+            "text": text,
+            "hash": hashlib.sha1(text.encode('utf-8')).hexdigest(),
+            "tokens": estimate_tokens(text)
+        }
+        if len(_prefix_cache) > 16:
+            _prefix_cache.clear()
+        _prefix_cache[key] = prefix
+    return prefix
+
+
+def build_chat_prompt(
+    message: str,
+    history: Optional[List[Dict[str, Any]]] = None,
+    user_name: Optional[str] = None,
+    file_context: Optional[List[Dict[str, Any]]] = None,
+    ui_context: Optional[str] = None,
+    system_prompt: str = SYSTEM_PROMPT,
+    message_label: str = "Current message"
+) -> Dict[str, Any]:
+    """
+    Assemble the prompt for a chat turn
+
+    Args:
+        message: Current user message
+        history: Previous messages (role/content dicts), oldest first
+        user_name: User's display name
+        file_context: Packed retrieval passages
+        ui_context: Site awareness text (part of the cacheable prefix)
+        system_prompt: Instructions placed at the very start
+        message_label: Label for the current message line
+
+    Returns:
+        {"prefix": static part, "dynamic": per-request part, "text": full prompt,
+         "prefix_hash": str, "tokens": estimated tokens per section}
+    """
+    prefix = get_static_prefix(ui_context, system_prompt)
+
+    # Dynamic sections, in a fixed order; empty ones are simply skipped
+    user_line = f"The user's name is {user_name}.\n" if user_name else ""
+
+    history_text = ""
+    if history:
+        lines = [
+            f"{'Assistant' if m['role'] == 'assistant' else 'User'}: {m['content']}"
+            for m in history
+        ]
+        history_text = "Previous conversation:\n" + "\n".join(lines) + "\n"
+
+    files_text = ""
+    if file_context:
+        # Do not include filename/page or similarity hints to avoid leakage
+        files_text = FILE_CONTEXT_HEADER + "".join(f"---\n{c.get('content', '')}\n" for c in file_context)
+
+    message_text = f"{message_label}: {message}"
+
+    dynamic = "\n".join(part for part in (user_line, history_text, files_text, message_text) if part)
+    tokens = {
+        "prefix": prefix["tokens"],
+        "user": estimate_tokens(user_line),
+        "history": estimate_tokens(history_text),
+        "files": estimate_tokens(files_text),
+        "message": estimate_tokens(message_text),
+    }
+    tokens["total"] = sum(tokens.values())
+
+    logger.debug("Prompt tokens by section: %s", tokens)
+    return {
+        "prefix": prefix["text"],
+        "dynamic": dynamic,
+        "text": f"{prefix['text']}\n{dynamic}",
+        "prefix_hash": prefix["hash"],
+        "tokens": tokens
+    }
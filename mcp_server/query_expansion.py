@@ -0,0 +1,174 @@
+"""
+Multi-query retrieval with optional query expansion
+Expansion runs alongside the original-query search instead of before it,
+expansions are cached per user, normalized query and conversation turn, and a local pseudo-relevance
+feedback mode expands without any LLM call. Result lists are merged with
+reciprocal rank fusion.
+"""
+
+import os
+import re
+import json
+import asyncio
+import hashlib
+import logging
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from tools import file_tools
+from ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# "off", "llm" (Gemini paraphrases) or "local" (pseudo-relevance feedback from ES)
+QUERY_EXPANSION_MODE = os.getenv("QUERY_EXPANSION", "off").lower()
+EXPANSION_TIMEOUT_SECONDS = float(os.getenv("QUERY_EXPANSION_TIMEOUT", "2.0"))
+PRF_DOCS = 3  # Top first-pass hits used as feedback
+PRF_TERMS = 5  # Salient terms appended to the query
+PRF_BETA = 0.5  # Weight of the feedback centroid in the expanded vector
+RRF_K = 60
+
+_expansion_cache = TTLCache(maxsize=5000, ttl=24 * 3600, name="query_expansions")
+
+_STOPWORDS = set("""
+a an and are as at be been but by can could did do does for from had has have how i if in into is it its
+me my no not of on or our so that the their them then there these they this to was we were what when where
+which who why will with would you your about also more than other some such only just any each very
+""".split())
+_TOKEN_PATTERN = re.compile(r"[a-z][a-z0-9'-]{2,}")
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+
+def reciprocal_rank_fusion(result_lists: List[List[Dict[str, Any]]], limit: int) -> List[Dict[str, Any]]:
+    """
+    Merge ranked result lists by summing 1 / (k + rank) per chunk id
+
+    Returns:
+        Fused results, best first, with 'similarity_score' set to the fused score
+    """
+    fused: Dict[str, Dict[str, Any]] = {}
+    scores: Counter = Counter()
+    for results in result_lists:
+        for rank, result in enumerate(results):
+            scores[result['id']] += 1.0 / (RRF_K + rank + 1)
+            fused.setdefault(result['id'], result)
+
+    merged = []
+    for chunk_id, score in scores.most_common(limit):
+        result = dict(fused[chunk_id])
+        result['first_stage_score'] = result.get('similarity_score')
+        result['similarity_score'] = score
+        merged.append(result)
+    return merged
+
+
+def _history_digest(chat_history: Optional[List[Dict]]) -> str:
+    """Digest of the turns the expansion prompt sees (a follow-up expands differently per conversation)"""
+    turns = [(msg.get('role'), msg.get('content')) for msg in chat_history or []]
+    return hashlib.sha1(json.dumps(turns, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+async def _llm_expansions(query: str, user_id: str, chat_history: Optional[List[Dict]]) -> List[str]:
+    """Paraphrases of the query from Gemini, cached per user, normalized query and history slice"""
+    normalized = normalize_query(query)
+    key = (user_id, normalized, _history_digest(chat_history))
+    cached = _expansion_cache.get(key)
+    if cached is not None:
+        return cached
+
+    from ai_client import expand_query
+    expansions = [q for q in await expand_query(query, chat_history) if normalize_query(q) != normalized]
+    _expansion_cache.set(key, expansions)
+    return expansions
+
+
+def _feedback_terms(query: str, results: List[Dict[str, Any]]) -> List[str]:
+    """Most frequent informative terms of the top hits that are not already in the query"""
+    query_terms = set(_TOKEN_PATTERN.findall(query.lower()))
+    counts: Counter = Counter()
+    for result in results:
+        for term in set(_TOKEN_PATTERN.findall((result.get('content') or '').lower())):
+            if term not in _STOPWORDS and term not in query_terms:
+                counts[term] += 1
+    return [term for term, count in counts.most_common(PRF_TERMS) if count > 1]
+
+
+def _feedback_vector(query_vector: List[float], results: List[Dict[str, Any]]) -> Optional[List[float]]:
+    """Rocchio-style vector: query moved towards the centroid of the top hits"""
+    embeddings = [r['embedding'] for r in results if r.get('embedding')]
+    if not embeddings or query_vector is None:
+        return None
+    vec = np.asarray(query_vector, dtype=np.float32) + PRF_BETA * np.mean(np.asarray(embeddings, dtype=np.float32), axis=0)
+    norm = np.linalg.norm(vec)
+    return (vec / norm if norm else vec).tolist()
+
+
+async def retrieve(
+    query: str,
+    user_id: str,
+    limit: int,
+    query_vector: Optional[List[float]] = None,
+    chat_history: Optional[List[Dict]] = None,
+    mode: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """
+    Retrieve chunks for a query, optionally fusing in expanded queries
+
+    Args:
+        query: User message
+        user_id: Firebase user ID
+        limit: Number of results
+        query_vector: Precomputed embedding of the query
+        chat_history: Recent conversation (used by LLM expansion)
+        mode: Overrides QUERY_EXPANSION_MODE
+
+    Returns:
+        Chunks (with embeddings, for context packing)
+    """
+    mode = (mode or QUERY_EXPANSION_MODE).lower()
+
+    def _search(text: str, vector: Optional[List[float]] = None) -> List[Dict[str, Any]]:
+        return file_tools.search_similar_chunks(
+            text, user_id, limit=limit, query_vector=vector, include_embeddings=True
+        )
+
+    if mode == "local" and query_vector is None:
+        query_vector = await asyncio.to_thread(file_tools.generate_embedding, query)
+
+    original_task = asyncio.create_task(asyncio.to_thread(_search, query, query_vector))
+
+    if mode == "llm":
+        try:
+            expansions = await asyncio.wait_for(
+                _llm_expansions(query, user_id, (chat_history or [])[-3:]),
+                timeout=EXPANSION_TIMEOUT_SECONDS
+            )
+        except Exception as e:
+            logger.warning(f"Query expansion skipped: {type(e).__name__}: {e}")
+            expansions = []
+        expanded_results = await asyncio.gather(*(asyncio.to_thread(_search, q) for q in expansions))
+        original = await original_task
+        if not expanded_results:
+            return original
+        logger.debug("Fusing results of %d LLM query expansions", len(expansions))
+        return reciprocal_rank_fusion([original, *expanded_results], limit)
+
+    original = await original_task
+
+    if mode == "local" and len(original) >= 2:
+        feedback = original[:PRF_DOCS]
+        terms = _feedback_terms(query, feedback)
+        vector = _feedback_vector(query_vector, feedback)
+        if not terms and vector is None:
+            return original
+        expanded_query = f"{query} {' '.join(terms)}".strip()
+        expanded = await asyncio.to_thread(_search, expanded_query, vector)
+        logger.debug("Fusing pseudo-relevance feedback results (terms: %s)", terms)
+        return reciprocal_rank_fusion([original, expanded], limit)
+
+    return original
@@ -0,0 +1,236 @@
+"""
+Blue/green re-embedding of the documents index
+Builds a new versioned index for a different embedding model from the chunk
+text already stored in Elasticsearch, then swaps the documents alias to it.
+Search keeps serving from the old index until the swap.
+
+Run it through POST /admin/index/reindex on a live deployment: the server then
+switches its query model in the same step as the alias swap. The CLI is for
+offline use (server stopped, or restarted right after the swap).
+"""
+
+import os
+import sys
+import time
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional
+
+from elasticsearch import helpers
+
+import response_cache
+from embedding_models import EMBEDDING_MODEL_NAME, get_embedding_dim, index_name_for
+from elasticsearch_client import (
+    get_elasticsearch_client,
+    get_active_index,
+    create_documents_index,
+    swap_documents_alias,
+    bulk_index_chunks,
+    delete_chunks_by_ids,
+)
+
+logger = logging.getLogger(__name__)
+
+SOURCE_FIELDS = ["chunk_id", "file_id", "user_id", "content", "chunk_index", "page_number", "filename", "created_at"]
+SWAP_SETTLE_SECONDS = 2.0  # Lets writes already routed to the old index land before the delta pass
+
+_reindex_lock = threading.Lock()
+_reindex_status: Dict[str, Any] = {"state": "idle"}
+
+
+def get_reindex_status() -> Dict[str, Any]:
+    """Progress of the current or most recent re-embed job"""
+    return dict(_reindex_status)
+
+
+def _batched(docs: Iterable[Dict[str, Any]], size: int) -> Iterable[List[Dict[str, Any]]]:
+    batch: List[Dict[str, Any]] = []
+    for doc in docs:
+        batch.append(doc)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _copy_chunks(model, source_index: str, target_index: str, query: Dict[str, Any], batch_size: int) -> int:
+    """Stream chunks from the source index, re-embed them in batches and bulk index them"""
+    es = get_elasticsearch_client()
+    hits = helpers.scan(es, index=source_index, query={"query": query}, _source=SOURCE_FIELDS, size=batch_size)
+    copied = 0
+
+    for batch in _batched((hit["_source"] for hit in hits), batch_size):
+        embeddings = model.encode(
+            [doc.get("content") or "" for doc in batch],
+            batch_size=batch_size,
+            convert_to_numpy=True,
+            normalize_embeddings=True
+        )
+        for doc, emb in zip(batch, embeddings):
+            doc["embedding"] = emb.tolist()
+        copied += bulk_index_chunks(batch, index_name=target_index)
+        _reindex_status["copied"] = _reindex_status.get("copied", 0) + len(batch)
+
+    return copied
+
+
+def _propagate_deletes(source_index: str, target_index: str, copied_before: str, batch_size: int = 1000) -> int:
+    """
+    Delete copied chunks that were deleted from the source index during the copy
+
+    Only target documents created before `copied_before` are checked; newer ones
+    were written to the target directly after the swap.
+    """
+    es = get_elasticsearch_client()
+    hits = helpers.scan(
+        es, index=target_index, size=batch_size, _source=False,
+        query={"query": {"range": {"created_at": {"lt": copied_before}}}}
+    )
+    removed = 0
+    for batch in _batched((hit["_id"] for hit in hits), batch_size):
+        docs = es.mget(index=source_index, ids=batch, _source=False)["docs"]
+        gone = [doc["_id"] for doc in docs if not doc.get("found")]
+        if gone:
+            removed += delete_chunks_by_ids(gone, index_name=target_index)
+    return removed
+
+
+def reindex_embeddings(model_name: Optional[str] = None, batch_size: int = 64, delete_old: bool = False) -> Dict[str, Any]:
+    """
+    Re-embed every chunk with a new model and swap the documents alias to it
+
+    Args:
+        model_name: Target embedding model (defaults to EMBEDDING_MODEL_NAME)
+        batch_size: Chunks encoded and bulk indexed per batch
+        delete_old: Delete the previous index after the swap (kept for rollback by default)
+
+    Returns:
+        Summary of the job
+    """
+    if not _reindex_lock.acquire(blocking=False):
+        raise RuntimeError("A reindex job is already running")
+
+    try:
+        from embeddings import load_embedding_model, set_embedding_model
+
+        model_name = model_name or EMBEDDING_MODEL_NAME
+        source_index = get_active_index()
+        target_index = index_name_for(model_name)
+        if source_index == target_index:
+            raise ValueError(f"Index '{target_index}' is already live for model {model_name}")
+
+        _reindex_status.clear()
+        _reindex_status.update({
+            "state": "running",
+            "model": model_name,
+            "source_index": source_index,
+            "target_index": target_index,
+            "copied": 0,
+            "started_at": datetime.utcnow().isoformat() + "Z"
+        })
+        started = time.time()
+        logger.info(f"Re-embedding {source_index} -> {target_index} with {model_name} ({get_embedding_dim(model_name)} dims)")
+
+        model = load_embedding_model(model_name)
+        create_documents_index(model_name, attach_alias=False)
+
+        es = get_elasticsearch_client()
+        copied = 0
+        catch_up_started = None
+        if source_index:
+            # Full pass, then a catch-up pass for chunks uploaded while the full pass ran
+            pass_started = datetime.utcnow() - timedelta(seconds=5)
+            copied += _copy_chunks(model, source_index, target_index, {"match_all": {}}, batch_size)
+            es.indices.refresh(index=source_index)
+            catch_up_started = datetime.utcnow() - timedelta(seconds=5)
+            copied += _copy_chunks(
+                model, source_index, target_index,
+                {"range": {"created_at": {"gte": pass_started.isoformat() + "Z"}}},
+                batch_size
+            )
+
+        es.indices.refresh(index=target_index)
+        old_index = swap_documents_alias(target_index)
+        set_embedding_model(model_name, model)
+        _reindex_status["swapped_at"] = datetime.utcnow().isoformat() + "Z"
+
+        if source_index:
+            # Writes that reached the old index after the catch-up pass, and deletes made
+            # there during the copy; the source no longer receives either after the swap
+            time.sleep(SWAP_SETTLE_SECONDS)
+            es.indices.refresh(index=source_index)
+            copied += _copy_chunks(
+                model, source_index, target_index,
+                {"range": {"created_at": {"gte": catch_up_started.isoformat() + "Z"}}},
+                batch_size
+            )
+            _reindex_status["deleted_after_copy"] = _propagate_deletes(
+                source_index, target_index, _reindex_status["swapped_at"]
+            )
+
+        # Answers cached before or during the swap were retrieved from the old index
+        response_cache.invalidate_all()
+
+        if delete_old and old_index:
+            get_elasticsearch_client().indices.delete(index=old_index)
+            logger.info(f"Deleted previous index {old_index}")
+
+        _reindex_status.update({
+            "state": "completed",
+            "previous_index": old_index,
+            "duration_seconds": round(time.time() - started, 1)
+        })
+        logger.info(f"✅ Re-embed complete: {copied} chunks in {_reindex_status['duration_seconds']}s")
+        return get_reindex_status()
+
+    except Exception as e:
+        logger.error(f"Re-embed failed: {e}")
+        _reindex_status.update({"state": "failed", "error": str(e)})
+        raise
+    finally:
+        _reindex_lock.release()
+
+
+if __name__ == "__main__":
+    import argparse
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Re-embed the documents index with a new model and swap the alias")
+    parser.add_argument('--model', default=EMBEDDING_MODEL_NAME, help='Target embedding model')
+    parser.add_argument('--batch-size', type=int, default=64, help='Chunks encoded per batch')
+    parser.add_argument('--delete-old', action='store_true', help='Delete the previous index after the swap')
+    parser.add_argument('--offline', action='store_true',
+                        help='Confirm no server is running (or it is restarted after the swap)')
+    args = parser.parse_args()
+
+    if not args.offline:
+        # A running server would keep embedding queries and uploads with the old model
+        print("⚠️  On a live deployment use POST /admin/index/reindex, which switches the server's")
+        print("    query model together with the alias swap. Pass --offline if the server is stopped")
+        print("    or will be restarted right after this job.")
+        sys.exit(1)
+
+    from elasticsearch_client import init_elasticsearch
+
+    es_endpoint = os.getenv("ELASTICSEARCH_ENDPOINT")
+    es_cloud_id = os.getenv("ELASTICSEARCH_CLOUD_ID")
+    es_api_key = os.getenv("ELASTICSEARCH_API_KEY")
+    es_hosts = os.getenv("ELASTICSEARCH_HOSTS")
+
+    if es_endpoint and es_api_key:
+        init_elasticsearch(endpoint=es_endpoint, api_key=es_api_key)
+    elif es_cloud_id and es_api_key:
+        init_elasticsearch(cloud_id=es_cloud_id, api_key=es_api_key)
+    elif es_hosts:
+        init_elasticsearch(hosts=[h.strip() for h in es_hosts.split(',')])
+    else:
+        print("⚠️  Elasticsearch configuration not found in .env")
+        sys.exit(1)
+
+    print(reindex_embeddings(args.model, batch_size=args.batch_size, delete_old=args.delete_old))
@@ -0,0 +1,164 @@
+"""
+Semantic response cache
+Returns a previous answer when a user asks a near-identical question at the
+same point of a conversation (same preceding turn) and their documents have
+not changed since that answer was generated. Off unless RESPONSE_CACHE_ENABLED
+is set.
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+import logging
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "false").lower() == "true"
+RESPONSE_CACHE_THRESHOLD = float(os.getenv("RESPONSE_CACHE_THRESHOLD", "0.95"))  # Cosine similarity
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))  # Seconds
+MAX_ENTRIES_PER_USER = 50
+MIN_QUERY_WORDS = 3  # "why?" / "and then?" depend on the conversation, never cache them
+CONTEXT_MESSAGES = 2  # Trailing history messages (the last exchange) an answer is tied to
+
+# user_id -> list of {"embedding", "context", "answer", "corpus_version", "expires_at"}
+_user_entries = TTLCache(maxsize=10000, ttl=RESPONSE_CACHE_TTL, name="response_cache_users")
+# user_id -> corpus version, bumped whenever the user's files change. Outlives the
+# entries it guards; an evicted version only makes in-flight store() calls miss
+_corpus_versions = TTLCache(maxsize=100000, ttl=RESPONSE_CACHE_TTL * 2, name="response_cache_versions")
+# Bumped when shared context (site awareness) changes
+_global_version = 0
+_lock = threading.Lock()
+
+_stats = {"hits": 0, "misses": 0}
+
+
+def _normalize(embedding: List[float]) -> np.ndarray:
+    vec = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm else vec
+
+
+def _context_digest(chat_history: Optional[List[Dict]]) -> str:
+    """Digest of the exchange preceding the question"""
+    tail = [(msg.get('role'), msg.get('content')) for msg in (chat_history or [])[-CONTEXT_MESSAGES:]]
+    return hashlib.sha1(json.dumps(tail, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def is_cacheable(message: str) -> bool:
+    """Whether a message is self-contained enough to answer from cache"""
+    return RESPONSE_CACHE_ENABLED and len(message.split()) >= MIN_QUERY_WORDS
+
+
+def get_corpus_version(user_id: str) -> tuple:
+    """Current version of a user's corpus (capture before retrieval, pass to store())"""
+    return (_global_version, _corpus_versions.get(user_id, 0))
+
+
+def lookup(user_id: str, query_embedding: List[float], chat_history: Optional[List[Dict]] = None) -> Optional[str]:
+    """
+    Find a cached answer for a semantically equivalent question
+
+    Args:
+        user_id: User UUID
+        query_embedding: Embedding of the current question
+        chat_history: Conversation so far; only answers given after the same
+            last exchange are reused
+
+    Returns:
+        Cached answer, or None on a miss
+    """
+    if not RESPONSE_CACHE_ENABLED:
+        return None
+
+    entries = _user_entries.get(user_id)
+    if not entries:
+        _stats["misses"] += 1
+        return None
+
+    query_vec = _normalize(query_embedding)
+    version = get_corpus_version(user_id)
+    context = _context_digest(chat_history)
+    now = time.time()
+
+    best_score, best_answer = 0.0, None
+    for entry in entries:
+        if entry["corpus_version"] != version or entry["context"] != context or entry["expires_at"] < now:
+            continue
+        score = float(np.dot(query_vec, entry["embedding"]))
+        if score > best_score:
+            best_score, best_answer = score, entry["answer"]
+
+    if best_answer is not None and best_score >= RESPONSE_CACHE_THRESHOLD:
+        _stats["hits"] += 1
+        logger.debug("Response cache hit for user %s (similarity %.3f)", user_id, best_score)
+        return best_answer
+
+    _stats["misses"] += 1
+    return None
+
+
+def store(
+    user_id: str,
+    query_embedding: List[float],
+    answer: str,
+    corpus_version: tuple,
+    chat_history: Optional[List[Dict]] = None
+):
+    """
+    Cache an answer for a user's question
+
+    Args:
+        user_id: User UUID
+        query_embedding: Embedding of the question
+        answer: Generated answer
+        corpus_version: Value of get_corpus_version() taken before retrieval;
+            the entry is dropped if the corpus changed while generating
+        chat_history: Conversation the answer was generated in (as passed to lookup())
+    """
+    if not RESPONSE_CACHE_ENABLED or not answer:
+        return
+    if corpus_version != get_corpus_version(user_id):
+        return
+
+    with _lock:
+        entries = [e for e in (_user_entries.get(user_id) or []) if e["expires_at"] >= time.time()]
+        entries.append({
+            "embedding": _normalize(query_embedding),
+            "context": _context_digest(chat_history),
+            "answer": answer,
+            "corpus_version": corpus_version,
+            "expires_at": time.time() + RESPONSE_CACHE_TTL
+        })
+        _user_entries.set(user_id, entries[-MAX_ENTRIES_PER_USER:])
+
+
+def invalidate_user(user_id: str):
+    """Drop a user's cached answers; call whenever their files are uploaded or deleted"""
+    with _lock:
+        _corpus_versions.set(user_id, _corpus_versions.get(user_id, 0) + 1)
+        _user_entries.pop(user_id)
+
+
+def invalidate_all():
+    """Drop every cached answer; call when shared context (site awareness, the index) changes"""
+    global _global_version
+    with _lock:
+        _global_version += 1
+        _user_entries.clear()
+
+
+def get_stats() -> Dict[str, float]:
+    total = _stats["hits"] + _stats["misses"]
+    return {
+        "hits": _stats["hits"],
+        "misses": _stats["misses"],
+        "hit_ratio": round(_stats["hits"] / total, 4) if total else 0.0,
+        "users": len(_user_entries)
+    }
@@ -0,0 +1,124 @@
+"""
+Retrieval routing
+Decides before retrieval whether a chat turn can benefit from the user's
+documents, so users without documents and greetings or thanks skip the
+embedding search and Elasticsearch round-trip. Questions that merely sound
+like site questions ("how much does it cost") still search, since the
+user's own documents may answer them.
+"""
+
+import os
+import re
+import logging
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+import corpus_index
+from metrics import ROUTE_DECISIONS, ROUTE_INTENT_SCORE, chat_stage
+from tools import file_tools
+
+logger = logging.getLogger(__name__)
+
+ROUTER_ENABLED = os.getenv("RETRIEVAL_ROUTER_ENABLED", "true").lower() == "true"
+INTENT_THRESHOLD = float(os.getenv("RETRIEVAL_ROUTER_THRESHOLD", "0.8"))  # Cosine to an intent prototype
+
+# Whole-message small talk, decided without any model call
+SMALLTALK_PATTERN = re.compile(
+    r"^\s*(hi|hii+|hello|hey|yo|hiya|good (morning|afternoon|evening|night)|thanks?( you)?( so much| a lot)?|"
+    r"thx|ty|ok(ay)?|k|cool|great|nice|awesome|perfect|got it|sure|yes|no|yep|nope|bye|goodbye|see (you|ya)|"
+    r"lol|haha+)\s*[!.?,:)\s]*$",
+    re.IGNORECASE
+)
+
+# Example messages per intent that never need the user's documents
+INTENT_PROTOTYPES = {
+    'smalltalk': [
+        "how are you doing today",
+        "thank you for your help",
+        "who are you",
+        "what can you do",
+        "tell me a joke",
+    ],
+}
+
+_prototype_vectors: Optional[Dict[str, np.ndarray]] = None
+
+
+def _get_prototype_vectors() -> Dict[str, np.ndarray]:
+    """Embed the intent prototypes once (normalized row matrices per intent)"""
+    global _prototype_vectors
+    if _prototype_vectors is None:
+        vectors = {}
+        for intent, examples in INTENT_PROTOTYPES.items():
+            matrix = np.asarray(file_tools.generate_embeddings_batch(examples), dtype=np.float32)
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            vectors[intent] = matrix / np.where(norms == 0, 1, norms)
+        _prototype_vectors = vectors
+    return _prototype_vectors
+
+
+def reset_prototype_vectors():
+    """Re-embed the prototypes on next use (the embedding model changed)"""
+    global _prototype_vectors
+    _prototype_vectors = None
+
+
+def _closest_intent(query_vector: List[float]) -> tuple:
+    vec = np.asarray(query_vector, dtype=np.float32)
+    norm = np.linalg.norm(vec)
+    if not norm:
+        return None, 0.0
+    vec = vec / norm
+
+    best_intent, best_score = None, 0.0
+    for intent, matrix in _get_prototype_vectors().items():
+        score = float(np.max(matrix @ vec))
+        if score > best_score:
+            best_intent, best_score = intent, score
+    return best_intent, best_score
+
+
+def route_query(message: str, user_uuid: str, query_vector: Optional[List[float]] = None) -> Dict[str, Any]:
+    """
+    Decide whether a message should run document retrieval
+
+    Args:
+        message: User message
+        user_uuid: User UUID
+        query_vector: Message embedding if already computed
+
+    Returns:
+        {"retrieve": bool, "reason": str, "intent": str | None, "score": float,
+         "query_vector": embedding if one was computed}
+    """
+    decision: Dict[str, Any] = {
+        "retrieve": True, "reason": "default", "intent": None, "score": 0.0, "query_vector": query_vector
+    }
+
+    if not ROUTER_ENABLED:
+        decision["reason"] = "router_disabled"
+    elif corpus_index.is_empty(user_uuid):
+        decision.update(retrieve=False, reason="no_files")
+    elif SMALLTALK_PATTERN.match(message):
+        decision.update(retrieve=False, reason="smalltalk_pattern", intent="smalltalk", score=1.0)
+    else:
+        if query_vector is None:
+            with chat_stage("embed"):
+                query_vector = file_tools.generate_embedding(message)
+            decision["query_vector"] = query_vector
+        intent, score = _closest_intent(query_vector)
+        decision.update(intent=intent, score=round(score, 4))
+        if intent:
+            ROUTE_INTENT_SCORE.labels(intent).observe(score)
+        if intent and score >= INTENT_THRESHOLD:
+            decision.update(retrieve=False, reason=f"{intent}_intent")
+        else:
+            decision["reason"] = "document_query"
+
+    ROUTE_DECISIONS.labels(decision['reason'], decision['intent'] or "none").inc()
+    logger.debug(
+        "Retrieval route: retrieve=%s reason=%s intent=%s score=%s",
+        decision['retrieve'], decision['reason'], decision['intent'], decision['score']
+    )
+    return decision
@@ -0,0 +1,200 @@
+"""
+Incremental index of frontend source files
+Each tracked file is parsed once and its result cached by (mtime, size). The
+cache is persisted to disk, so a restart only re-reads files that changed; it
+is discarded when the parser's code changes. A
+watcher thread (watchfiles when installed, stat polling otherwise) re-indexes
+changed files and notifies a callback.
+"""
+
+import os
+import json
+import hashlib
+import inspect
+import threading
+import logging
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.site_index_cache.json')
+SITE_INDEX_CACHE_FILE = os.getenv("SITE_INDEX_CACHE_FILE", DEFAULT_CACHE_FILE)
+SITE_WATCH_ENABLED = os.getenv("SITE_WATCH_ENABLED", "true").lower() == "true"
+SITE_WATCH_POLL_SECONDS = float(os.getenv("SITE_WATCH_POLL_SECONDS", "5"))
+
+SOURCE_EXTENSIONS = ('.tsx', '.ts', '.jsx', '.js')
+CACHE_VERSION = 2
+
+
+def _source_hash(func: Callable) -> str:
+    """Hash of the source file defining func (covers the helpers and patterns it uses)"""
+    try:
+        with open(inspect.getsourcefile(func), 'rb') as f:
+            return hashlib.sha1(f.read()).hexdigest()
+    except (TypeError, OSError):
+        return getattr(func, '__qualname__', repr(func))  # Builtins/REPL: no source to hash
+
+
+class FileIndex:
+    """
+    Parsed results for a set of files under a root, refreshed incrementally
+
+    Args:
+        root: Absolute project root
+        directories: Directories (relative to root) whose source files are tracked recursively
+        files: Extra files (relative to root) tracked individually
+        parse: Callable (relative path, content) -> JSON-serializable dict
+        cache_file: Where parsed results are persisted (None disables persistence)
+        parser_version: Identifies the parser's output format in the cache; defaults
+            to a hash of the source of the module defining `parse`
+    """
+
+    def __init__(
+        self,
+        root: str,
+        directories: List[str],
+        files: List[str],
+        parse: Callable[[str, str], Dict[str, Any]],
+        cache_file: Optional[str] = SITE_INDEX_CACHE_FILE,
+        parser_version: Optional[str] = None
+    ):
+        self.root = root
+        self.directories = directories
+        self.files = files
+        self.parse = parse
+        self.cache_file = cache_file
+        self.parser_version = parser_version or _source_hash(parse)
+        self.records: Dict[str, Dict[str, Any]] = {}
+        self.stats = {"refreshes": 0, "parsed": 0, "reused": 0}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._load_cache()
+
+    def _tracked_files(self) -> Dict[str, os.stat_result]:
+        """Relative path (with '/' separators) -> stat for every tracked file that exists"""
+        found = {}
+        for directory in self.directories:
+            for dirpath, _, filenames in os.walk(os.path.join(self.root, directory)):
+                for filename in filenames:
+                    if filename.endswith(SOURCE_EXTENSIONS):
+                        path = os.path.join(dirpath, filename)
+                        found[os.path.relpath(path, self.root).replace(os.sep, '/')] = os.stat(path)
+        for rel in self.files:
+            path = os.path.join(self.root, rel)
+            if os.path.isfile(path):
+                found[rel.replace(os.sep, '/')] = os.stat(path)
+        return found
+
+    def refresh(self) -> bool:
+        """
+        Re-parse files whose mtime or size changed and drop deleted ones
+
+        Returns:
+            True if any record changed
+        """
+        with self._lock:
+            self.stats["refreshes"] += 1
+            tracked = self._tracked_files()
+            changed = False
+
+            for rel, stat in tracked.items():
+                record = self.records.get(rel)
+                if record and record["mtime_ns"] == stat.st_mtime_ns and record["size"] == stat.st_size:
+                    self.stats["reused"] += 1
+                    continue
+                try:
+                    with open(os.path.join(self.root, rel), 'r', encoding='utf-8', errors='ignore') as f:
+                        content = f.read()
+                except OSError as e:
+                    logger.warning(f"Could not read {rel}: {e}")
+                    continue
+                self.records[rel] = {
+                    "mtime_ns": stat.st_mtime_ns,
+                    "size": stat.st_size,
+                    "data": self.parse(rel, content)
+                }
+                self.stats["parsed"] += 1
+                changed = True
+
+            for rel in set(self.records) - set(tracked):
+                del self.records[rel]
+                changed = True
+
+            if changed:
+                self._save_cache()
+            return changed
+
+    def items(self) -> List[Tuple[str, Dict[str, Any]]]:
+        """(relative path, parsed data) for every tracked file, in path order"""
+        with self._lock:
+            return [(rel, self.records[rel]["data"]) for rel in sorted(self.records)]
+
+    def _load_cache(self):
+        if not self.cache_file or not os.path.exists(self.cache_file):
+            return
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+            if (cached.get("version") == CACHE_VERSION and cached.get("parser") == self.parser_version
+                    and cached.get("root") == self.root):
+                self.records = cached.get("records", {})
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable site index cache {self.cache_file}: {e}")
+
+    def _save_cache(self):
+        if not self.cache_file:
+            return
+        tmp_path = f"{self.cache_file}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({
+                    "version": CACHE_VERSION,
+                    "parser": self.parser_version,
+                    "root": self.root,
+                    "records": self.records
+                }, f)
+            os.replace(tmp_path, self.cache_file)
+        except OSError as e:
+            logger.warning(f"Could not persist site index cache: {e}")
+
+    def start_watching(self, on_change: Callable[[], None]):
+        """Refresh in a background thread whenever tracked files change, then call on_change"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch_loop, args=(on_change,), name="site-index-watcher", daemon=True)
+        self._thread.start()
+
+    def stop_watching(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=SITE_WATCH_POLL_SECONDS + 1)
+            self._thread = None
+
+    def _refresh_and_notify(self, on_change: Callable[[], None]):
+        try:
+            if self.refresh():
+                on_change()
+        except Exception as e:
+            logger.error(f"Site index refresh failed: {e}")
+
+    def _watch_loop(self, on_change: Callable[[], None]):
+        paths = [p for p in (os.path.join(self.root, d) for d in self.directories + self.files) if os.path.exists(p)]
+        try:
+            from watchfiles import watch
+        except ImportError:
+            watch = None
+
+        if watch and paths:
+            logger.info(f"Watching {len(paths)} frontend paths for changes")
+            try:
+                for _ in watch(*paths, stop_event=self._stop, debounce=500):
+                    self._refresh_and_notify(on_change)
+                return
+            except Exception as e:
+                logger.warning(f"File watcher stopped ({e}); falling back to polling")
+
+        logger.info(f"Polling frontend files every {SITE_WATCH_POLL_SECONDS}s for changes")
+        while not self._stop.wait(SITE_WATCH_POLL_SECONDS):
+            self._refresh_and_notify(on_change)
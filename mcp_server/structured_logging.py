@@ -0,0 +1,119 @@
+"""
+Logging setup for the MCP server
+Records are written one JSON object per line (or as plain text for local
+runs), every message is capped in size, and large payloads (chat history,
+query results) are only rendered when a sampled DEBUG record is actually
+emitted. Hot paths log with %-style arguments so nothing is formatted when
+the level is disabled.
+"""
+
+import os
+import sys
+import json
+import random
+import logging
+from datetime import datetime, timezone
+from typing import Any
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()  # json | text
+LOG_MAX_MESSAGE_CHARS = int(os.getenv("LOG_MAX_MESSAGE_CHARS", "2000"))
+LOG_MAX_PAYLOAD_CHARS = int(os.getenv("LOG_MAX_PAYLOAD_CHARS", "500"))
+LOG_PAYLOAD_SAMPLE_RATE = float(os.getenv("LOG_PAYLOAD_SAMPLE_RATE", "0.1"))  # Fraction of payloads logged at DEBUG
+
+# LogRecord attributes that are not user-supplied `extra` fields
+_RESERVED = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+_configured = False
+
+
+def _truncate(text: str, limit: int) -> str:
+    if len(text) <= limit:
+        return text
+    return f"{text[:limit]}…(+{len(text) - limit} chars)"
+
+
+class Payload:
+    """
+    Size-capped, lazily rendered log argument
+
+    Rendering (json.dumps of the wrapped value) happens in __str__, i.e. only
+    when a handler formats the record.
+    """
+
+    __slots__ = ("value", "limit")
+
+    def __init__(self, value: Any, limit: int = LOG_MAX_PAYLOAD_CHARS):
+        self.value = value
+        self.limit = limit
+
+    def __str__(self) -> str:
+        if isinstance(self.value, str):
+            text = self.value
+        else:
+            try:
+                text = json.dumps(self.value, default=str, ensure_ascii=False)
+            except (TypeError, ValueError):
+                text = repr(self.value)
+        return _truncate(text, self.limit)
+
+
+def log_payload(logger: logging.Logger, message: str, value: Any, level: int = logging.DEBUG):
+    """
+    Log a large value at `level` for a sample of calls
+
+    Args:
+        logger: Logger to write to
+        message: Description; the payload is appended after ': '
+        value: Any JSON-serializable value (rendered only if emitted)
+        level: Log level (DEBUG by default)
+    """
+    if logger.isEnabledFor(level) and random.random() < LOG_PAYLOAD_SAMPLE_RATE:
+        logger.log(level, "%s: %s", message, Payload(value))
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: ts, level, logger, msg, any `extra` fields, exc"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": _truncate(record.getMessage(), LOG_MAX_MESSAGE_CHARS),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class _CappedTextFormatter(logging.Formatter):
+    def formatMessage(self, record: logging.LogRecord) -> str:
+        record.message = _truncate(record.message, LOG_MAX_MESSAGE_CHARS)
+        return super().formatMessage(record)
+
+
+def configure_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT):
+    """Install the stderr handler on the root logger (once)"""
+    global _configured
+    if _configured:
+        return
+    handler = logging.StreamHandler(sys.stderr)
+    if fmt == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(_CappedTextFormatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level)
+
+    # Per-request client chatter
+    for noisy in ("httpx", "httpcore", "elastic_transport", "urllib3"):
+        logging.getLogger(noisy).setLevel(logging.WARNING)
+    _configured = True
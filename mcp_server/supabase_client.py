@@ -1,29 +1,32 @@
 import os
+import logging
 from supabase import create_client, Client
 
+import system_stats
+from metrics import timed_call
+
+logger = logging.getLogger(__name__)
+
 supabase: Client = None
 
 def init_supabase(url: str, key: str):
     global supabase
     try:
         supabase = create_client(url, key)
-        print(f"DEBUG: Supabase client initialized successfully")
+        logger.info("✅ Supabase client initialized")
         return supabase
     except Exception as e:
-        print(f"ERROR: Failed to initialize Supabase client: {e}")
+        logger.error("Failed to initialize Supabase client: %s", e)
         supabase = None
         return None
 
+@timed_call("supabase", "get_or_create_user")
 def get_or_create_user(firebase_uid: str, email: str = None, name: str = None):
-    print(f"DEBUG: get_or_create_user called with firebase_uid={firebase_uid}, email={email}, name={name}")
-    
     # First, try to get existing user with all fields
     response = supabase.table('users').select('*').eq('firebase_uid', firebase_uid).execute()
-    print(f"DEBUG: Existing user query result: {response.data}")
     
     if response.data:
         existing_user = response.data[0]
-        print(f"DEBUG: Found existing user: {existing_user}")
         
         # Update user if we have new email/name info and they're missing
         if (email and not existing_user.get('email')) or (name and not existing_user.get('name')):
@@ -34,11 +37,10 @@ def get_or_create_user(firebase_uid: str, email: str = None, name: str = None):
                 update_data['name'] = name
             
             if update_data:
-                print(f"DEBUG: Updating user with data: {update_data}")
+                logger.debug("Updating fields %s of user %s", list(update_data), firebase_uid)
                 supabase.table('users').update(update_data).eq('firebase_uid', firebase_uid).execute()
                 # Return updated user
                 response = supabase.table('users').select('*').eq('firebase_uid', firebase_uid).execute()
-                print(f"DEBUG: Updated user result: {response.data[0]}")
                 return response.data[0]
         
         return existing_user
@@ -49,11 +51,12 @@ def get_or_create_user(firebase_uid: str, email: str = None, name: str = None):
             'email': email,
             'name': name
         }
-        print(f"DEBUG: Creating new user with data: {user_data}")
         response = supabase.table('users').insert(user_data).execute()
-        print(f"DEBUG: New user created: {response.data[0]}")
+        logger.info("Created user %s for firebase uid %s", response.data[0]['id'], firebase_uid)
+        system_stats.increment("total_users")
         return response.data[0]
 
+@timed_call("supabase", "store_message")
 def store_message(user_id: str, role: str, content: str, metadata: dict = None):
     message_data = {
         'user_id': user_id,
@@ -62,27 +65,56 @@ def store_message(user_id: str, role: str, content: str, metadata: dict = None):
         'metadata': metadata
     }
     response = supabase.table('messages').insert(message_data).execute()
+    system_stats.increment("total_messages")
     return response.data[0]
 
-def get_recent_messages(user_id: str, limit: int = None):
-    # Get the most recent messages (newest first)
+@timed_call("supabase", "get_recent_messages")
+def get_recent_messages(user_id: str, limit: int = None, before: str = None):
+    """
+    Most recent messages of a user in chronological order (oldest first)
+    
+    Args:
+        user_id: Supabase user UUID
+        limit: Number of messages (None = all)
+        before: Only messages created before this created_at (cursor of the previous page)
+    """
+    # Newest first so the limit keeps the latest messages, then flipped in place
     query = supabase.table('messages').select('*').eq('user_id', user_id).order('created_at', desc=True)
     
+    if before:
+        query = query.lt('created_at', before)
     if limit:
         query = query.limit(limit)
     
-    response = query.execute()
-    print(f"DEBUG: Raw database response: {response.data}")
-    # Reverse to get chronological order (oldest first)
-    reversed_data = list(reversed(response.data))
-    print(f"DEBUG: Reversed data: {reversed_data}")
-    return reversed_data
+    messages = query.execute().data
+    messages.reverse()
+    return messages
+
+def iter_messages(user_id: str, page_size: int = 500):
+    """
+    Stream all messages of a user oldest first, paged by keyset on (created_at, id)
+    
+    Yields:
+        Message rows
+    """
+    last = None
+    while True:
+        query = supabase.table('messages').select('*').eq('user_id', user_id) \
+            .order('created_at').order('id').limit(page_size)
+        if last:
+            query = query.or_(f'created_at.gt."{last["created_at"]}",and(created_at.eq."{last["created_at"]}",id.gt.{last["id"]})')
+        rows = query.execute().data or []
+        yield from rows
+        if len(rows) < page_size:
+            return
+        last = rows[-1]
 
+@timed_call("supabase", "clear_user_messages")
 def clear_user_messages(user_id: str):
     """
     Deletes all messages for a specific user.
     """
-    print(f"DEBUG: Clearing all messages for user_id: {user_id}")
     response = supabase.table('messages').delete().eq('user_id', user_id).execute()
-    print(f"DEBUG: Clear messages response: {response}")
+    system_stats.increment("total_messages", -len(response.data or []))
+    logger.debug("Cleared %d messages of user %s", len(response.data or []), user_id)
     return response
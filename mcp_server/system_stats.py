@@ -0,0 +1,137 @@
+"""
+Materialized counters for the admin dashboard
+Totals are recounted from Supabase in the background once they are older
+than the staleness bound, and kept current in between by increments from the
+write paths, so /admin/stats is answered from memory. Elasticsearch index stats are cached with the same
+staleness bound.
+"""
+
+import os
+import time
+import threading
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+STATS_MAX_STALENESS_SECONDS = int(os.getenv("STATS_MAX_STALENESS_SECONDS", "300"))
+# PostgREST count method for the messages table: exact | planned | estimated
+STATS_MESSAGES_COUNT = os.getenv("STATS_MESSAGES_COUNT", "estimated")
+
+_counters: Dict[str, int] = {
+    "total_users": 0,
+    "total_files": 0,
+    "processed_files": 0,
+    "total_messages": 0,
+}
+_index_stats: Dict[str, Any] = {}
+_refreshed_at: Optional[float] = None
+_stale = False
+_lock = threading.Lock()
+_refresh_lock = threading.Lock()
+
+
+def _count(table: str, count_method: str = "exact", **filters) -> int:
+    """Row count from the Content-Range header; limit(1) keeps the rows out of the response"""
+    from supabase_client import supabase
+
+    query = supabase.table(table).select('id', count=count_method)
+    for column, value in filters.items():
+        query = query.eq(column, value)
+    return query.limit(1).execute().count or 0
+
+
+def refresh() -> Dict[str, Any]:
+    """Recount every total and re-read index stats"""
+    global _refreshed_at, _stale
+    from elasticsearch_client import get_index_stats
+
+    with _refresh_lock:
+        started = time.perf_counter()
+        counters = {
+            "total_users": _count('users'),
+            "total_files": _count('files'),
+            "processed_files": _count('files', upload_status='processed'),
+            "total_messages": _count('messages', STATS_MESSAGES_COUNT),
+        }
+        index_stats = get_index_stats()
+
+        with _lock:
+            _counters.update(counters)
+            _index_stats.clear()
+            _index_stats.update(index_stats)
+            _refreshed_at = time.time()
+            _stale = False
+
+    logger.info(f"System stats refreshed in {(time.perf_counter() - started) * 1000:.0f}ms")
+    return counters
+
+
+def refresh_in_background():
+    """Start a recount in a daemon thread unless one is already running"""
+    if _refresh_lock.locked():
+        return
+
+    def _run():
+        try:
+            refresh()
+        except Exception as e:
+            logger.warning(f"System stats refresh failed: {e}")
+
+    threading.Thread(target=_run, name="system-stats-refresh", daemon=True).start()
+
+
+def increment(name: str, delta: int = 1):
+    """Apply a known change to a counter (ignored until the first refresh)"""
+    with _lock:
+        if _refreshed_at is not None:
+            _counters[name] = max(_counters[name] + delta, 0)
+
+
+def record_file_status(old_status: Optional[str], new_status: str):
+    """Keep processed_files in step with a file status transition"""
+    if old_status == new_status:
+        return
+    if new_status == 'processed':
+        increment("processed_files")
+    elif old_status == 'processed':
+        increment("processed_files", -1)
+
+
+def record_file_deleted(status: Optional[str]):
+    increment("total_files", -1)
+    if status == 'processed':
+        increment("processed_files", -1)
+
+
+def mark_stale():
+    """Request a recount after a change of unknown size"""
+    global _stale
+    _stale = True
+
+
+def get_stats(max_staleness: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Current totals from memory
+
+    The first call counts synchronously; afterwards values older than
+    max_staleness seconds (or marked stale) trigger a background recount and
+    the current values are returned immediately.
+
+    Returns:
+        {"stats": counters, "index": Elasticsearch stats, "refreshed_at": ISO time, "age_seconds": float}
+    """
+    max_staleness = STATS_MAX_STALENESS_SECONDS if max_staleness is None else max_staleness
+    if _refreshed_at is None:
+        refresh()
+    elif _stale or time.time() - _refreshed_at > max_staleness:
+        refresh_in_background()
+
+    with _lock:
+        return {
+            "stats": dict(_counters),
+            "index": dict(_index_stats),
+            "refreshed_at": datetime.fromtimestamp(_refreshed_at, tz=timezone.utc).isoformat(),
+            "age_seconds": round(time.time() - _refreshed_at, 1)
+        }
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Tests for the keyset cursor of the admin file listing (tools/admin_tools.py)
+Run with: pytest test_admin_cursor.py
+"""
+
+import os
+import sys
+import json
+import uuid
+import base64
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from tools.admin_tools import _decode_cursor, _encode_cursor
+
+ROW = {'id': str(uuid.uuid4()), 'created_at': '2026-03-14T09:26:53.589793+00:00', 'filename': 'ignored.pdf'}
+
+
+def _raw_cursor(data) -> str:
+    return base64.urlsafe_b64encode(json.dumps(data).encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def _rejected(cursor: str) -> bool:
+    try:
+        _decode_cursor(cursor)
+    except Exception:
+        return True
+    return False
+
+
+def test_round_trip():
+    cursor = _encode_cursor(ROW)
+    assert _decode_cursor(cursor) == {'created_at': ROW['created_at'], 'id': ROW['id']}
+
+
+def test_cursor_is_url_safe_without_padding():
+    for created_at in ('2026-03-14T09:26:53Z', '2026-03-14 09:26:53.5+00', '2026-03-14T09:26:53.589793+05:30'):
+        cursor = _encode_cursor({**ROW, 'created_at': created_at})
+        assert '=' not in cursor and '+' not in cursor and '/' not in cursor
+        assert _decode_cursor(cursor)['created_at'] == created_at
+
+
+def test_id_is_canonicalized():
+    cursor = _raw_cursor({'created_at': ROW['created_at'], 'id': ROW['id'].upper()})
+    assert _decode_cursor(cursor)['id'] == ROW['id']
+
+
+def test_filter_injection_is_rejected():
+    assert _rejected(_raw_cursor({'created_at': '2026-03-14T09:26:53Z",id.gt.0', 'id': ROW['id']}))
+    assert _rejected(_raw_cursor({'created_at': ROW['created_at'], 'id': f"{ROW['id']}),user_id.neq.x"}))
+
+
+def test_malformed_cursors_are_rejected():
+    assert _rejected("not base64 at all!")
+    assert _rejected(_raw_cursor(["2026-03-14T09:26:53Z", ROW['id']]))
+    assert _rejected(_raw_cursor({'id': ROW['id']}))
+    assert _rejected(_raw_cursor({'created_at': ROW['created_at']}))
+    assert _rejected(_raw_cursor({'created_at': 'yesterday', 'id': ROW['id']}))
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Tests for the verified admin token cache (tools/admin_tools.py)
+Run with: pytest test_admin_token_cache.py
+"""
+
+import os
+import sys
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from jose import jwt
+
+import supabase_client
+from tools import admin_tools
+
+ADMIN = {'id': str(uuid.uuid4()), 'email': 'admin@example.com', 'name': 'Admin', 'is_active': True}
+
+
+class _AdminTable:
+    """Minimal stand-in for supabase.table('admin_users') lookups, counting queries"""
+
+    def __init__(self):
+        self.queries = 0
+
+    def table(self, name):
+        return self
+
+    def select(self, *args, **kwargs):
+        return self
+
+    def eq(self, column, value):
+        return self
+
+    def execute(self):
+        self.queries += 1
+        return type('Response', (), {'data': [dict(ADMIN)]})()
+
+
+def _token(secret=admin_tools.JWT_SECRET_KEY, **claims):
+    data = {
+        'admin_id': ADMIN['id'],
+        'email': ADMIN['email'],
+        'jti': uuid.uuid4().hex,
+        'exp': datetime.utcnow() + timedelta(hours=1),
+        **claims
+    }
+    return jwt.encode(data, secret, algorithm=admin_tools.JWT_ALGORITHM)
+
+
+def _setup():
+    admin_tools._verified_tokens.clear()
+    admin_tools._admin_generations.clear()
+    supabase_client.supabase = _AdminTable()
+    return supabase_client.supabase
+
+
+def test_valid_token_is_cached():
+    db = _setup()
+    token = _token()
+    assert admin_tools.verify_admin_token(token)['id'] == ADMIN['id']
+    assert admin_tools.verify_admin_token(token)['id'] == ADMIN['id']
+    assert db.queries == 1
+
+
+def test_forged_token_with_known_jti_is_rejected():
+    _setup()
+    jti = uuid.uuid4().hex
+    assert admin_tools.verify_admin_token(_token(jti=jti))
+    forged = _token(secret='not-the-server-secret', jti=jti)
+    assert admin_tools.verify_admin_token(forged) is None
+
+
+def test_revocation_invalidates_cached_token():
+    db = _setup()
+    token = _token()
+    assert admin_tools.verify_admin_token(token)
+    admin_tools.revoke_admin_tokens(ADMIN['id'])
+    assert admin_tools.verify_admin_token(token)
+    assert db.queries == 2
+
+
+def test_expired_token_is_rejected():
+    _setup()
+    assert admin_tools.verify_admin_token(_token(exp=datetime.utcnow() - timedelta(seconds=1))) is None
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Tests for retrieval context packing (context_packing.py)
+Run with: pytest test_context_packing.py
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from context_packing import estimate_tokens, pack_context
+
+OVERLAP = "the shared sentence that both chunks repeat at the boundary. "
+
+
+def _chunk(chunk_id, content, score, file_id="f1", chunk_index=None, embedding=None):
+    chunk = {'id': chunk_id, 'content': content, 'similarity_score': score, 'file_id': file_id, 'chunk_index': chunk_index}
+    if embedding is not None:
+        chunk['embedding'] = embedding
+    return chunk
+
+
+def test_identical_text_is_kept_once():
+    packed = pack_context([
+        _chunk("a", "Deadline is March 14.", 0.7, file_id="f1", chunk_index=0),
+        _chunk("b", "Deadline is March 14.", 0.9, file_id="f2", chunk_index=5),
+    ])
+    assert len(packed) == 1
+    assert packed[0]['id'] == "b"  # Best-scoring copy wins
+
+
+def test_near_duplicate_embeddings_are_dropped():
+    packed = pack_context([
+        _chunk("a", "Deadline is March 14.", 0.9, chunk_index=0, embedding=[1.0, 0.0, 0.0]),
+        _chunk("b", "The deadline: 14 March.", 0.8, chunk_index=7, embedding=[0.99, 0.05, 0.0]),
+        _chunk("c", "Submit through the portal.", 0.6, chunk_index=9, embedding=[0.0, 1.0, 0.0]),
+    ])
+    assert [p['id'] for p in packed] == ["a", "c"]
+    assert all('embedding' not in p for p in packed)
+
+
+def test_adjacent_chunks_are_merged_without_repeating_overlap():
+    packed = pack_context([
+        _chunk("a", "Intro paragraph, " + OVERLAP, 0.5, chunk_index=3),
+        _chunk("b", OVERLAP + "and the conclusion.", 0.8, chunk_index=4),
+        _chunk("c", "Unrelated later section.", 0.4, chunk_index=9),
+    ])
+    assert len(packed) == 2
+    merged = packed[0]
+    assert merged['content'] == "Intro paragraph, " + OVERLAP + "and the conclusion."
+    assert merged['content'].count(OVERLAP.strip()) == 1
+    assert merged['similarity_score'] == 0.8  # Best score of the run
+    assert merged['chunk_index'] == 4
+
+
+def test_back_to_back_chunks_are_joined_without_a_break():
+    # _split_text cuts fixed-size slices with no overlap, often inside a word
+    text = "The submission deadline for the final report is March 14 at noon."
+    cut = text.index("final") + 2  # "...the fi" | "nal report..."
+    packed = pack_context([
+        _chunk("a", text[:cut], 0.9, chunk_index=0),
+        _chunk("b", text[cut:], 0.7, chunk_index=1),
+    ])
+    assert [p['content'] for p in packed] == [text]
+    assert "final" in packed[0]['content']
+
+
+def test_passages_are_ordered_best_first_and_unscored_last():
+    packed = pack_context([
+        _chunk("low", "Low.", 0.2, file_id="f1", chunk_index=0),
+        _chunk("tail", "Not re-ranked.", None, file_id="f2", chunk_index=0),
+        _chunk("high", "High.", 0.9, file_id="f3", chunk_index=0),
+    ])
+    assert [p['id'] for p in packed] == ["high", "low", "tail"]
+
+
+def test_token_budget_skips_passages_that_do_not_fit():
+    big = "x" * 400  # ~100 tokens
+    packed = pack_context([
+        _chunk("big", big, 0.9, file_id="f1", chunk_index=0),
+        _chunk("small", "small passage", 0.5, file_id="f2", chunk_index=0),
+    ], token_budget=50)
+    assert [p['id'] for p in packed] == ["small"]
+    assert sum(estimate_tokens(p['content']) for p in packed) <= 50
+
+
+def test_oversized_best_passage_is_truncated():
+    packed = pack_context([_chunk("big", "y" * 1000, 0.9, chunk_index=0)], token_budget=10)
+    assert len(packed) == 1
+    assert packed[0]['content'] == "y" * 40
+
+
+def test_empty_input():
+    assert pack_context([]) == []
+
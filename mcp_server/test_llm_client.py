@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Tests for retries, deadlines and rate limiting of Gemini calls (llm_client.py)
+Run with: pytest test_llm_client.py
+"""
+
+import os
+import sys
+import time
+import asyncio
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+import pytest
+from google.api_core import exceptions as google_exceptions
+
+import llm_client
+from llm_client import LLMUnavailableError, generate_content
+
+
+class _Model:
+    """Stand-in for genai.GenerativeModel; each call takes the next outcome"""
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.timeouts = []
+
+    async def generate_content_async(self, contents, request_options=None, **kwargs):
+        self.timeouts.append(request_options["timeout"])
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        if isinstance(outcome, float):  # Seconds to hang
+            await asyncio.sleep(outcome)
+            return "too late"
+        return outcome
+
+    @property
+    def calls(self):
+        return len(self.timeouts)
+
+
+@pytest.fixture(autouse=True)
+def _fresh_limiters(monkeypatch):
+    # Limiters bind to the event loop; every asyncio.run() needs new ones
+    monkeypatch.setattr(llm_client, "_semaphore", None)
+    monkeypatch.setattr(llm_client, "_bucket", None)
+    monkeypatch.setattr(llm_client, "LLM_REQUESTS_PER_MINUTE", 6000.0)
+    monkeypatch.setattr(llm_client, "LLM_MAX_RETRIES", 3)
+    monkeypatch.setattr(llm_client, "RETRY_BASE_SECONDS", 0.01)
+
+
+def test_retryable_errors_are_retried():
+    model = _Model(google_exceptions.ServiceUnavailable("overloaded"), google_exceptions.ResourceExhausted("quota"), "ok")
+    retries = llm_client._stats["retries"]
+    assert asyncio.run(generate_content(model, "prompt", timeout=5)) == "ok"
+    assert model.calls == 3
+    assert llm_client._stats["retries"] == retries + 2
+
+
+def test_retries_are_bounded(monkeypatch):
+    monkeypatch.setattr(llm_client, "LLM_MAX_RETRIES", 2)
+    model = _Model(*[google_exceptions.InternalServerError("boom")] * 3)
+    with pytest.raises(LLMUnavailableError):
+        asyncio.run(generate_content(model, "prompt", timeout=5))
+    assert model.calls == 3
+
+
+def test_other_errors_are_not_retried():
+    model = _Model(google_exceptions.InvalidArgument("bad prompt"))
+    with pytest.raises(google_exceptions.InvalidArgument):
+        asyncio.run(generate_content(model, "prompt", timeout=5))
+    assert model.calls == 1
+
+
+def test_hung_call_is_cut_at_the_deadline():
+    model = _Model(5.0)
+    started = time.monotonic()
+    with pytest.raises(LLMUnavailableError):
+        asyncio.run(generate_content(model, "prompt", timeout=0.2))
+    assert time.monotonic() - started < 1.0
+    assert model.calls == 1 and model.timeouts[0] <= 0.2
+
+
+def test_no_retry_when_backoff_would_pass_the_deadline(monkeypatch):
+    monkeypatch.setattr(llm_client, "RETRY_BASE_SECONDS", 1.0)
+    model = _Model(google_exceptions.ServiceUnavailable("overloaded"), "ok")
+    with pytest.raises(LLMUnavailableError):
+        asyncio.run(generate_content(model, "prompt", timeout=0.3))
+    assert model.calls == 1
+
+
+def test_rate_limit_wait_beyond_the_deadline_fails_fast(monkeypatch):
+    monkeypatch.setattr(llm_client, "LLM_REQUESTS_PER_MINUTE", 6.0)  # A token every 10s
+    monkeypatch.setattr(llm_client, "LLM_BURST", 1)
+    model = _Model("first", "second")
+
+    async def two_calls():
+        first = await generate_content(model, "prompt", timeout=0.5)
+        with pytest.raises(LLMUnavailableError):
+            await generate_content(model, "prompt", timeout=0.5)
+        return first
+
+    assert asyncio.run(two_calls()) == "first"
+    assert model.calls == 1
+
+
+def test_concurrency_is_limited(monkeypatch):
+    monkeypatch.setattr(llm_client, "LLM_MAX_CONCURRENCY", 1)
+    peak = 0
+
+    class _Slow:
+        async def generate_content_async(self, contents, request_options=None, **kwargs):
+            nonlocal peak
+            peak = max(peak, llm_client._stats["in_flight"])
+            await asyncio.sleep(0.05)
+            return contents
+
+    async def burst():
+        return await asyncio.gather(*(generate_content(_Slow(), i, timeout=5) for i in range(3)))
+
+    assert asyncio.run(burst()) == [0, 1, 2]
+    assert peak == 1
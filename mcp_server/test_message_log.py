@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Tests for the write-behind message log and its spool (message_log.py)
+Run with: pytest test_message_log.py
+"""
+
+import os
+import sys
+import json
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+import supabase_client
+import message_log
+from tools import chat_tools
+
+
+class _MessagesTable:
+    """Minimal stand-in for supabase.table('messages').upsert(...), keyed by row id"""
+
+    def __init__(self):
+        self.rows = {}
+        self.fail = False
+        self._batch = None
+
+    def table(self, name):
+        return self
+
+    def upsert(self, rows, on_conflict=None, ignore_duplicates=False):
+        self._batch = rows
+        return self
+
+    def execute(self):
+        if self.fail:
+            raise ConnectionError("database unavailable")
+        for row in self._batch:
+            self.rows.setdefault(row['id'], row)
+        return type('Response', (), {'data': self._batch})()
+
+
+def _setup():
+    """Fresh queue with a temporary spool; the previous 'process' state is dropped"""
+    message_log.stop()
+    message_log._pending.clear()
+    message_log.MESSAGE_SPOOL_FILE = os.path.join(tempfile.mkdtemp(), 'spool.jsonl')
+    supabase_client.supabase = _MessagesTable()
+    return supabase_client.supabase
+
+
+def _crash():
+    """Lose the in-memory queue the way a killed process would, keeping the spool file"""
+    if message_log._spool:
+        message_log._spool.close()
+        message_log._spool = None
+    message_log._pending.clear()
+
+
+def _spooled_ids():
+    with open(message_log.MESSAGE_SPOOL_FILE, 'r', encoding='utf-8') as f:
+        return [json.loads(line)['id'] for line in f if line.strip()]
+
+
+def test_flush_writes_and_empties_spool():
+    db = _setup()
+    message_log._open_spool()
+    rows = [message_log.enqueue('u1', 'user', f"message {i}") for i in range(3)]
+    assert _spooled_ids() == [row['id'] for row in rows]
+
+    assert message_log.flush() == 3
+    assert set(db.rows) == {row['id'] for row in rows}
+    assert _spooled_ids() == []
+    assert message_log.pending_for('u1') == []
+
+
+def test_failed_flush_keeps_rows_queued_and_spooled():
+    db = _setup()
+    message_log._open_spool()
+    row = message_log.enqueue('u1', 'user', "hello")
+    db.fail = True
+    try:
+        message_log.flush()
+        assert False, "flush should raise while the database is down"
+    except ConnectionError:
+        pass
+    assert [r['id'] for r in message_log.pending_for('u1')] == [row['id']]
+    assert _spooled_ids() == [row['id']]
+
+    db.fail = False
+    assert message_log.flush() == 1
+    assert list(db.rows) == [row['id']]
+
+
+def test_spool_is_replayed_after_crash():
+    db = _setup()
+    message_log._open_spool()
+    rows = [message_log.enqueue('u1', role, text) for role, text in (('user', "question"), ('assistant', "answer"))]
+    _crash()
+
+    message_log.start()
+    message_log.stop()
+    assert [db.rows[row['id']]['content'] for row in rows] == ["question", "answer"]
+    assert _spooled_ids() == []
+
+
+def test_replay_is_idempotent_for_rows_already_written():
+    db = _setup()
+    message_log._open_spool()
+    row = message_log.enqueue('u1', 'user', "written before the crash")
+    db.rows[row['id']] = dict(row, content="stored copy")  # Inserted, but the spool was not rewritten
+    _crash()
+
+    message_log.start()
+    message_log.stop()
+    assert len(db.rows) == 1
+    assert db.rows[row['id']]['content'] == "stored copy"
+
+
+def test_torn_last_line_is_skipped():
+    db = _setup()
+    message_log._open_spool()
+    row = message_log.enqueue('u1', 'user', "complete")
+    _crash()
+    with open(message_log.MESSAGE_SPOOL_FILE, 'a', encoding='utf-8') as f:
+        f.write('{"id": "torn-wri')
+
+    message_log.start()
+    message_log.stop()
+    assert list(db.rows) == [row['id']]
+
+
+def test_discard_removes_a_users_rows_from_the_spool():
+    _setup()
+    message_log._open_spool()
+    kept = message_log.enqueue('u2', 'user', "keep me")
+    message_log.enqueue('u1', 'user', "drop me")
+    assert message_log.discard('u1') == 1
+    assert _spooled_ids() == [kept['id']]
+
+
+
+def _export(monkeypatch, db):
+    def iter_messages(user_id):
+        yield from sorted(db.rows.values(), key=lambda row: row['created_at'])
+
+    monkeypatch.setattr(chat_tools, 'get_or_create_user', lambda firebase_uid: {'id': 'u1'})
+    monkeypatch.setattr(chat_tools, 'iter_messages', iter_messages)
+    return chat_tools.iter_chat_history('firebase-uid')
+
+
+def test_history_export_includes_rows_not_yet_flushed(monkeypatch):
+    db = _setup()
+    stored = message_log.enqueue('u1', 'user', "stored")
+    message_log.flush()
+    pending = message_log.enqueue('u1', 'assistant', "pending")
+    message_log.enqueue('u2', 'user', "another user")
+
+    assert [m['id'] for m in _export(monkeypatch, db)] == [stored['id'], pending['id']]
+
+
+def test_history_export_lists_rows_flushed_mid_stream_once(monkeypatch):
+    db = _setup()
+    rows = [message_log.enqueue('u1', 'user', f"message {i}") for i in range(2)]
+    export = _export(monkeypatch, db)
+    message_log.flush()  # Rows reach the table after the export started
+
+    assert [m['id'] for m in export] == [row['id'] for row in rows]
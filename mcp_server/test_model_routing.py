@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Tests for fast/pro model routing of text turns (ai_client.choose_model_tier)
+Run with: pytest test_model_routing.py
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+os.environ.setdefault("GEMINI_API_KEY", "test-key")  # Read at import; no request is made
+
+import pytest
+
+import ai_client
+from ai_client import choose_model_tier
+
+
+@pytest.fixture(autouse=True)
+def _router_defaults(monkeypatch):
+    monkeypatch.setattr(ai_client, "MODEL_TIER_OVERRIDE", "")
+    monkeypatch.setattr(ai_client, "FAST_MAX_PROMPT_TOKENS", 8000)
+
+
+def _passages(scores):
+    return [{'id': str(i), 'content': f"passage {i}", 'similarity_score': score} for i, score in enumerate(scores)]
+
+
+def _fused(first_stage_scores):
+    """Passages as reciprocal_rank_fusion returns them: similarity_score is 1 / (61 + rank)"""
+    return [
+        {'id': str(rank), 'first_stage_score': score, 'similarity_score': 1.0 / (61 + rank)}
+        for rank, score in enumerate(first_stage_scores)
+    ]
+
+
+def test_simple_question_uses_fast_model():
+    assert choose_model_tier("When is the deadline?", 500)[0] == "fast"
+
+
+def test_override_wins(monkeypatch):
+    monkeypatch.setattr(ai_client, "MODEL_TIER_OVERRIDE", "pro")
+    assert choose_model_tier("hi", 10) == ("pro", "override")
+
+
+def test_large_prompt_uses_pro_model():
+    assert choose_model_tier("When is the deadline?", 8001) == ("pro", "large_prompt")
+
+
+def test_reasoning_cues_use_pro_model():
+    assert choose_model_tier("Explain the policy and compare it with last year's", 500) == ("pro", "complexity=2")
+    # The same cue twice counts once
+    assert choose_model_tier("Explain, explain!", 500)[0] == "fast"
+
+
+def test_ambiguous_retrieval_adds_complexity():
+    close = _passages([12.0, 11.9, 11.5, 11.2])
+    clear = _passages([12.0, 6.0, 5.5, 5.0])
+    assert choose_model_tier("Summarize the report", 500, close) == ("pro", "complexity=2")
+    assert choose_model_tier("Summarize the report", 500, clear) == ("fast", "complexity=1")
+
+
+def test_fused_scores_do_not_count_as_ambiguous():
+    # Fused 1/(61+rank) scores are always within ~2% of each other; the margin uses the search scores
+    assert choose_model_tier("Summarize the report", 500, _fused([12.0, 6.0, 5.5, 5.0])) == ("fast", "complexity=1")
+    assert choose_model_tier("Summarize the report", 500, _fused([12.0, 11.9, 11.5, 11.2])) == ("pro", "complexity=2")
+
+
+def test_unscored_passages_are_ignored_by_the_margin():
+    passages = _passages([0.9, 0.3, None, None])  # Re-rank tail cut by the latency budget
+    assert ai_client._retrieval_margin(passages) == pytest.approx(1 - 0.3 / 0.9)
+    assert ai_client._retrieval_margin(_passages([0.9])) == 1.0
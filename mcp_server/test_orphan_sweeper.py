@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Tests for the sorted-stream diff used by the orphan sweeper (orphan_sweeper.py)
+Run with: pytest test_orphan_sweeper.py
+"""
+
+import os
+import sys
+import uuid
+import random
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from orphan_sweeper import _diff_sorted
+
+
+def test_missing_ids_are_reported_with_counts():
+    es_terms = [("a", 3), ("b", 1), ("c", 7), ("e", 2)]
+    live_ids = ["b", "d", "e"]
+    assert list(_diff_sorted(es_terms, live_ids)) == [("a", 3), ("c", 7)]
+
+
+def test_empty_sides():
+    assert list(_diff_sorted([], ["a", "b"])) == []
+    assert list(_diff_sorted([("a", 1), ("b", 2)], [])) == [("a", 1), ("b", 2)]
+
+
+def test_live_ids_beyond_the_last_term_are_ignored():
+    assert list(_diff_sorted([("b", 1)], ["a", "b", "c", "d"])) == []
+
+
+def test_streams_are_consumed_lazily():
+    def live():
+        yield "a"
+        raise AssertionError("read past the last needed id")
+
+    diff = _diff_sorted(iter([("a", 1)]), live())
+    assert list(diff) == []
+
+
+def test_matches_set_difference_on_random_uuids():
+    rng = random.Random(11)
+    ids = sorted(str(uuid.UUID(int=rng.getrandbits(128), version=4)) for _ in range(2000))
+    live = sorted(rng.sample(ids, 1500) + [str(uuid.UUID(int=rng.getrandbits(128), version=4)) for _ in range(200)])
+    es_terms = [(file_id, rng.randint(1, 50)) for file_id in rng.sample(ids, 1200)]
+    es_terms.sort()
+
+    live_set = set(live)
+    expected = [(file_id, count) for file_id, count in es_terms if file_id not in live_set]
+    assert list(_diff_sorted(es_terms, live)) == expected
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Tests for the reply sanitizer (output_sanitizer.py)
+Run with: pytest test_output_sanitizer.py
+"""
+
+import os
+import sys
+import random
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from output_sanitizer import OutputSanitizer
+
+PHRASES = ["based on the document", "from the database", "you uploaded", "from supabase"]
+
+REPLIES = [
+    "Hello Sam, the deadline is March 14. Based on the document you uploaded, it is firm. Good luck!",
+    "Hello Ann,\nYour file is ready. It came FROM THE DATABASE. Anything else?",
+    "First point.\n\n\nBased on the document, x.\n\n\n\nLast one!",
+    "  Leading space. Trailing space.  ",
+    "Based on the document, the answer is 42.",
+    "A reply without any sentence punctuation",
+    "",
+]
+
+
+def _streamed(sanitizer: OutputSanitizer, text: str, chunk_size: int) -> str:
+    stream = sanitizer.stream()
+    pieces = [stream.feed(text[i:i + chunk_size]) for i in range(0, len(text), chunk_size)]
+    pieces.append(stream.flush())
+    return "".join(pieces)
+
+
+def test_banned_sentences_are_dropped():
+    sanitizer = OutputSanitizer(PHRASES)
+    reply = sanitizer.sanitize(REPLIES[0])
+    assert reply == "the deadline is March 14. Good luck!"
+    assert "database" not in sanitizer.sanitize(REPLIES[1]).lower()
+
+
+def test_blank_lines_are_collapsed():
+    assert OutputSanitizer(PHRASES).sanitize(REPLIES[2]) == "First point.\n\nLast one!"
+
+
+def test_all_banned_falls_back_to_original():
+    assert OutputSanitizer(PHRASES).sanitize(REPLIES[4]) == REPLIES[4]
+
+
+def test_shared_prefixes_match_every_phrase():
+    sanitizer = OutputSanitizer(["from the doc", "from the document", "from the database", "from supabase"])
+    for phrase in sanitizer.phrases:
+        assert sanitizer.drop_banned_sentences(f"Keep this. It is {phrase} here. Keep that.") == "Keep this. Keep that."
+
+
+def test_stream_matches_batch_for_every_chunk_size():
+    sanitizer = OutputSanitizer(PHRASES)
+    for reply in REPLIES:
+        expected = sanitizer.sanitize(reply)
+        for chunk_size in range(1, len(reply) + 2):
+            assert _streamed(sanitizer, reply, chunk_size) == expected, (reply, chunk_size)
+
+
+def test_stream_matches_batch_on_random_replies():
+    sanitizer = OutputSanitizer(PHRASES)
+    tokens = ["word", "Based on the document", "from the database", ".", "!", "?", " ", "  ", "\n", "\n\n\n", "Hello Ann,\n"]
+    rng = random.Random(7)
+    for _ in range(500):
+        reply = "".join(rng.choice(tokens) for _ in range(rng.randint(0, 15)))
+        expected = sanitizer.sanitize(reply)
+        for chunk_size in (1, 2, 3, 5, 8, 13):
+            assert _streamed(sanitizer, reply, chunk_size) == expected, (reply, chunk_size)
+
+
+def test_stream_releases_complete_sentences_early():
+    stream = OutputSanitizer(PHRASES).stream()
+    assert stream.feed("The deadline is March 14. Sub") == "The deadline is March 14."
+    assert stream.feed("missions close at noon") == ""
+    assert stream.flush() == " Submissions close at noon"
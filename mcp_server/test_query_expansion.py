@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Tests for reciprocal rank fusion of multi-query results (query_expansion.py)
+Run with: pytest test_query_expansion.py
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+import pytest
+
+from query_expansion import RRF_K, normalize_query, reciprocal_rank_fusion
+
+
+def _hits(*ids, score=10.0):
+    """Search results best first, with decreasing search scores"""
+    return [{'id': chunk_id, 'content': f"chunk {chunk_id}", 'similarity_score': score - rank} for rank, chunk_id in enumerate(ids)]
+
+
+def test_chunks_found_by_several_queries_rank_first():
+    fused = reciprocal_rank_fusion([_hits("a", "b", "c"), _hits("c", "d"), _hits("e", "c")], limit=10)
+    assert fused[0]['id'] == "c"
+    # Equal ranks tie; ties keep the order in which chunks were first seen
+    assert [r['id'] for r in fused[1:]] == ["a", "e", "b", "d"]
+
+
+def test_fused_score_sums_reciprocal_ranks():
+    fused = reciprocal_rank_fusion([_hits("a", "b"), _hits("b")], limit=10)
+    scores = {r['id']: r['similarity_score'] for r in fused}
+    assert scores['b'] == pytest.approx(1 / (RRF_K + 2) + 1 / (RRF_K + 1))
+    assert scores['a'] == pytest.approx(1 / (RRF_K + 1))
+
+
+def test_search_score_is_kept_as_first_stage_score():
+    fused = reciprocal_rank_fusion([_hits("a", "b", score=12.0), _hits("b", score=3.0)], limit=10)
+    first_stage = {r['id']: r['first_stage_score'] for r in fused}
+    # Taken from the first list that returned the chunk
+    assert first_stage == {'a': 12.0, 'b': 11.0}
+
+
+def test_limit_and_input_are_respected():
+    original = _hits("a", "b", "c")
+    fused = reciprocal_rank_fusion([original], limit=2)
+    assert [r['id'] for r in fused] == ["a", "b"]
+    assert 'first_stage_score' not in original[0]
+    assert original[0]['similarity_score'] == 10.0
+
+
+def test_single_list_keeps_its_order():
+    fused = reciprocal_rank_fusion([_hits("x", "y", "z")], limit=10)
+    assert [r['id'] for r in fused] == ["x", "y", "z"]
+
+
+def test_empty_lists():
+    assert reciprocal_rank_fusion([], limit=5) == []
+    assert reciprocal_rank_fusion([[], []], limit=5) == []
+
+
+def test_normalize_query():
+    assert normalize_query("  When IS the\tDeadline? ") == "when is the deadline?"
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Tests for the semantic response cache (response_cache.py)
+Run with: pytest test_response_cache.py
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+import pytest
+
+import response_cache
+
+QUESTION = [1.0, 0.0, 0.0]
+PARAPHRASE = [0.99, 0.05, 0.0]  # Cosine ~0.999 to QUESTION
+OTHER_QUESTION = [0.0, 1.0, 0.0]
+HISTORY = [
+    {'role': 'user', 'content': "What is the refund policy?"},
+    {'role': 'assistant', 'content': "Refunds are issued within 14 days."},
+]
+
+
+@pytest.fixture(autouse=True)
+def _enabled_cache(monkeypatch):
+    monkeypatch.setattr(response_cache, "RESPONSE_CACHE_ENABLED", True)
+    response_cache._user_entries.clear()
+    response_cache._corpus_versions.clear()
+
+
+def _store(user_id, embedding, answer, chat_history=None):
+    version = response_cache.get_corpus_version(user_id)
+    response_cache.store(user_id, embedding, answer, version, chat_history)
+
+
+def test_paraphrase_hits_and_other_question_misses():
+    _store("u1", QUESTION, "March 14")
+    assert response_cache.lookup("u1", PARAPHRASE) == "March 14"
+    assert response_cache.lookup("u1", OTHER_QUESTION) is None
+
+
+def test_answers_are_per_user():
+    _store("u1", QUESTION, "March 14")
+    assert response_cache.lookup("u2", QUESTION) is None
+
+
+def test_answers_are_tied_to_the_preceding_exchange():
+    _store("u1", QUESTION, "In the follow-up", HISTORY)
+    assert response_cache.lookup("u1", QUESTION, HISTORY) == "In the follow-up"
+    assert response_cache.lookup("u1", QUESTION) is None
+    # Only the last exchange counts; older turns do not change the context
+    longer = [{'role': 'user', 'content': "hi"}, {'role': 'assistant', 'content': "Hello!"}] + HISTORY
+    assert response_cache.lookup("u1", QUESTION, longer) == "In the follow-up"
+
+
+def test_file_change_invalidates_the_users_answers():
+    _store("u1", QUESTION, "old answer")
+    _store("u2", QUESTION, "unaffected")
+    response_cache.invalidate_user("u1")
+    assert response_cache.lookup("u1", QUESTION) is None
+    assert response_cache.lookup("u2", QUESTION) == "unaffected"
+
+
+def test_answer_generated_across_a_file_change_is_not_stored():
+    version = response_cache.get_corpus_version("u1")  # Taken before retrieval
+    response_cache.invalidate_user("u1")  # Upload finishes while the model answers
+    response_cache.store("u1", QUESTION, "stale answer", version)
+    assert response_cache.lookup("u1", QUESTION) is None
+
+
+def test_invalidate_all_drops_every_user():
+    _store("u1", QUESTION, "a")
+    _store("u2", QUESTION, "b")
+    response_cache.invalidate_all()
+    assert response_cache.lookup("u1", QUESTION) is None
+    assert response_cache.lookup("u2", QUESTION) is None
+
+
+def test_expired_entries_are_ignored(monkeypatch):
+    _store("u1", QUESTION, "March 14")
+    later = response_cache.time.time() + response_cache.RESPONSE_CACHE_TTL + 1
+    monkeypatch.setattr(response_cache.time, "time", lambda: later)
+    assert response_cache.lookup("u1", QUESTION) is None
+
+
+def test_short_and_disabled_queries_are_not_cacheable(monkeypatch):
+    assert response_cache.is_cacheable("When is the deadline?")
+    assert not response_cache.is_cacheable("why?")
+    monkeypatch.setattr(response_cache, "RESPONSE_CACHE_ENABLED", False)
+    assert not response_cache.is_cacheable("When is the deadline?")
+    _store("u1", QUESTION, "March 14")
+    assert response_cache.lookup("u1", QUESTION) is None
+
+
+def test_entries_per_user_are_capped():
+    for i in range(response_cache.MAX_ENTRIES_PER_USER + 5):
+        _store("u1", [1.0, float(i), 0.0], f"answer {i}")
+    entries = response_cache._user_entries.get("u1")
+    assert len(entries) == response_cache.MAX_ENTRIES_PER_USER
+    assert entries[-1]["answer"] == f"answer {response_cache.MAX_ENTRIES_PER_USER + 4}"
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Tests for the in-process TTL/LRU cache (ttl_cache.py)
+Run with: pytest test_ttl_cache.py
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from ttl_cache import TTLCache, all_caches
+
+
+def test_get_set_and_stats():
+    cache = TTLCache(maxsize=4, name="test_stats")
+    assert cache.get("missing") is None
+    assert cache.get("missing", "default") == "default"
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["size"]) == (1, 2, 1)
+    assert stats["hit_ratio"] == round(1 / 3, 4)
+
+
+def test_falsy_values_are_hits():
+    cache = TTLCache(maxsize=4)
+    cache.set("zero", 0)
+    cache.set("empty", [])
+    assert cache.get("zero", "default") == 0
+    assert cache.get("empty", "default") == []
+
+
+def test_least_recently_used_is_evicted():
+    cache = TTLCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")  # "b" is now the least recently used
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert len(cache) == 2
+
+
+def test_entries_expire():
+    cache = TTLCache(maxsize=4, ttl=0.05)
+    cache.set("short", 1)
+    cache.set("long", 2, ttl=60)
+    time.sleep(0.1)
+    assert cache.get("short") is None
+    assert cache.get("long") == 2
+    assert len(cache) == 1  # Expired entry dropped on access
+
+
+def test_pop_and_clear():
+    cache = TTLCache(maxsize=4)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.pop("a") == 1
+    assert cache.pop("a", "gone") == "gone"
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_registry_tracks_live_caches():
+    cache = TTLCache(name="test_registry")
+    assert cache in all_caches()
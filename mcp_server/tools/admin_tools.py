@@ -3,12 +3,55 @@ from jose import jwt, JWTError, ExpiredSignatureError
 from datetime import datetime, timedelta
 from typing import Optional, Dict, Any
 import os
+import re
+import json
+import time
+import uuid
+import base64
+import asyncio
+import hashlib
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
 
 # JWT settings
 JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY", "your-secret-key-change-in-production")
 JWT_ALGORITHM = "HS256"
 JWT_EXPIRATION_HOURS = 24
 
+# Verified admin principals keyed by a digest of the signed token, so admin API calls skip the JWT decode and DB lookup.
+# The TTL bounds how long another worker process can keep serving a deactivated admin.
+ADMIN_TOKEN_CACHE_TTL = int(os.getenv("ADMIN_TOKEN_CACHE_TTL", "60"))
+_verified_tokens = TTLCache(maxsize=1024, ttl=ADMIN_TOKEN_CACHE_TTL, name="admin_tokens")
+# admin id -> revocation generation; bumping it invalidates every cached token of that admin
+_admin_generations: Dict[str, int] = {}
+
+# bcrypt costs ~250ms of CPU per call, so logins and admin creation run in a small
+# dedicated pool (bcrypt releases the GIL) with a cap on queued work
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "16"))
+_password_pool = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+_pending_hashes = 0
+
+# Per-email login attempts allowed within the window, checked before any hashing work
+ADMIN_LOGIN_MAX_ATTEMPTS = int(os.getenv("ADMIN_LOGIN_MAX_ATTEMPTS", "5"))
+ADMIN_LOGIN_WINDOW_SECONDS = int(os.getenv("ADMIN_LOGIN_WINDOW_SECONDS", "300"))
+_login_attempts = TTLCache(maxsize=10000, ttl=ADMIN_LOGIN_WINDOW_SECONDS, name="admin_login_attempts")
+
+
+# Approximate file totals per filter combination for the admin listing
+ADMIN_FILES_TOTAL_TTL = int(os.getenv("ADMIN_FILES_TOTAL_TTL", "60"))
+_file_totals = TTLCache(maxsize=256, ttl=ADMIN_FILES_TOTAL_TTL, name="admin_file_totals")
+_CURSOR_TIMESTAMP = re.compile(r'^\d{4}-\d{2}-\d{2}[T ][\d:.]+(Z|[+-]\d{2}(:?\d{2})?)?$')
+
+
+class PasswordHashingBusy(Exception):
+    """Too many password hashing jobs are already queued"""
+
 def hash_password(password: str) -> str:
     """Hash password using bcrypt"""
     salt = bcrypt.gensalt()
@@ -19,6 +62,68 @@ def verify_password(password: str, hashed_password: str) -> bool:
     """Verify password against hash"""
     return bcrypt.checkpw(password.encode('utf-8'), hashed_password.encode('utf-8'))
 
+async def run_password_job(func, *args):
+    """
+    Run a bcrypt-bound function in the password pool
+
+    Raises:
+        PasswordHashingBusy: PASSWORD_HASH_MAX_PENDING jobs are already queued or running
+    """
+    global _pending_hashes
+    if _pending_hashes >= PASSWORD_HASH_MAX_PENDING:
+        raise PasswordHashingBusy()
+    _pending_hashes += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_password_pool, func, *args)
+    finally:
+        _pending_hashes -= 1
+
+def _allow_login_attempt(email: str) -> bool:
+    """Record a login attempt; False once the email exceeds its attempts for the window"""
+    key = email.strip().lower()
+    now = time.monotonic()
+    attempts = _login_attempts.get(key)
+    if attempts is None:
+        attempts = deque()
+    while attempts and attempts[0] <= now - ADMIN_LOGIN_WINDOW_SECONDS:
+        attempts.popleft()
+    if len(attempts) >= ADMIN_LOGIN_MAX_ATTEMPTS:
+        return False
+    attempts.append(now)
+    _login_attempts.set(key, attempts)
+    return True
+
+async def authenticate_admin_async(email: str, password: str) -> Dict[str, Any]:
+    """Authenticate admin user without blocking the event loop (throttled per email)"""
+    if not _allow_login_attempt(email):
+        return {
+            'success': False,
+            'error': 'Too many login attempts. Please try again later.',
+            'throttled': True
+        }
+    try:
+        result = await run_password_job(authenticate_admin, email, password)
+    except PasswordHashingBusy:
+        return {
+            'success': False,
+            'error': 'Login service is busy. Please try again shortly.',
+            'throttled': True
+        }
+    if result['success']:
+        _login_attempts.pop(email.strip().lower())
+    return result
+
+async def create_admin_user_async(email: str, password: str, name: str) -> Dict[str, Any]:
+    """Create a new admin user with the password hashed off the event loop"""
+    try:
+        return await run_password_job(create_admin_user, email, password, name)
+    except PasswordHashingBusy:
+        return {
+            'success': False,
+            'error': 'Service is busy. Please try again shortly.',
+            'throttled': True
+        }
+
 def create_admin_user(email: str, password: str, name: str) -> Dict[str, Any]:
     """Create a new admin user"""
     try:
@@ -107,6 +212,7 @@ def authenticate_admin(email: str, password: str) -> Dict[str, Any]:
         token_data = {
             'admin_id': admin['id'],
             'email': admin['email'],
+            'jti': uuid.uuid4().hex,
             'exp': datetime.utcnow() + timedelta(hours=JWT_EXPIRATION_HOURS)
         }
         
@@ -128,18 +234,31 @@ def authenticate_admin(email: str, password: str) -> Dict[str, Any]:
             'error': str(e)
         }
 
+def _token_key(token: str) -> str:
+    """
+    Cache key for a token: a digest of the whole signed token
+
+    Never derived from (unverified) claims, so a cache hit implies the exact
+    token whose signature was checked on the miss.
+    """
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
 def verify_admin_token(token: str) -> Optional[Dict[str, Any]]:
     """Verify admin JWT token"""
+    key = _token_key(token)
+    cached = _verified_tokens.get(key)
+    if cached is not None:
+        admin = cached['admin']
+        if cached['claims'].get('exp', 0) > time.time() and cached['generation'] == _admin_generations.get(admin['id'], 0):
+            return admin
+        _verified_tokens.pop(key)
+
     try:
         from supabase_client import supabase
         
         if supabase is None:
             return None
         
-        # Debug: Print token info
-        print(f"Verifying token with algorithm: {JWT_ALGORITHM}")
-        print(f"Token (first 20 chars): {token[:20]}...")
-        
         # Decode with explicit options to allow HS256
         payload = jwt.decode(
             token, 
@@ -147,31 +266,38 @@ def verify_admin_token(token: str) -> Optional[Dict[str, Any]]:
             algorithms=[JWT_ALGORITHM],
             options={"verify_signature": True, "verify_exp": True}
         )
-        print(f"Token decoded successfully. Admin ID: {payload.get('admin_id')}")
         admin_id = payload.get('admin_id')
         
         if not admin_id:
             return None
         
+        generation = _admin_generations.get(admin_id, 0)
+        
         # Get admin user from database
         response = supabase.table('admin_users').select('*').eq('id', admin_id).eq('is_active', True).execute()
         
         if response.data:
-            return response.data[0]
+            admin = response.data[0]
+            _verified_tokens.set(key, {'admin': admin, 'claims': payload, 'generation': generation})
+            return admin
         else:
             return None
             
     except ExpiredSignatureError:
         return None
     except JWTError as e:
-        print(f"JWT Error: {e}")
+        logger.warning(f"Rejected admin token: {e}")
         return None
     except Exception as e:
-        print(f"Error verifying admin token: {e}")
+        logger.error(f"Error verifying admin token: {e}")
         return None
 
-def get_all_files(limit: int = 100, offset: int = 0) -> Dict[str, Any]:
-    """Get all files for admin dashboard"""
+def revoke_admin_tokens(admin_id: str):
+    """Drop every cached verification for an admin (takes effect on their next request)"""
+    _admin_generations[admin_id] = _admin_generations.get(admin_id, 0) + 1
+
+def deactivate_admin(admin_id: str) -> Dict[str, Any]:
+    """Deactivate an admin user and revoke their cached tokens"""
     try:
         from supabase_client import supabase
         
@@ -181,14 +307,17 @@ def get_all_files(limit: int = 100, offset: int = 0) -> Dict[str, Any]:
                 'error': 'Supabase client not initialized'
             }
         
-        response = supabase.table('files').select(
-            'id, filename, original_filename, file_size, upload_status, created_at, updated_at, users!inner(name, email)'
-        ).order('created_at', desc=True).range(offset, offset + limit - 1).execute()
+        response = supabase.table('admin_users').update({'is_active': False}).eq('id', admin_id).execute()
+        revoke_admin_tokens(admin_id)
         
+        if not response.data:
+            return {
+                'success': False,
+                'error': 'Admin user not found'
+            }
         return {
             'success': True,
-            'files': response.data if response.data else [],
-            'total': len(response.data) if response.data else 0
+            'admin_id': admin_id
         }
         
     except Exception as e:
@@ -197,8 +326,164 @@ def get_all_files(limit: int = 100, offset: int = 0) -> Dict[str, Any]:
             'error': str(e)
         }
 
-def get_file_details(file_id: str) -> Dict[str, Any]:
-    """Get detailed file information including chunks"""
+def get_token_cache_stats() -> Dict[str, Any]:
+    return _verified_tokens.stats()
+
+def get_password_pool_stats() -> Dict[str, Any]:
+    return {"workers": PASSWORD_HASH_WORKERS, "pending": _pending_hashes, "max_pending": PASSWORD_HASH_MAX_PENDING}
+
+def _encode_cursor(row: Dict[str, Any]) -> str:
+    raw = json.dumps({'created_at': row['created_at'], 'id': row['id']}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+def _decode_cursor(cursor: str) -> Dict[str, str]:
+    padded = cursor + '=' * (-len(cursor) % 4)
+    data = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    # Values are interpolated into a PostgREST filter, so only accept a timestamp and a UUID
+    if not isinstance(data, dict) or not _CURSOR_TIMESTAMP.match(str(data.get('created_at', ''))):
+        raise ValueError('Malformed cursor')
+    data['id'] = str(uuid.UUID(str(data.get('id'))))
+    return data
+
+def _apply_file_filters(query, status: str = None, user_id: str = None, filename_prefix: str = None):
+    if status:
+        query = query.eq('upload_status', status)
+    if user_id:
+        query = query.eq('user_id', user_id)
+    if filename_prefix:
+        escaped = filename_prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        query = query.ilike('original_filename', f"{escaped}%")
+    return query
+
+def _approximate_file_total(status: str = None, user_id: str = None, filename_prefix: str = None) -> int:
+    """Planner-estimated row count for a filter combination, cached briefly"""
+    from supabase_client import supabase
+    
+    key = (status, user_id, (filename_prefix or '').lower())
+    total = _file_totals.get(key)
+    if total is None:
+        query = _apply_file_filters(supabase.table('files').select('id', count='estimated'), status, user_id, filename_prefix)
+        total = query.limit(1).execute().count or 0
+        _file_totals.set(key, total)
+    return total
+
+def get_all_files(
+    limit: int = 100,
+    offset: int = 0,
+    cursor: str = None,
+    status: str = None,
+    user_id: str = None,
+    filename_prefix: str = None
+) -> Dict[str, Any]:
+    """
+    Get files for admin dashboard, newest first
+    
+    Args:
+        limit: Page size
+        offset: Rows to skip (legacy paging; ignored when a cursor is given)
+        cursor: next_cursor from the previous page (keyset on created_at, id)
+        status: Filter by upload_status
+        user_id: Filter by owner (Supabase user UUID)
+        filename_prefix: Case-insensitive prefix of the original filename
+        
+    Returns:
+        Files, approximate total for the filters, and the cursor of the next page
+    """
+    try:
+        from supabase_client import supabase
+        
+        if supabase is None:
+            return {
+                'success': False,
+                'error': 'Supabase client not initialized'
+            }
+        
+        query = supabase.table('files').select(
+            'id, user_id, filename, original_filename, file_size, upload_status, created_at, updated_at, users!inner(name, email)'
+        )
+        query = _apply_file_filters(query, status, user_id, filename_prefix)
+        query = query.order('created_at', desc=True).order('id', desc=True)
+        
+        if cursor:
+            try:
+                position = _decode_cursor(cursor)
+            except Exception:
+                return {
+                    'success': False,
+                    'error': 'Invalid cursor'
+                }
+            created_at, last_id = position['created_at'], position['id']
+            query = query.or_(f'created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt.{last_id})')
+            response = query.limit(limit + 1).execute()
+        else:
+            response = query.range(offset, offset + limit).execute()
+        
+        rows = response.data or []
+        has_more = len(rows) > limit
+        files = rows[:limit]
+        
+        return {
+            'success': True,
+            'files': files,
+            'total': _approximate_file_total(status, user_id, filename_prefix),
+            'total_is_estimate': True,
+            'has_more': has_more,
+            'next_cursor': _encode_cursor(files[-1]) if has_more and files else None
+        }
+        
+    except Exception as e:
+        return {
+            'success': False,
+            'error': str(e)
+        }
+
+FILE_CHUNKS_PAGE_SIZE = 500  # Rows per query when returning every chunk of a file
+
+def _shape_chunk(chunk: Dict[str, Any], content: str, preview_chars: int) -> Dict[str, Any]:
+    """Apply the requested content mode to a chunk row"""
+    text = chunk.pop('content', None)
+    if content == 'full':
+        chunk['content'] = text
+    elif content == 'preview' and text is not None:
+        chunk['content'] = text[:preview_chars]
+        chunk['content_truncated'] = len(text) > preview_chars
+        chunk['content_length'] = len(text)
+    return chunk
+
+def _load_chunks(file_id: str, after_index: int, limit: int, content: str, source: str) -> list:
+    """One page of chunks (limit + 1 rows to detect a next page) from Supabase or Elasticsearch"""
+    if source == 'es':
+        from elasticsearch_client import get_file_chunks_page
+        return get_file_chunks_page(file_id, after_index, limit + 1, include_content=content != 'none')
+    
+    from supabase_client import supabase
+    columns = 'id, file_id, chunk_index, page_number, created_at' + (', content' if content != 'none' else '')
+    response = supabase.table('file_chunks').select(columns).eq('file_id', file_id) \
+        .gt('chunk_index', after_index).order('chunk_index').limit(limit + 1).execute()
+    return response.data or []
+
+def get_file_details(
+    file_id: str,
+    chunk_limit: Optional[int] = None,
+    after_index: int = -1,
+    content: str = 'full',
+    preview_chars: int = 300,
+    source: str = 'db'
+) -> Dict[str, Any]:
+    """
+    Get file information with its chunks, or one page of them
+    
+    Args:
+        file_id: File ID
+        chunk_limit: Chunks per page (None = every chunk)
+        after_index: Return chunks after this chunk_index (next_after_index of the previous page)
+        content: 'none', 'preview' (first preview_chars characters) or 'full'
+        preview_chars: Preview length
+        source: 'db' (Supabase file_chunks) or 'es' (Elasticsearch _source)
+        
+    Returns:
+        File info, chunks, total chunk count and the next page position
+    """
     try:
         from supabase_client import supabase
         
@@ -221,13 +506,59 @@ def get_file_details(file_id: str) -> Dict[str, Any]:
         
         file_info = file_response.data[0]
         
-        # Get file chunks
-        chunks_response = supabase.table('file_chunks').select('*').eq('file_id', file_id).order('chunk_index').execute()
+        # Get one page of file chunks, or all of them in keyset pages
+        page_size = chunk_limit or FILE_CHUNKS_PAGE_SIZE
+        chunks = []
+        position = after_index
+        while True:
+            rows = _load_chunks(file_id, position, page_size, content, source)
+            has_more = len(rows) > page_size
+            chunks.extend(_shape_chunk(row, content, preview_chars) for row in rows[:page_size])
+            if chunk_limit is not None or not has_more:
+                break
+            position = chunks[-1]['chunk_index']
+        
+        total_chunks = None
+        if after_index < 0:
+            count_response = supabase.table('file_chunks').select('id', count='exact').eq('file_id', file_id).limit(1).execute()
+            total_chunks = count_response.count
         
         return {
             'success': True,
             'file': file_info,
-            'chunks': chunks_response.data if chunks_response.data else []
+            'chunks': chunks,
+            'total_chunks': total_chunks,
+            'has_more': has_more,
+            'next_after_index': chunks[-1]['chunk_index'] if has_more and chunks else None
+        }
+        
+    except Exception as e:
+        return {
+            'success': False,
+            'error': str(e)
+        }
+
+def get_file_chunk(file_id: str, chunk_index: int, source: str = 'db') -> Dict[str, Any]:
+    """Get a single chunk of a file, with full content, by its chunk_index"""
+    try:
+        from supabase_client import supabase
+        
+        if supabase is None:
+            return {
+                'success': False,
+                'error': 'Supabase client not initialized'
+            }
+        
+        rows = _load_chunks(file_id, chunk_index - 1, 0, 'full', source)
+        if not rows or rows[0]['chunk_index'] != chunk_index:
+            return {
+                'success': False,
+                'error': 'Chunk not found'
+            }
+        
+        return {
+            'success': True,
+            'chunk': rows[0]
         }
         
     except Exception as e:
@@ -253,10 +584,12 @@ def update_file_status(file_id: str, status: str, error_message: str = None) ->
             update_data['processing_error'] = error_message
         
         supabase.table('files').update(update_data).eq('id', file_id).execute()
+        import system_stats
+        system_stats.mark_stale()  # Previous status unknown here
         return True
         
     except Exception as e:
-        print(f"Error updating file status: {e}")
+        logger.error("Error updating file status: %s", e)
         return False
 
 def delete_file_admin(file_id: str) -> bool:
@@ -274,25 +607,34 @@ def delete_file_admin(file_id: str) -> bool:
         
         file_record = file_response.data[0]
         
+        # Delete chunks from Elasticsearch (while the file_chunks rows still exist)
+        from tools.file_tools import delete_indexed_chunks, invalidate_user_corpus
+        delete_indexed_chunks(file_id, file_record['user_id'])
+        
         # Delete from storage
         try:
             supabase.storage.from_("files").remove([file_record['file_path']])
         except Exception as e:
-            print(f"Warning: Could not delete file from storage: {e}")
+            logger.warning("⚠️  Could not delete file from storage: %s", e)
         
         # Delete file record (cascade will handle chunks and embeddings)
         supabase.table('files').delete().eq('id', file_id).execute()
+        import system_stats
+        system_stats.record_file_deleted(file_record.get('upload_status'))
+        
+        invalidate_user_corpus(file_record['user_id'])
         
         return True
         
     except Exception as e:
-        print(f"Error deleting file: {e}")
+        logger.error("Error deleting file: %s", e)
         return False
 
-def get_system_stats() -> Dict[str, Any]:
-    """Get system statistics for admin dashboard"""
+def get_system_stats(max_staleness: int = None) -> Dict[str, Any]:
+    """Get system statistics for admin dashboard (materialized, see system_stats)"""
     try:
         from supabase_client import supabase
+        import system_stats
         
         if supabase is None:
             return {
@@ -300,30 +642,10 @@ def get_system_stats() -> Dict[str, Any]:
                 'error': 'Supabase client not initialized'
             }
         
-        # Get user count
-        users_response = supabase.table('users').select('id', count='exact').execute()
-        user_count = users_response.count if hasattr(users_response, 'count') else 0
-        
-        # Get file count
-        files_response = supabase.table('files').select('id', count='exact').execute()
-        file_count = files_response.count if hasattr(files_response, 'count') else 0
-        
-        # Get processed files count
-        processed_response = supabase.table('files').select('id', count='exact').eq('upload_status', 'processed').execute()
-        processed_count = processed_response.count if hasattr(processed_response, 'count') else 0
-        
-        # Get message count
-        messages_response = supabase.table('messages').select('id', count='exact').execute()
-        message_count = messages_response.count if hasattr(messages_response, 'count') else 0
-        
+        result = system_stats.get_stats(max_staleness)
         return {
             'success': True,
-            'stats': {
-                'total_users': user_count,
-                'total_files': file_count,
-                'processed_files': processed_count,
-                'total_messages': message_count
-            }
+            **result
         }
         
     except Exception as e:
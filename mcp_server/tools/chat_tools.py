@@ -1,14 +1,54 @@
-from supabase_client import get_or_create_user, get_recent_messages, store_message as supabase_store_message, clear_user_messages
+from datetime import datetime
 
-def get_chat_history(firebase_uid: str, limit: int = None):
+import message_log
+from supabase_client import get_or_create_user, get_recent_messages, iter_messages, store_message as supabase_store_message, clear_user_messages
+
+def _created_at(message: dict):
+    return datetime.fromisoformat(message['created_at'])
+
+def get_chat_history(firebase_uid: str, limit: int = None, before: str = None):
     """
-    Gets the chat history for a given user.
-    If limit is None, fetches all messages.
+    Gets the chat history for a given user, oldest first.
+    If limit is None, fetches all messages (before the `before` cursor, if given).
+    Messages still waiting in the write-behind log are included.
     """
     user = get_or_create_user(firebase_uid)
-    if limit is None:
-        return get_recent_messages(user['id'])
-    return get_recent_messages(user['id'], limit)
+    messages = get_recent_messages(user['id'], limit, before)
+
+    pending = message_log.pending_for(user['id'])
+    if before:
+        pending = [m for m in pending if _created_at(m) < datetime.fromisoformat(before)]
+    if pending:
+        seen = {m['id'] for m in messages}
+        messages.extend(m for m in pending if m['id'] not in seen)
+        messages.sort(key=_created_at)
+        if limit:
+            messages = messages[-limit:]
+    return messages
+
+def iter_chat_history(firebase_uid: str):
+    """
+    Streams the full chat history for a given user, oldest first.
+    Messages still waiting in the write-behind log follow the stored ones.
+    """
+    user = get_or_create_user(firebase_uid)
+    # Taken before streaming: a row flushed meanwhile is then either streamed or still in this list
+    pending = {m['id']: m for m in message_log.pending_for(user['id'])}
+    return _with_pending(iter_messages(user['id']), pending)
+
+def _with_pending(stored, pending: dict):
+    for message in stored:
+        pending.pop(message['id'], None)
+        yield message
+    yield from pending.values()
+
+def store_turn(user_uuid: str, user_message: str, assistant_response: str):
+    """
+    Queues a user message and the assistant's reply for write-behind persistence.
+    Takes the Supabase user UUID, which the caller has already resolved.
+    """
+    message_log.enqueue(user_uuid, "user", user_message)
+    message_log.enqueue(user_uuid, "assistant", assistant_response)
 
 def store_message(firebase_uid: str, role: str, content: str):
     """
@@ -22,4 +62,5 @@ def clear_chat_history(firebase_uid: str):
     Clears all chat history for a given user.
     """
     user = get_or_create_user(firebase_uid)
+    message_log.discard(user['id'])
     return clear_user_messages(user['id'])
@@ -1,6 +1,8 @@
 import os
+import time
 import uuid
 import hashlib
+import math
 from typing import List, Dict, Optional, Any
 from datetime import datetime
 import PyPDF2
@@ -8,17 +10,26 @@ import io
 import json
 import logging
 
+import response_cache
+import corpus_index
+import system_stats
+from metrics import INGEST_STAGE_SECONDS, chat_stage, client_call, ingest_stage
+
 logger = logging.getLogger(__name__)
 
+# Cross-encoder re-ranking of search results (loads an extra ~90MB model)
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "false").lower() == "true"
+
 # Import enhanced embedding functions
 try:
-    from embeddings import generate_embedding, generate_embeddings_batch, rerank_results, EMBEDDING_DIM
+    from embeddings import generate_embedding, generate_embeddings_batch, rerank_results, EMBEDDING_DIM, RERANK_CANDIDATES
     SEMANTIC_EMBEDDINGS_AVAILABLE = True
-    print("✅ Semantic embeddings enabled (Sentence Transformers)")
+    logger.info("✅ Semantic embeddings enabled (Sentence Transformers)")
 except ImportError:
-    print("⚠️  Semantic embeddings not available, using fallback hash-based embeddings")
+    logger.warning("⚠️  Semantic embeddings not available, using fallback hash-based embeddings")
     SEMANTIC_EMBEDDINGS_AVAILABLE = False
-    EMBEDDING_DIM = 384  # Match Sentence Transformers dimension
+    from embedding_models import EMBEDDING_DIM  # Match Sentence Transformers dimension
+    RERANK_CANDIDATES = 20
     
     def generate_embedding(text: str) -> List[float]:
         """Fallback hash-based embedding if Sentence Transformers not available"""
@@ -44,14 +55,14 @@ except ImportError:
             
             return embeddings
         except Exception as e:
-            print(f"Error generating embedding: {e}")
+            logger.error("Error generating embedding: %s", e)
             return [0.0] * EMBEDDING_DIM
     
     def generate_embeddings_batch(texts: List[str], batch_size: int = 32) -> List[List[float]]:
         """Fallback batch embedding"""
         return [generate_embedding(text) for text in texts]
     
-    def rerank_results(query: str, documents: List[str], top_k: Optional[int] = None) -> List[tuple]:
+    def rerank_results(query: str, documents: List[str], top_k: Optional[int] = None, **kwargs) -> List[tuple]:
         """Fallback re-ranking (no-op)"""
         return [(idx, 0.5) for idx in range(len(documents))]
 
@@ -127,10 +138,13 @@ def _chunk_text(text: str, chunk_size: int = 1000, overlap: int = 200, default_p
     """
     Split text into overlapping chunks and return structured chunk dicts.
     """
+    with ingest_stage("chunk"):
+        return _split_text(text or "", chunk_size, overlap, default_page)
+
+def _split_text(text: str, chunk_size: int, overlap: int, default_page: int) -> List[Dict[str, Any]]:
     chunks: List[Dict[str, Any]] = []
     start = 0
     chunk_index = 0
-    text = text or ""
     while start < len(text):
         end = start + chunk_size
         chunk_content = text[start:end]
@@ -178,11 +192,12 @@ def upload_file_to_storage(file_content: bytes, filename: str, user_id: str) ->
         file_extension = os.path.splitext(filename)[1]
         unique_filename = f"{uuid.uuid4()}{file_extension}"
         storage_path = f"uploads/{user_id}/{unique_filename}"
-        response = supabase.storage.from_("files").upload(
-            path=storage_path,
-            file=file_content,
-            file_options={"content-type": mime_type}
-        )
+        with client_call("supabase", "storage_upload"):
+            response = supabase.storage.from_("files").upload(
+                path=storage_path,
+                file=file_content,
+                file_options={"content-type": mime_type}
+            )
         if hasattr(response, 'status_code') and response.status_code != 200:
             raise Exception(f"Storage upload failed with status {response.status_code}")
         return storage_path
@@ -208,6 +223,7 @@ def create_file_record(user_id: str, filename: str, file_size: int, file_path: s
         }
         response = supabase.table('files').insert(file_data).execute()
         if response.data:
+            system_stats.increment("total_files")
             return response.data[0]
         else:
             raise Exception("Failed to create file record")
@@ -224,6 +240,8 @@ def process_file_chunks(file_id: str, chunks: List[Dict[str, Any]], user_id: str
             raise Exception("Supabase client not initialized")
         
         chunk_records: List[Dict[str, Any]] = []
+        embed_seconds = 0.0
+        index_seconds = 0.0
         
         for chunk in chunks:
             # Ensure chunk is a dict
@@ -241,7 +259,8 @@ def process_file_chunks(file_id: str, chunks: List[Dict[str, Any]], user_id: str
                 'content': chunk.get('content', ''),
                 'page_number': chunk.get('page_number')
             }
-            chunk_response = supabase.table('file_chunks').insert(chunk_data).execute()
+            with client_call("supabase", "insert_chunk"):
+                chunk_response = supabase.table('file_chunks').insert(chunk_data).execute()
             
             if not chunk_response.data:
                 continue
@@ -250,9 +269,12 @@ def process_file_chunks(file_id: str, chunks: List[Dict[str, Any]], user_id: str
             chunk_records.append(chunk_record)
             
             # Generate embedding
+            started = time.perf_counter()
             embedding = generate_embedding(chunk_data['content'])
+            embed_seconds += time.perf_counter() - started
             
             # Store embedding in Elasticsearch instead of Supabase
+            started = time.perf_counter()
             try:
                 index_document_chunk(
                     chunk_id=chunk_record['id'],
@@ -264,11 +286,15 @@ def process_file_chunks(file_id: str, chunks: List[Dict[str, Any]], user_id: str
                     page_number=chunk_data.get('page_number'),
                     filename=filename
                 )
-                logger.info(f"✅ Indexed chunk {chunk_record['id']} in Elasticsearch")
+                logger.debug("Indexed chunk %s in Elasticsearch", chunk_record['id'])
             except Exception as es_error:
                 logger.error(f"Failed to index chunk in Elasticsearch: {es_error}")
                 # Continue processing other chunks even if one fails
+            index_seconds += time.perf_counter() - started
         
+        # Observed per file, like the other ingestion stages
+        INGEST_STAGE_SECONDS.labels("embed").observe(embed_seconds)
+        INGEST_STAGE_SECONDS.labels("index").observe(index_seconds)
         return chunk_records
     except Exception as e:
         raise Exception(f"Failed to process file chunks: {str(e)}")
@@ -283,7 +309,8 @@ def upload_pdf_file(user_id: str, filename: str, file_content: bytes) -> Dict[st
         user_record = get_or_create_user(user_id)
         user_uuid = user_record['id']
         
-        extracted_data = extract_text_from_file(file_content, filename)
+        with ingest_stage("extract"):  # Includes the chunk stage
+            extracted_data = extract_text_from_file(file_content, filename)
         content_type = extracted_data.get('mime_type', 'application/octet-stream')
         
         file_path = upload_file_to_storage(file_content, filename, user_uuid)
@@ -308,6 +335,9 @@ def upload_pdf_file(user_id: str, filename: str, file_content: bytes) -> Dict[st
             }).eq('id', file_record['id']).execute()
             
             logger.info(f"✅ File processed: {len(chunk_records)} chunks indexed in Elasticsearch")
+            system_stats.record_file_status('processing', 'processed')
+            corpus_index.add_chunks(user_uuid, len(chunk_records))
+            invalidate_user_corpus(user_uuid)
             
             return {
                 'success': True,
@@ -323,6 +353,9 @@ def upload_pdf_file(user_id: str, filename: str, file_content: bytes) -> Dict[st
                 'processing_error': str(processing_error),
                 'updated_at': datetime.now().isoformat()
             }).eq('id', file_record['id']).execute()
+            # Some chunks may have been indexed before the failure
+            corpus_index.mark_unknown(user_uuid)
+            invalidate_user_corpus(user_uuid)
             raise processing_error
     except Exception as e:
         logger.error(f"Error uploading file: {e}")
@@ -337,7 +370,7 @@ def get_user_files(user_id: str, limit: int = 50) -> List[Dict[str, Any]]:
         from supabase_client import supabase, get_or_create_user
         
         if supabase is None:
-            print("Supabase client not initialized")
+            logger.error("Supabase client not initialized")
             return []
         
         # Get or create user and get their UUID
@@ -347,35 +380,87 @@ def get_user_files(user_id: str, limit: int = 50) -> List[Dict[str, Any]]:
         response = supabase.table('files').select('*').eq('user_id', user_uuid).order('created_at', desc=True).limit(limit).execute()
         return response.data if response.data else []
     except Exception as e:
-        print(f"Error fetching user files: {e}")
+        logger.error("Error fetching user files: %s", e)
         return []
 
+def invalidate_user_corpus(user_uuid: str):
+    """Reset per-user caches derived from the user's files; call after any upload or delete"""
+    response_cache.invalidate_user(user_uuid)
+
 def get_file_by_id(file_id: str) -> Optional[Dict[str, Any]]:
     """Get file by ID"""
     try:
         from supabase_client import supabase
         
         if supabase is None:
-            print("Supabase client not initialized")
+            logger.error("Supabase client not initialized")
             return None
         
         response = supabase.table('files').select('*').eq('id', file_id).execute()
         return response.data[0] if response.data else None
     except Exception as e:
-        print(f"Error fetching file: {e}")
+        logger.error("Error fetching file: %s", e)
         return None
 
-def search_similar_chunks(query: str, user_id: str, limit: int = 5, use_reranking: bool = False) -> List[Dict[str, Any]]:
+def _rerank_stage(query: str, results: List[Dict[str, Any]], limit: int) -> List[Dict[str, Any]]:
+    """
+    Re-order first-stage hits with the cross-encoder, within its latency budget
+    
+    Only the top RERANK_CANDIDATES hits are scored. Re-ranked hits get the
+    cross-encoder logit as 'rerank_score' and its sigmoid as 'similarity_score'.
+    Hits beyond the candidates, or left unscored when the budget ran out, keep
+    their first-stage order after them with a 'similarity_score' of None,
+    because an Elasticsearch score cannot be compared with a cross-encoder
+    score. The Elasticsearch score of every hit stays in 'original_similarity'.
+    """
+    try:
+        candidates = results[:RERANK_CANDIDATES]
+        with chat_stage("rerank"):
+            ranked_indices = rerank_results(
+                query,
+                [r['content'] for r in candidates],
+                doc_ids=[r['id'] for r in candidates]
+            )
+        ranked_indices += [(idx, None) for idx in range(len(candidates), len(results))]
+        
+        reranked_results = []
+        for idx, rerank_score in ranked_indices[:limit]:
+            result = results[idx].copy()
+            result['original_similarity'] = result['similarity_score']
+            if rerank_score is not None:
+                result['rerank_score'] = rerank_score
+                result['similarity_score'] = 1.0 / (1.0 + math.exp(-max(min(rerank_score, 50.0), -50.0)))
+            else:
+                result['similarity_score'] = None  # Sorts below every re-ranked hit
+            reranked_results.append(result)
+        
+        logger.debug("Re-ranked %d of %d results, returning %d", len(candidates), len(results), len(reranked_results))
+        return reranked_results
+        
+    except Exception as rerank_error:
+        logger.warning(f"⚠️  Re-ranking failed, using Elasticsearch scores: {rerank_error}")
+        return results[:limit]
+
+def search_similar_chunks(
+    query: str,
+    user_id: str,
+    limit: int = 5,
+    use_reranking: Optional[bool] = None,
+    query_vector: Optional[List[float]] = None,
+    include_embeddings: bool = False
+) -> List[Dict[str, Any]]:
     """
     Search for similar file chunks using Elasticsearch vector similarity with optional re-ranking
     
-    Note: Re-ranking is disabled by default to save memory on free hosting tiers.
+    Note: Re-ranking defaults to RERANK_ENABLED (off unless configured) to save memory on free hosting tiers.
     
     Args:
         query: Search query
         user_id: Firebase user ID
         limit: Number of results to return
-        use_reranking: Whether to use cross-encoder re-ranking for better results
+        use_reranking: Whether to use cross-encoder re-ranking (None = RERANK_ENABLED)
+        query_vector: Precomputed query embedding (computed here if omitted)
+        include_embeddings: Return chunk embeddings (used by context packing)
         
     Returns:
         List of matching chunks with similarity scores
@@ -384,15 +469,24 @@ def search_similar_chunks(query: str, user_id: str, limit: int = 5, use_rerankin
         from supabase_client import get_or_create_user
         from elasticsearch_client import search_similar_chunks as es_search
         
+        if use_reranking is None:
+            use_reranking = RERANK_ENABLED
+        use_reranking = use_reranking and SEMANTIC_EMBEDDINGS_AVAILABLE
+        
         # Map Firebase UID to UUID
         user_record = get_or_create_user(user_id)
         user_uuid = user_record['id']
         
+        # Nothing indexed for this user: skip inference and the ES round-trip
+        if corpus_index.is_empty(user_uuid):
+            return []
+        
         # Generate query embedding using semantic embeddings
-        query_vector = generate_embedding(query)
+        if query_vector is None:
+            query_vector = generate_embedding(query)
         
         # Retrieve more candidates for re-ranking (if enabled)
-        initial_limit = limit * 3 if use_reranking and SEMANTIC_EMBEDDINGS_AVAILABLE else limit
+        initial_limit = max(limit, RERANK_CANDIDATES) if use_reranking else limit
         
         # Search using Elasticsearch with hybrid search (vector + keyword)
         try:
@@ -402,36 +496,16 @@ def search_similar_chunks(query: str, user_id: str, limit: int = 5, use_rerankin
                 k=initial_limit,
                 num_candidates=initial_limit * 2,
                 use_hybrid=True,
-                query_text=query
+                query_text=query,
+                include_embeddings=include_embeddings
             )
             
             if results:
-                logger.info(f"✅ Elasticsearch returned {len(results)} results")
+                logger.debug("Elasticsearch returned %d results", len(results))
                 
                 # Apply re-ranking if enabled and available
-                if use_reranking and SEMANTIC_EMBEDDINGS_AVAILABLE and len(results) > 1:
-                    try:
-                        # Extract documents for re-ranking
-                        documents = [r['content'] for r in results]
-                        
-                        # Re-rank using cross-encoder
-                        ranked_indices = rerank_results(query, documents, top_k=limit)
-                        
-                        # Reorder results based on re-ranking scores
-                        reranked_results = []
-                        for idx, rerank_score in ranked_indices:
-                            result = results[idx].copy()
-                            result['rerank_score'] = rerank_score
-                            result['original_similarity'] = result['similarity_score']
-                            result['similarity_score'] = rerank_score  # Use rerank score as primary
-                            reranked_results.append(result)
-                        
-                        logger.info(f"✅ Re-ranked {len(results)} results to top {len(reranked_results)}")
-                        return reranked_results
-                        
-                    except Exception as rerank_error:
-                        logger.warning(f"⚠️  Re-ranking failed, using Elasticsearch scores: {rerank_error}")
-                        return results[:limit]
+                if use_reranking and len(results) > 1:
+                    return _rerank_stage(query, results, limit)
                 
                 return results[:limit]
             else:
@@ -446,11 +520,40 @@ def search_similar_chunks(query: str, user_id: str, limit: int = 5, use_rerankin
         logger.error(f"Error searching similar chunks: {e}")
         return []
 
+def delete_indexed_chunks(file_id: str, user_uuid: str) -> Optional[Dict[str, Any]]:
+    """
+    Delete a file's chunks from Elasticsearch and update the corpus index
+    Failures are logged and left for the orphan sweeper to reconcile
+    
+    Args:
+        file_id: File ID (its file_chunks rows must still exist)
+        user_uuid: Owner's Supabase user UUID
+        
+    Returns:
+        delete_file_chunks result, or None if the delete failed
+    """
+    try:
+        from supabase_client import supabase
+        from elasticsearch_client import delete_file_chunks
+        
+        chunks_response = supabase.table('file_chunks').select('id').eq('file_id', file_id).execute()
+        chunk_ids = [c['id'] for c in chunks_response.data or []]
+        result = delete_file_chunks(file_id, chunk_ids=chunk_ids)
+        if 'deleted' in result:
+            corpus_index.remove_chunks(user_uuid, len(chunk_ids))
+        else:
+            corpus_index.mark_unknown(user_uuid)
+        logger.info(f"✅ Deleted chunks from Elasticsearch for file {file_id}: {result}")
+        return result
+    except Exception as e:
+        corpus_index.mark_unknown(user_uuid)
+        logger.warning(f"Could not delete chunks from Elasticsearch for file {file_id} (left for the orphan sweeper): {e}")
+        return None
+
 def delete_file(file_id: str, user_id: str) -> bool:
     """Delete file and all related data from Supabase and Elasticsearch"""
     try:
         from supabase_client import supabase, get_or_create_user
-        from elasticsearch_client import delete_file_chunks
         
         if supabase is None:
             logger.error("Supabase client not initialized")
@@ -465,12 +568,8 @@ def delete_file(file_id: str, user_id: str) -> bool:
         if not file_record or file_record['user_id'] != user_uuid:
             return False
         
-        # Delete from Elasticsearch first
-        try:
-            delete_file_chunks(file_id)
-            logger.info(f"✅ Deleted chunks from Elasticsearch for file {file_id}")
-        except Exception as e:
-            logger.warning(f"Could not delete chunks from Elasticsearch: {e}")
+        # Delete from Elasticsearch first (by known chunk ids when available)
+        delete_indexed_chunks(file_id, user_uuid)
         
         # Delete from storage
         try:
@@ -480,6 +579,8 @@ def delete_file(file_id: str, user_id: str) -> bool:
         
         # Delete file record (cascade will handle chunks in Supabase)
         supabase.table('files').delete().eq('id', file_id).execute()
+        system_stats.record_file_deleted(file_record.get('upload_status'))
+        invalidate_user_corpus(user_uuid)
         
         logger.info(f"✅ Deleted file {file_id} completely")
         return True
@@ -1,12 +1,21 @@
 import os
 import re
 import json
+import logging
 from typing import Dict, List, Optional, Any
 
+import response_cache
+from site_index import FileIndex, SITE_WATCH_ENABLED
+
+logger = logging.getLogger(__name__)
+
 _site_facts: Dict[str, str] = {}
 _structural_awareness: Dict[str, Any] = {}
 _functional_awareness: Dict[str, Any] = {}
 
+# Rendered UI context ({"text": str, "tokens": int}); rebuilt only when the site index changes
+_ui_context: Optional[Dict[str, Any]] = None
+
 FRONTEND_ROOT_RELATIVE = os.path.join('..', '..', 'NovaFuze_web')
 
 CONTACT_FILE_CANDIDATES = [
@@ -42,212 +51,130 @@ ROUTE_PATTERN = re.compile(r'case\s+["\']([^"\']+)["\']', re.IGNORECASE)
 COMPONENT_PATTERN = re.compile(r'return\s+<(\w+)', re.IGNORECASE)
 BUTTON_PATTERN = re.compile(r'<Button[^>]*onClick[^>]*>([^<]+)</Button>', re.IGNORECASE)
 LINK_PATTERN = re.compile(r'href=["\']([^"\']+)["\']', re.IGNORECASE)
+API_CALL_PATTERN = re.compile(r'api\.(get|post|put|delete|patch)\(["\']([^"\']+)["\']', re.IGNORECASE)
+PROPS_PATTERN = re.compile(r'interface\s+(\w+)Props[^{]*{([^}]+)}', re.DOTALL)
 
+# Index keys use '/' separators
+_CONTACT_FILES = {rel.replace(os.sep, '/') for rel in CONTACT_FILE_CANDIDATES}
+SERVICES_FILE = 'src/components/ServicesSection.tsx'
+HERO_FILE = 'src/components/HeroSection.tsx'
+ROUTER_FILE = 'src/components/Router.tsx'
 
-def _read_file_if_exists(path: str) -> Optional[str]:
-    try:
-        with open(path, 'r', encoding='utf-8', errors='ignore') as f:
-            return f.read()
-    except Exception:
-        return None
+_index: Optional[FileIndex] = None
 
 
-def _scan_directory_for_components(dir_path: str) -> List[Dict[str, str]]:
-    """Scan directory for React components and extract their functionality."""
-    components = []
-    if not os.path.exists(dir_path):
-        return components
-    
-    for root, dirs, files in os.walk(dir_path):
-        for file in files:
-            if file.endswith(('.tsx', '.ts', '.jsx', '.js')):
-                file_path = os.path.join(root, file)
-                content = _read_file_if_exists(file_path)
-                if not content:
-                    continue
-                
-                # Extract component name
-                component_name = file.replace('.tsx', '').replace('.ts', '').replace('.jsx', '').replace('.js', '')
-                
-                # Extract functionality
-                buttons = BUTTON_PATTERN.findall(content)
-                links = LINK_PATTERN.findall(content)
-                
-                # Extract props/state
-                props_match = re.search(r'interface\s+(\w+)Props[^{]*{([^}]+)}', content, re.DOTALL)
-                props = []
-                if props_match:
-                    props = [line.strip() for line in props_match.group(2).split('\n') if line.strip() and ':' in line]
-                
-                components.append({
-                    'name': component_name,
-                    'file': file_path,
-                    'buttons': buttons,
-                    'links': links,
-                    'props': props[:5]  # Limit to first 5 props
-                })
-    
-    return components
+def _default_root() -> str:
+    return os.path.abspath(os.path.join(os.path.dirname(__file__), FRONTEND_ROOT_RELATIVE))
 
 
-def load_structural_awareness(project_root: Optional[str] = None) -> Dict[str, Any]:
-    """Extract structural information: pages, routes, layout."""
-    global _structural_awareness
-    _structural_awareness = {}
-    
-    root = project_root or os.path.abspath(os.path.join(os.path.dirname(__file__), FRONTEND_ROOT_RELATIVE))
-    
-    pages = []
-    routes = []
-    
-    # Scan Router.tsx for routes
-    router_path = os.path.join(root, 'src', 'components', 'Router.tsx')
-    router_content = _read_file_if_exists(router_path)
-    if router_content:
-        # Extract route cases
-        route_matches = ROUTE_PATTERN.findall(router_content)
-        routes = list(set(route_matches))
-        
-        # Extract page components
-        component_matches = COMPONENT_PATTERN.findall(router_content)
-        pages = list(set(component_matches))
-    
-    # Scan pages directory
-    pages_dir = os.path.join(root, 'src', 'pages')
-    if os.path.exists(pages_dir):
-        for file in os.listdir(pages_dir):
-            if file.endswith(('.tsx', '.ts')):
-                page_name = file.replace('.tsx', '').replace('.ts', '')
-                pages.append(page_name)
-    
-    _structural_awareness = {
-        'routes': routes,
-        'pages': pages,
-        'layout': {
-            'has_header': 'Header' in (router_content or ''),
-            'has_footer': 'Footer' in (router_content or ''),
-            'has_sidebar': 'Sidebar' in (router_content or ''),
-            'has_navigation': 'Navigation' in (router_content or '')
+def _strip_extension(filename: str) -> str:
+    return filename.replace('.tsx', '').replace('.ts', '').replace('.jsx', '').replace('.js', '')
+
+
+def _parse_source_file(rel: str, content: str) -> Dict[str, Any]:
+    """Extract everything the awareness needs from one file (cached per file by the index)."""
+    data: Dict[str, Any] = {}
+    directory, filename = os.path.split(rel)
+
+    if rel in _CONTACT_FILES:
+        data['emails'] = EMAIL_REGEX.findall(content)
+        data['phones'] = PHONE_REGEX.findall(content)
+        data['links'] = URL_REGEX.findall(content)
+
+    if rel == ROUTER_FILE:
+        data['routes'] = ROUTE_PATTERN.findall(content)
+        data['page_components'] = COMPONENT_PATTERN.findall(content)
+        data['layout'] = {
+            'has_header': 'Header' in content,
+            'has_footer': 'Footer' in content,
+            'has_sidebar': 'Sidebar' in content,
+            'has_navigation': 'Navigation' in content
         }
-    }
-    
-    return _structural_awareness
 
+    if directory == 'src/pages' and filename.endswith(('.tsx', '.ts')):
+        data['page'] = _strip_extension(filename)
+
+    if rel.startswith(('src/components/', 'src/pages/')) and filename.endswith(('.tsx', '.ts', '.jsx', '.js')):
+        props = []
+        props_match = PROPS_PATTERN.search(content)
+        if props_match:
+            props = [line.strip() for line in props_match.group(2).split('\n') if line.strip() and ':' in line]
+        data['component'] = {
+            'name': _strip_extension(filename),
+            'buttons': BUTTON_PATTERN.findall(content),
+            'links': LINK_PATTERN.findall(content),
+            'props': props[:5]  # Limit to first 5 props
+        }
 
-def load_functional_awareness(project_root: Optional[str] = None) -> Dict[str, Any]:
-    """Extract functional information: components, actions, APIs."""
-    global _functional_awareness
-    _functional_awareness = {}
-    
-    root = project_root or os.path.abspath(os.path.join(os.path.dirname(__file__), FRONTEND_ROOT_RELATIVE))
-    
-    components = []
-    apis = []
-    services_info = []
-    company_info = []
-    
-    # Scan components directory
-    components_dir = os.path.join(root, 'src', 'components')
-    if os.path.exists(components_dir):
-        components.extend(_scan_directory_for_components(components_dir))
-    
-    # Scan pages directory
-    pages_dir = os.path.join(root, 'src', 'pages')
-    if os.path.exists(pages_dir):
-        components.extend(_scan_directory_for_components(pages_dir))
-    
-    # Scan services for API endpoints
-    services_dir = os.path.join(root, 'src', 'services')
-    if os.path.exists(services_dir):
-        for file in os.listdir(services_dir):
-            if file.endswith(('.ts', '.js')):
-                file_path = os.path.join(services_dir, file)
-                content = _read_file_if_exists(file_path)
-                if content:
-                    # Extract API calls
-                    api_matches = re.findall(r'api\.(get|post|put|delete|patch)\(["\']([^"\']+)["\']', content, re.IGNORECASE)
-                    for method, endpoint in api_matches:
-                        apis.append(f"{method.upper()} {endpoint}")
-    
-    # Extract services information from ServicesSection
-    services_file = os.path.join(root, 'src', 'components', 'ServicesSection.tsx')
-    services_content = _read_file_if_exists(services_file)
-    if services_content:
+    if directory == 'src/services' and filename.endswith(('.ts', '.js')):
+        data['apis'] = [f"{method.upper()} {endpoint}" for method, endpoint in API_CALL_PATTERN.findall(content)]
+
+    if rel == SERVICES_FILE:
         # Extract service titles and descriptions
-        service_matches = re.findall(r'title:\s*["\']([^"\']+)["\']', services_content)
-        desc_matches = re.findall(r'description:\s*["\']([^"\']+)["\']', services_content)
-        price_matches = re.findall(r'price:\s*["\']([^"\']+)["\']', services_content)
-        
-        for i, title in enumerate(service_matches):
+        titles = re.findall(r'title:\s*["\']([^"\']+)["\']', content)
+        descriptions = re.findall(r'description:\s*["\']([^"\']+)["\']', content)
+        prices = re.findall(r'price:\s*["\']([^"\']+)["\']', content)
+        services = []
+        for i, title in enumerate(titles):
             service_info = {'title': title}
-            if i < len(desc_matches):
-                service_info['description'] = desc_matches[i]
-            if i < len(price_matches):
-                service_info['price'] = price_matches[i]
-            services_info.append(service_info)
-    
-    # Extract company information from HeroSection
-    hero_file = os.path.join(root, 'src', 'components', 'HeroSection.tsx')
-    hero_content = _read_file_if_exists(hero_file)
-    if hero_content:
-        # Extract headline, description, stats
-        headline_match = re.search(r'headline:\s*["\']([^"\']+)["\']', hero_content)
-        desc_match = re.search(r'description:\s*["\']([^"\']+)["\']', hero_content)
-        
+            if i < len(descriptions):
+                service_info['description'] = descriptions[i]
+            if i < len(prices):
+                service_info['price'] = prices[i]
+            services.append(service_info)
+        data['services'] = services
+
+    if rel == HERO_FILE:
+        company_info = []
+        headline_match = re.search(r'headline:\s*["\']([^"\']+)["\']', content)
+        desc_match = re.search(r'description:\s*["\']([^"\']+)["\']', content)
         if headline_match:
             company_info.append(f"Headline: {headline_match.group(1)}")
         if desc_match:
             company_info.append(f"Description: {desc_match.group(1)}")
-    
-    _functional_awareness = {
-        'components': components[:20],  # Limit to first 20 components
-        'apis': list(set(apis)),
-        'services': services_info,
-        'company_info': company_info,
-        'features': {
-            'authentication': 'useAuth' in str(components),
-            'file_upload': 'FileUpload' in str(components),
-            'admin_panel': 'AdminPage' in str(components),
-            'chat': 'chat' in str(components).lower()
-        }
-    }
-    
-    return _functional_awareness
-
-
-def load_site_facts(project_root: Optional[str] = None) -> Dict[str, str]:
-    """Scan selected frontend files to extract email, phone, and links."""
-    global _site_facts
-    _site_facts = {}
+        data['company_info'] = company_info
+
+    return data
+
+
+def _get_index(project_root: Optional[str] = None) -> FileIndex:
+    global _index
+    root = project_root or _default_root()
+    if _index is None or _index.root != root:
+        if _index is not None:
+            _index.stop_watching()
+        _index = FileIndex(
+            root,
+            directories=[os.path.join('src', 'components'), os.path.join('src', 'pages'), os.path.join('src', 'services')],
+            files=CONTACT_FILE_CANDIDATES,
+            parse=_parse_source_file
+        )
+    return _index
+
+
+def _unique(seq: List[str]) -> List[str]:
+    seen = set()
+    out = []
+    for x in seq:
+        x_norm = x.strip()
+        if not x_norm:
+            continue
+        if x_norm in seen:
+            continue
+        seen.add(x_norm)
+        out.append(x_norm)
+    return out
 
-    root = project_root or os.path.abspath(os.path.join(os.path.dirname(__file__), FRONTEND_ROOT_RELATIVE))
 
+def _build_site_facts(records: Dict[str, Dict[str, Any]]) -> Dict[str, str]:
     emails: List[str] = []
     phones: List[str] = []
     links: List[str] = []
-
     for rel in CONTACT_FILE_CANDIDATES:
-        abs_path = os.path.join(root, rel)
-        content = _read_file_if_exists(abs_path)
-        if not content:
-            continue
-        emails.extend(EMAIL_REGEX.findall(content))
-        phones.extend(PHONE_REGEX.findall(content))
-        links.extend(URL_REGEX.findall(content))
-
-    # Normalize & dedupe
-    def _unique(seq: List[str]) -> List[str]:
-        seen = set()
-        out = []
-        for x in seq:
-            x_norm = x.strip()
-            if not x_norm:
-                continue
-            if x_norm in seen:
-                continue
-            seen.add(x_norm)
-            out.append(x_norm)
-        return out
+        data = records.get(rel.replace(os.sep, '/'), {})
+        emails.extend(data.get('emails', []))
+        phones.extend(data.get('phones', []))
+        links.extend(data.get('links', []))
 
     emails = _unique(emails)
     phones = _unique(phones)
@@ -256,14 +183,114 @@ def load_site_facts(project_root: Optional[str] = None) -> Dict[str, str]:
     # Keep only plausible phone numbers (>= 7 digits)
     phones = [p for p in phones if sum(c.isdigit() for c in p) >= 7]
 
-    _site_facts = {
+    return {
         'emails': ", ".join(emails) if emails else "",
         'phones': ", ".join(phones) if phones else "",
         'links': ", ".join(links) if links else "",
     }
+
+
+def _build_structural_awareness(records: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    router = records.get(ROUTER_FILE, {})
+    pages = sorted(set(router.get('page_components', [])))
+    pages.extend(data['page'] for data in records.values() if 'page' in data)
+    return {
+        'routes': sorted(set(router.get('routes', []))),
+        'pages': pages,
+        'layout': router.get('layout') or {
+            'has_header': False,
+            'has_footer': False,
+            'has_sidebar': False,
+            'has_navigation': False
+        }
+    }
+
+
+def _build_functional_awareness(root: str, records: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    # Components first, then pages (records are in path order)
+    components = [
+        {**data['component'], 'file': os.path.join(root, rel)}
+        for prefix in ('src/components/', 'src/pages/')
+        for rel, data in records.items()
+        if rel.startswith(prefix) and 'component' in data
+    ]
+    apis = {api for data in records.values() for api in data.get('apis', [])}
+    components_text = str(components)
+
+    return {
+        'components': components[:20],  # Limit to first 20 components
+        'apis': sorted(apis),
+        'services': records.get(SERVICES_FILE, {}).get('services', []),
+        'company_info': records.get(HERO_FILE, {}).get('company_info', []),
+        'features': {
+            'authentication': 'useAuth' in components_text,
+            'file_upload': 'FileUpload' in components_text,
+            'admin_panel': 'AdminPage' in components_text,
+            'chat': 'chat' in components_text.lower()
+        }
+    }
+
+
+def _rebuild_awareness(index: FileIndex):
+    """Aggregate per-file results and swap in the new awareness and rendered context."""
+    global _site_facts, _structural_awareness, _functional_awareness, _ui_context
+    records = dict(index.items())
+    site_facts = _build_site_facts(records)
+    structural = _build_structural_awareness(records)
+    functional = _build_functional_awareness(index.root, records)
+    ui_context = _render_ui_context(structural, functional, site_facts)
+
+    _site_facts, _structural_awareness, _functional_awareness = site_facts, structural, functional
+    _ui_context = ui_context
+    response_cache.invalidate_all()  # Cached answers were generated with the old site context
+
+
+def _refresh(project_root: Optional[str] = None):
+    index = _get_index(project_root)
+    if index.refresh() or _ui_context is None:
+        _rebuild_awareness(index)
+    logger.info(f"Site index: {index.stats['parsed']} files parsed, {index.stats['reused']} reused from cache")
+
+
+def load_structural_awareness(project_root: Optional[str] = None) -> Dict[str, Any]:
+    """Extract structural information: pages, routes, layout."""
+    _refresh(project_root)
+    return _structural_awareness
+
+
+def load_functional_awareness(project_root: Optional[str] = None) -> Dict[str, Any]:
+    """Extract functional information: components, actions, APIs."""
+    _refresh(project_root)
+    return _functional_awareness
+
+
+def load_site_facts(project_root: Optional[str] = None) -> Dict[str, str]:
+    """Scan selected frontend files to extract email, phone, and links."""
+    _refresh(project_root)
     return _site_facts
 
 
+def start_watching(project_root: Optional[str] = None):
+    """Re-index changed frontend files in the background and re-render the UI context."""
+    if not SITE_WATCH_ENABLED:
+        return
+    index = _get_index(project_root)
+    if not os.path.isdir(index.root):
+        logger.warning(f"Frontend root {index.root} not found; site awareness will not be watched")
+        return
+
+    def on_frontend_change():
+        _rebuild_awareness(index)
+        logger.info("Site awareness reloaded after frontend change")
+
+    index.start_watching(on_frontend_change)
+
+
+def stop_watching():
+    if _index is not None:
+        _index.stop_watching()
+
+
 def get_site_facts() -> Dict[str, str]:
     return _site_facts.copy() if _site_facts else {}
 
@@ -276,12 +303,30 @@ def get_functional_awareness() -> Dict[str, Any]:
     return _functional_awareness.copy() if _functional_awareness else {}
 
 
+def load_ui_awareness(project_root: Optional[str] = None) -> Dict[str, Any]:
+    """Refresh the site index and return the rendered UI context."""
+    _refresh(project_root)
+    return _ui_context
+
+
 def get_ui_context() -> str:
-    """Get combined UI context for the AI."""
-    structural = get_structural_awareness()
-    functional = get_functional_awareness()
-    facts = get_site_facts()
-    
+    """Get combined UI context for the AI (rendered once per reload)."""
+    return _ui_context['text'] if _ui_context else ""
+
+
+def get_ui_context_tokens() -> int:
+    """Estimated token count of the UI context."""
+    return _ui_context['tokens'] if _ui_context else 0
+
+
+def _render_ui_context(structural: Dict[str, Any], functional: Dict[str, Any], facts: Dict[str, str]) -> Dict[str, Any]:
+    from context_packing import estimate_tokens
+
+    text = _build_ui_context_text(structural, functional, facts)
+    return {'text': text, 'tokens': estimate_tokens(text)}
+
+
+def _build_ui_context_text(structural: Dict[str, Any], functional: Dict[str, Any], facts: Dict[str, str]) -> str:
     context_parts = []
     
     # Company information